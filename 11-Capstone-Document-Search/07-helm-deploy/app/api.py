@@ -0,0 +1,310 @@
+"""
+Headless HTTP API for the License Renewal Document Processor.
+
+Upstream systems submit PDFs without driving the Streamlit UI:
+
+- ``POST /jobs``                  a PDF as the raw request body (name it
+  with ``?filename=``) or ``multipart/form-data`` with one or more file
+  fields; ``202`` with one queued job per PDF. ``?schema=`` picks the
+  field schema (see ``schemas``) for the upload.
+- ``GET /jobs/{id}``              job status.
+- ``GET /jobs/{id}/result``       the extracted record and usage as JSON
+  (``409`` while the job is still queued or running).
+- ``GET /jobs/{id}/result.xlsx``  the record as an Excel workbook.
+- ``DELETE /jobs/{id}``           cancel the job.
+
+Jobs go on the shared job queue (``jobqueue``). ``API_WORKERS`` threads in
+this process claim and process them exactly as ``worker.py`` does, so at
+most that many batches run at once; with ``API_WORKERS=0`` the API only
+queues and the worker tier does the processing. Submissions get ``429``
+once ``API_MAX_QUEUED`` jobs are waiting, and need ``Authorization:
+Bearer <API_TOKEN>`` when ``API_TOKEN`` is set.
+
+    python app/api.py
+"""
+import email.policy
+import hmac
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import unicodedata
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+from dotenv import load_dotenv
+
+# Before the imports below: they read their settings from the environment.
+load_dotenv()
+
+import jobqueue  # noqa: E402
+import metrics  # noqa: E402
+import schemas  # noqa: E402
+import status_server  # noqa: E402
+import warmup  # noqa: E402
+import worker  # noqa: E402
+from export import XLSX_MIME, records_to_xlsx  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))
+API_MAX_QUEUED = int(os.getenv("API_MAX_QUEUED", "100"))
+API_MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+API_TOKEN = os.getenv("API_TOKEN", "")
+
+_JOB_PATH_RE = re.compile(r"^/jobs/([0-9a-f]{32})(/result(\.json|\.xlsx)?)?$")
+# Characters kept in stored filenames; anything else becomes "_".
+_UNSAFE_FILENAME_RE = re.compile(r"[^\w .()+-]")
+_UNSAFE_ASCII_FILENAME_RE = re.compile(r"[^A-Za-z0-9 ._()+-]")
+MAX_FILENAME_CHARS = 200
+
+
+class ApiError(Exception):
+    """An error reply: HTTP status and message."""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def safe_filename(filename: Optional[str], default: str = "upload.pdf") -> str:
+    """A client-supplied filename reduced to a safe, header-friendly name.
+
+    Drops any directory part (either separator), control characters and
+    quotes, and keeps only word characters, spaces and ``.()+-``.
+    """
+    name = unicodedata.normalize("NFC", filename or "")
+    name = re.split(r"[/\\]", name)[-1]
+    name = "".join(ch for ch in name if not unicodedata.category(ch).startswith("C"))
+    name = _UNSAFE_FILENAME_RE.sub("_", name).strip(" .")
+    return name[:MAX_FILENAME_CHARS] or default
+
+
+def content_disposition(filename: str) -> str:
+    """``attachment`` header with an ASCII fallback and an RFC 5987 UTF-8 name."""
+    filename = safe_filename(filename, "result.xlsx")
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    fallback = _UNSAFE_ASCII_FILENAME_RE.sub("_", fallback).strip(" .") or "result.xlsx"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def job_view(job: Dict) -> Dict:
+    """Public status of a job, with links to its result."""
+    path = f"/jobs/{job['id']}"
+    result = job.get("result") or {}
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "schema": job.get("schema"),
+        "size": job.get("size"),
+        "status": job["status"],
+        "submitted_at": job["submitted_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+        "partial": bool(result.get("partial")),
+        "links": {"self": path, "result": f"{path}/result", "xlsx": f"{path}/result.xlsx"},
+    }
+
+
+def result_view(job: Dict) -> Dict:
+    """Extracted record of a finished job, as returned by ``/result``."""
+    result = job.get("result") or {}
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "error": job.get("error"),
+        "record": result.get("record"),
+        "partial": bool(result.get("partial")),
+        "usage": result.get("usage"),
+        "pages": result.get("pages"),
+        "revision": result.get("revision"),
+        "requery": result.get("requery"),
+    }
+
+
+def _multipart_files(content_type: str, body: bytes) -> List[Tuple[str, bytes]]:
+    """(filename, bytes) of every file field in a multipart/form-data body."""
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    if not message.is_multipart():
+        raise ApiError(400, "Malformed multipart body.")
+    return [
+        (part.get_filename(), part.get_payload(decode=True) or b"")
+        for part in message.iter_parts()
+        if part.get_filename()
+    ]
+
+
+def submit_uploads(uploads: List[Tuple[str, bytes]], schema: Optional[str] = None) -> List[Dict]:
+    """Validate and queue PDFs; returns their job views."""
+    if not uploads:
+        raise ApiError(400, "No file in the request.")
+    try:
+        schema = schemas.validate(schema)
+    except schemas.UnknownSchema as exc:
+        raise ApiError(400, str(exc))
+    for filename, payload in uploads:
+        if not payload.startswith(b"%PDF-"):
+            raise ApiError(415, f"{filename} is not a PDF.")
+    if API_MAX_QUEUED and jobqueue.queue_depth() + len(uploads) > API_MAX_QUEUED:
+        metrics.inc("docproc_api_rejected_total", reason="queue_full")
+        raise ApiError(
+            429, "Too many jobs waiting; retry later.", {"Retry-After": "30"}
+        )
+    jobs = []
+    for filename, payload in uploads:
+        job_id = jobqueue.submit_job(
+            safe_filename(filename), payload, schema=schema
+        )
+        jobs.append(job_view(jobqueue.get_job(job_id)))
+    metrics.inc("docproc_api_jobs_submitted_total", len(jobs))
+    return jobs
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "docproc-api"
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers=None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload: Dict, headers=None) -> None:
+        self._reply(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _handle(self, route) -> None:
+        try:
+            if API_TOKEN and not hmac.compare_digest(
+                self.headers.get("Authorization", ""), f"Bearer {API_TOKEN}"
+            ):
+                raise ApiError(401, "Missing or wrong bearer token.")
+            route()
+        except ApiError as exc:
+            self._json(exc.status, {"error": str(exc)}, exc.headers)
+        except Exception as exc:
+            logger.error("API request failed: %s", exc, exc_info=True)
+            self._json(500, {"error": "Internal error."})
+
+    def _job(self) -> Tuple[Dict, Optional[str]]:
+        match = _JOB_PATH_RE.match(urlsplit(self.path).path)
+        if not match:
+            raise ApiError(404, "Not found.")
+        job = jobqueue.get_job(match.group(1))
+        if job is None:
+            raise ApiError(404, "Unknown or expired job.")
+        return job, match.group(2) and (match.group(3) or ".json")
+
+    def _read_body(self) -> bytes:
+        length = self.headers.get("Content-Length")
+        # An unread body cannot be skipped, so refusals end the connection.
+        self.close_connection = True
+        if length is None or not length.isdigit():
+            raise ApiError(411, "Content-Length is required.")
+        if int(length) > API_MAX_UPLOAD_BYTES:
+            raise ApiError(413, f"Upload larger than {API_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+        body = self.rfile.read(int(length))
+        self.close_connection = False
+        return body
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _post(self) -> None:
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            raise ApiError(404, "Not found.")
+        body = self._read_body()
+        query = parse_qs(url.query)
+        content_type = self.headers.get("Content-Type", "application/pdf")
+        if content_type.startswith("multipart/form-data"):
+            uploads = _multipart_files(content_type, body)
+        else:
+            uploads = [(query.get("filename", ["upload.pdf"])[0], body)]
+        jobs = submit_uploads(uploads, query.get("schema", [None])[0])
+        self._json(202, {"jobs": jobs}, {"Location": jobs[0]["links"]["self"]})
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def _get(self) -> None:
+        job, result = self._job()
+        if result is None:
+            self._json(200, job_view(job))
+            return
+        if job["status"] not in jobqueue.FINISHED_STATUSES:
+            raise ApiError(409, f"Job is {job['status']}; try again later.", {"Retry-After": "2"})
+        view = result_view(job)
+        if result == ".json":
+            self._json(200, view)
+            return
+        if view["record"] is None:
+            raise ApiError(409, f"Job {job['status']} without a record: {job.get('error')}")
+        row = {"source_file": job["filename"], **view["record"]}
+        if view["partial"]:
+            row["partial"] = True
+        stem = os.path.splitext(job["filename"])[0]
+        self._reply(
+            200,
+            records_to_xlsx([row]),
+            XLSX_MIME,
+            {"Content-Disposition": content_disposition(f"{stem}.xlsx")},
+        )
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def _delete(self) -> None:
+        job, result = self._job()
+        if result is not None:
+            raise ApiError(405, "Only jobs can be cancelled.")
+        jobqueue.cancel_job(job["id"])
+        self._json(202, job_view(jobqueue.get_job(job["id"])))
+
+    def log_message(self, format, *args):
+        logger.info("api: " + format, *args)
+
+
+def main():
+    status_server.start(queue_metrics=True)
+    if API_WORKERS:
+        warmup.start()
+    server = ThreadingHTTPServer(("0.0.0.0", API_PORT), ApiHandler)
+    server.daemon_threads = True
+
+    def stop(*_):
+        worker.stop()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(API_WORKERS):
+        threading.Thread(
+            target=worker.worker_loop, args=(f"api{index}",), daemon=True
+        ).start()
+    logger.info(
+        "API listening on port %s with %s worker threads on the %s queue",
+        API_PORT,
+        API_WORKERS,
+        jobqueue.QUEUE_BACKEND,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        stop()
+    logger.info("API stopped")
+
+
+if __name__ == "__main__":
+    main()
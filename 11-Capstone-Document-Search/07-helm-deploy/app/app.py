@@ -1,23 +1,54 @@
 """
 License Renewal Document Processor
 
-Upload a PDF license renewal form, extract text locally, call an OpenAI-compatible
-LLM HTTP endpoint, and download structured results as Excel.
+Upload one or more PDF license renewal forms, extract text locally, call an
+OpenAI-compatible LLM HTTP endpoint, and download structured results as Excel.
 
 No Bedrock. No S3.
 """
-import json
 import logging
 import os
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
-from io import BytesIO
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
-import PyPDF2
-import requests
 import streamlit as st
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Before the imports below: they read their settings from the environment.
+load_dotenv()
+
+import cancellation  # noqa: E402
+import ledger  # noqa: E402
+import metrics  # noqa: E402
+import result_store  # noqa: E402
+import schemas  # noqa: E402
+import status_server  # noqa: E402
+import warmup  # noqa: E402
+from archives import is_archive, process_archive  # noqa: E402
+from export import XLSX_MIME, records_to_xlsx  # noqa: E402
+from jobqueue import (  # noqa: E402
+    FINISHED_STATUSES,
+    cancel_job,
+    run_jobs,
+    submit_job,
+    wait_for_jobs,
+)
+from ocr import ocr_available  # noqa: E402
+from pipeline import (  # noqa: E402
+    document_deadline,
+    extract_document_pages,
+    extract_records,
+    join_pages,
+    process_documents,
+    track_documents,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,7 +57,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# "inline" runs extraction in this process; "queue" hands each upload to
+# the worker tier (app/worker.py) and waits for the result.
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "inline").lower()
+JOB_WAIT_SECONDS = float(os.getenv("JOB_WAIT_SECONDS", "600"))
 
 st.set_page_config(
     page_title="License Renewal Document Processor",
@@ -83,185 +117,416 @@ def llm_config_ok():
     return True
 
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text content from PDF using pdfplumber or PyPDF2."""
+def run_cancellable(func, *args, describe: Optional[Callable[[], str]] = None):
+    """Run pipeline work off the script thread so a rerun can abandon it.
+
+    The script thread waits in short steps, updating a status line (from
+    ``describe``, if given); each update lets Streamlit interrupt the run
+    (new upload, widget change, closed tab), and the work is then
+    cancelled, aborting any LLM request in flight.
+    """
+    token = cancellation.CancelToken()
+    future = cancellation.submit(token, func, *args)
+    status = st.empty()
+    started = time.monotonic()
+    try:
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeout:
+                detail = describe() if describe else "Working"
+                status.caption(f"⏳ {detail}... {time.monotonic() - started:.0f}s")
+    finally:
+        if not future.done():
+            token.cancel("the Streamlit run was interrupted")
+            metrics.inc("docproc_abandoned_runs_total")
+        status.empty()
+
+
+def extract_pages_from_pdf(pdf_file) -> Tuple[Optional[List[str]], bool, Dict]:
+    """Extract cleaned page texts from PDF with the cheapest adequate extractor.
+
+    Returns the pages (None when there is no text), whether extraction ran
+    out of time before reading the whole document, and the fields read
+    from payment and violation tables.
+    """
     try:
         logger.info("Starting text extraction from PDF: %s", pdf_file.name)
-        try:
-            import pdfplumber
-
-            pdf_file.seek(0)
-            with pdfplumber.open(pdf_file) as pdf:
-                logger.info("PDF has %s pages", len(pdf.pages))
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text if text.strip() else None
-        except ImportError:
-            logger.info("pdfplumber not available, using PyPDF2")
-            pdf_file.seek(0)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            return text if text.strip() else None
+        pages, report = run_cancellable(
+            extract_document_pages, pdf_file, pdf_file.size, pdf_file.name
+        )
+        if report["ocr_pages"]:
+            st.caption(
+                f"🔎 {pdf_file.name}: OCR applied to {len(report['ocr_pages'])} "
+                "page(s) without a text layer"
+            )
+        cleanup = report["cleanup"]
+        if cleanup["tokens_after"] < cleanup["tokens_before"]:
+            saved = 1 - cleanup["tokens_after"] / cleanup["tokens_before"]
+            st.caption(
+                f"✂️ {pdf_file.name}: clean-up removed {cleanup['removed_lines']} "
+                f"header/footer/boilerplate line(s); prompt ~{cleanup['tokens_before']} → "
+                f"~{cleanup['tokens_after']} tokens (-{saved:.0%})"
+            )
+        table_report = report["tables"]
+        if table_report["fields"]:
+            st.caption(
+                f"🧮 {pdf_file.name}: read {', '.join(table_report['fields'])} from "
+                f"{table_report['tables']} table(s); prompt "
+                f"{table_report['chars_removed']} characters shorter"
+            )
+        partial = report.get("partial", False)
+        if partial:
+            st.warning(
+                f"⏱️ {pdf_file.name}: text extraction ran out of time; "
+                "only the pages read so far are used."
+            )
+        return (pages if join_pages(pages).strip() else None), partial, table_report["fields"]
+    except cancellation.DeadlineExceeded:
+        st.error(f"{pdf_file.name}: ran out of time extracting text from the PDF.")
+        return None, True, {}
     except Exception as exc:
         logger.error("Error extracting text from PDF: %s", exc, exc_info=True)
         st.error(f"Error extracting text from PDF: {exc}")
-        return None
+        return None, False, {}
 
 
-def call_llm(prompt: str) -> Optional[str]:
-    """Call OpenAI-compatible chat completions endpoint."""
-    endpoint = os.getenv("LLM_API_ENDPOINT")
-    api_key = os.getenv("LLM_API_KEY")
-    model = os.getenv("LLM_MODEL")
+def show_revision(filename: str, revision: Dict) -> None:
+    """Report what changed since the form was last processed."""
+    if revision["incremental"]:
+        how = (
+            f"re-extracted {revision['changed_lines']} of "
+            f"{revision['total_lines']} changed lines"
+        )
+    else:
+        how = "too much changed, extracted the whole form"
+    st.info(f"🔁 {filename}: revision of a previously processed form ({how}).")
+    with st.expander(f"Field changes: {filename}", expanded=bool(revision["changes"])):
+        if revision["changes"]:
+            st.dataframe(pd.DataFrame(revision["changes"]), use_container_width=True)
+        else:
+            st.write("No field values changed.")
 
-    # Accept either a base URL (for example, .../v1) or a full
-    # chat completions URL (.../v1/chat/completions).
-    endpoint = endpoint.rstrip("/") if endpoint else endpoint
-    if endpoint and not endpoint.endswith("/chat/completions"):
-        endpoint = f"{endpoint}/chat/completions"
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    body = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.1,
-    }
+def show_page_selection(filename: str, pages: Dict) -> None:
+    """Note when only some pages of a long document went to the LLM."""
+    if len(pages["selected"]) < pages["total"]:
+        numbers = ", ".join(str(index + 1) for index in pages["selected"])
+        st.caption(
+            f"📑 {filename}: sent {len(pages['selected'])} of {pages['total']} pages "
+            f"(pages {numbers}) after {pages['rounds']} round(s)"
+        )
 
-    logger.info("Calling LLM endpoint: %s model=%s", endpoint, model)
-    response = requests.post(endpoint, headers=headers, json=body, timeout=120)
-    response.raise_for_status()
-    payload = response.json()
 
-    choices = payload.get("choices") or []
-    if not choices:
-        logger.error("LLM response missing choices: %s", payload)
-        st.error("Empty response from LLM endpoint")
-        return None
+def show_requery(filename: str, requery: Dict) -> None:
+    """Note the fields a second, targeted LLM pass asked for."""
+    st.caption(
+        f"🎯 {filename}: re-asked for {len(requery['fields'])} unresolved field(s), "
+        f"filled {', '.join(requery['filled']) or 'none'}"
+    )
 
-    message = choices[0].get("message") or {}
-    content = message.get("content")
-    if not content:
-        # Some providers return plain text under "text"
-        content = choices[0].get("text")
-    if not content:
-        st.error("LLM response did not include message content")
-        return None
-    return content
 
+def mark_partial(rows: List[Dict], row: Dict, filename: str) -> None:
+    """Flag a record cut short by the time budget, in the table and the export."""
+    st.warning(
+        f"⏱️ {filename}: ran out of time; fields not found yet are N/A (partial result)."
+    )
+    row["partial"] = True
+    for other in rows:
+        other.setdefault("partial", False)
+
+
+def convert_to_table_with_llm(
+    documents: List[Tuple[str, List[str]]],
+    partial_files: Set[str] = frozenset(),
+    table_fields: Optional[Dict[str, Dict]] = None,
+) -> Tuple[List[Dict], List[Dict]]:
+    """Use the configured LLM endpoint to extract structured fields.
+
+    Takes (filename, pages) pairs, plus the fields already read from each
+    file's tables, and returns the extracted rows plus one
+    token-usage row per document. Long documents only send their most
+    relevant pages and short ones are packed into shared requests;
+    failures are reported per file and the remaining records are still
+    returned. Records cut short by the time budget (including documents
+    in ``partial_files``, whose text extraction ran out of time) are
+    flagged in a ``partial`` column.
+    """
+    rows = []
+    usage_rows = []
+    results = run_cancellable(
+        extract_records,
+        [pages for _, pages in documents],
+        [(table_fields or {}).get(filename, {}) for filename, _ in documents],
+    )
+    for (filename, _), result in zip(documents, results):
+        if result["usage"]:
+            usage_rows.append({"source_file": filename, **result["usage"]})
+        if result["record"] is None:
+            st.error(f"{filename}: {result['error']}")
+            continue
+        if result.get("pages"):
+            show_page_selection(filename, result["pages"])
+        if result.get("revision"):
+            show_revision(filename, result["revision"])
+        if result.get("requery"):
+            show_requery(filename, result["requery"])
+        row = dict(result["record"])
+        if len(documents) > 1:
+            row = {"source_file": filename, **row}
+        if result.get("partial") or filename in partial_files:
+            mark_partial(rows, row, filename)
+        elif any("partial" in other for other in rows):
+            row["partial"] = False
+        rows.append(row)
+    logger.info("Extracted %s of %s documents", len(rows), len(documents))
+    return rows, usage_rows
+
+
+def process_inline(uploaded_files) -> Tuple[List[Dict], List[Dict]]:
+    """Extract and convert the uploads inside this Streamlit process.
+
+    Each file's text extraction has its own deadline; the LLM stage gets
+    the files' budgets added up, counted from the start.
+    """
+    started = time.perf_counter()
+    st.info("📄 Extracting text from PDF...")
+    documents = []
+    partial_files = set()
+    table_fields = {}
+    for uploaded_file in uploaded_files:
+        pages, partial, table_fields[uploaded_file.name] = extract_pages_from_pdf(uploaded_file)
+        if partial:
+            partial_files.add(uploaded_file.name)
+        if not pages:
+            st.error(f"Could not extract text from {uploaded_file.name}.")
+            continue
+        text_content = join_pages(pages)
+
+        if len(text_content.strip()) < 50:
+            st.warning(
+                f"⚠️ Very little text extracted from {uploaded_file.name}. "
+                + (
+                    "The PDF may be scanned and OCR found little text; check the scan quality."
+                    if ocr_available()
+                    else "The PDF may be scanned; install Tesseract to enable OCR."
+                )
+            )
 
-def convert_to_table_with_llm(text_content: str) -> Optional[Dict]:
-    """Use the configured LLM endpoint to extract structured fields."""
+        with st.expander(
+            f"📋 View Extracted Text (Preview): {uploaded_file.name}",
+            expanded=False,
+        ):
+            preview = text_content[:1000]
+            st.text(preview + ("..." if len(text_content) > 1000 else ""))
+        documents.append((uploaded_file.name, pages))
+
+    if not documents:
+        return [], []
+    st.info("🤖 Extracting structured data using your LLM endpoint...")
+    with document_deadline(len(uploaded_files), started):
+        return convert_to_table_with_llm(documents, partial_files, table_fields)
+
+
+def process_via_queue(uploaded_files) -> Tuple[List[Dict], List[Dict]]:
+    """Hand the uploads to the worker tier and wait for their results."""
+    st.info("📨 Sending documents to the processing workers...")
+    job_ids = [
+        submit_job(uploaded_file.name, uploaded_file, size=uploaded_file.size)
+        for uploaded_file in uploaded_files
+    ]
+    deadline = time.monotonic() + JOB_WAIT_SECONDS
+    status = st.empty()
+    jobs = []
     try:
-        prompt = f"""You are a document processing assistant specialized in extracting structured data from government license renewal forms.
-
-Extract ALL information from the following license renewal form document. The document content is:
-
-{text_content}
-
-Analyze the document and extract all fields and their corresponding values. Return the data as a JSON object with the following structure. Map the fields from the document to these standard fields:
-
-{{
-    "applicant_name": "Full name of the applicant/license holder",
-    "license_number": "License number or ID",
-    "license_type": "Type of license (e.g., Driver's License, Professional License, etc.)",
-    "expiry_date": "Current expiration date of the license",
-    "renewal_date": "Date of renewal application or renewal date",
-    "address": "Complete address (street, city, state, zip)",
-    "contact_number": "Phone number or contact number",
-    "email": "Email address",
-    "payment_status": "Payment status (Paid, Pending, etc.)",
-    "payment_amount": "Amount paid (if mentioned)",
-    "transaction_id": "Transaction or payment reference number (if mentioned)",
-    "date_of_birth": "Date of birth (if mentioned)",
-    "previous_violations": "Any violations or disciplinary actions (if mentioned)",
-    "additional_notes": "Any additional information, notes, or remarks"
-}}
-
-Important instructions:
-1. Extract values exactly as they appear in the document
-2. If a field is not present in the document, set it to "N/A"
-3. For dates, preserve the format as shown in the document
-4. Include ALL fields you find, even if they don't match the standard fields above - add them as additional fields
-5. Return ONLY valid JSON, no markdown formatting, no code blocks, no additional text before or after the JSON
-6. Ensure all string values are properly quoted and escaped if needed"""
-
-        text_response = call_llm(prompt)
-        if not text_response:
-            return None
-
-        json_start = text_response.find("{")
-        json_end = text_response.rfind("}") + 1
-        if json_start != -1 and json_end > json_start:
-            parsed_data = json.loads(text_response[json_start:json_end])
-        else:
-            parsed_data = json.loads(text_response)
-
-        logger.info("Successfully extracted %s fields", len(parsed_data))
-        return parsed_data
-    except requests.HTTPError as exc:
-        logger.error("LLM HTTP error: %s", exc, exc_info=True)
-        status_code = exc.response.status_code if exc.response is not None else None
-        if status_code == 401:
+        while True:
+            jobs = wait_for_jobs(job_ids, timeout=1.0)
+            finished = sum(1 for job in jobs if job and job["status"] in FINISHED_STATUSES)
+            if finished == len(job_ids) or time.monotonic() >= deadline:
+                break
+            status.caption(f"⏳ {finished} of {len(job_ids)} documents processed...")
+    finally:
+        unfinished = [
+            job_id
+            for job_id, job in zip(job_ids, jobs or [None] * len(job_ids))
+            if not job or job["status"] not in FINISHED_STATUSES
+        ]
+        if unfinished and time.monotonic() < deadline:
+            # Interrupted by a rerun: the workers should not finish work
+            # nobody is waiting for.
+            for job_id in unfinished:
+                cancel_job(job_id)
+            metrics.inc("docproc_abandoned_runs_total")
+        status.empty()
+
+    rows = []
+    usage_rows = []
+    for uploaded_file, job in zip(uploaded_files, jobs):
+        filename = uploaded_file.name
+        if job is None or job["status"] not in FINISHED_STATUSES:
             st.error(
-                "LLM endpoint returned 401 Unauthorized. Check `LLM_API_KEY` in `.env`."
+                f"{filename}: still processing after {JOB_WAIT_SECONDS:.0f}s; "
+                "please try again later."
             )
-        elif status_code == 403:
-            st.error(
-                "LLM endpoint returned 403 Forbidden. Your key may lack permission for "
-                "this model/endpoint, or network policy is blocking access."
+            continue
+        result = job["result"] or {}
+        if result.get("usage"):
+            usage_rows.append({"source_file": filename, **result["usage"]})
+        if job["status"] in ("failed", "cancelled"):
+            st.error(f"{filename}: {job['error']}")
+            continue
+        if result.get("pages"):
+            show_page_selection(filename, result["pages"])
+        if result.get("revision"):
+            show_revision(filename, result["revision"])
+        if result.get("requery"):
+            show_requery(filename, result["requery"])
+        row = dict(result["record"])
+        if len(uploaded_files) > 1:
+            row = {"source_file": filename, **row}
+        if result.get("partial"):
+            mark_partial(rows, row, filename)
+        elif any("partial" in other for other in rows):
+            row["partial"] = False
+        rows.append(row)
+    return rows, usage_rows
+
+
+def process_archive_upload(archive_file) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Extract every PDF inside an uploaded ZIP, streaming its members.
+
+    Returns the extracted rows, the token-usage rows and one status row
+    per archive member for the export.
+    """
+    st.info(f"🗜️ Processing the PDFs in {archive_file.name}...")
+
+    def process_batch(documents):
+        if PROCESSING_MODE == "queue":
+            return run_jobs(documents, JOB_WAIT_SECONDS)
+        return process_documents(documents)
+
+    progress: Dict = {}
+    try:
+        results = run_cancellable(
+            process_archive,
+            archive_file,
+            process_batch,
+            progress,
+            describe=lambda: (
+                f"{progress.get('finished', 0)} of {progress.get('total', '?')} "
+                f"files in {archive_file.name} done"
+            ),
+        )
+    except zipfile.BadZipFile as exc:
+        st.error(f"{archive_file.name}: not a readable ZIP archive ({exc}).")
+        return [], [], []
+
+    rows = []
+    usage_rows = []
+    entry_rows = []
+    for result in results:
+        source = f"{archive_file.name}/{result['filename']}"
+        entry_rows.append(
+            {
+                "archive": archive_file.name,
+                "entry": result["filename"],
+                "status": result["entry_status"],
+                "size_bytes": result["size"],
+                "error": result.get("error") or "",
+            }
+        )
+        if result.get("usage"):
+            usage_rows.append({"source_file": source, **result["usage"]})
+        if result["record"] is not None:
+            rows.append(
+                {"source_file": source, **result["record"], "partial": bool(result.get("partial"))}
             )
-        else:
-            st.error(f"LLM HTTP error: {exc}")
-        if exc.response is not None:
-            st.error(exc.response.text[:500])
-        return None
-    except json.JSONDecodeError as exc:
-        logger.error("Failed to parse JSON from LLM: %s", exc)
-        st.error("Failed to parse JSON response from LLM")
-        return None
-    except Exception as exc:
-        logger.error("Error calling LLM: %s", exc, exc_info=True)
-        st.error(f"Error calling LLM: {exc}")
-        return None
+    counts = Counter(entry["status"] for entry in entry_rows)
+    st.caption(
+        f"🗜️ {archive_file.name}: "
+        + ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    )
+    problems = [entry for entry in entry_rows if entry["status"] in ("failed", "skipped")]
+    if problems:
+        with st.expander(f"Files not extracted from {archive_file.name}", expanded=False):
+            st.dataframe(pd.DataFrame(problems), use_container_width=True)
+    return rows, usage_rows, entry_rows
 
 
-def create_excel_file(data_dict):
-    """Convert dictionary to Excel bytes."""
+def create_excel_file(rows, entries: Optional[List[Dict]] = None):
+    """Convert a record (or list of records) to Excel bytes.
+
+    ``entries`` (per-file status rows of uploaded archives) go on a second
+    sheet.
+    """
     try:
-        df = pd.DataFrame([data_dict])
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="License Renewal Data")
-        output.seek(0)
-        return output.getvalue()
+        return records_to_xlsx(rows, entries)
     except Exception as exc:
         logger.error("Error creating Excel file: %s", exc, exc_info=True)
         st.error(f"Error creating Excel file: {exc}")
         return None
 
 
+def show_ledger_summary(days: int = 7) -> None:
+    """LLM calls, tokens and cost per day and model from the call ledger."""
+    try:
+        rows = ledger.summary(days)
+    except Exception as exc:
+        logger.warning("Could not read the LLM ledger: %s", exc)
+        return
+    if not rows:
+        return
+    with st.expander(f"📒 LLM usage, last {days} days", expanded=False):
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+        st.caption(f"Full report: `python app/ledger.py --days {days}`")
+
+
+def _approx_size(value) -> int:
+    """Rough deep size of plain containers held in session state."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_approx_size(item) for item in value)
+    return size
+
+
+def record_session_metrics():
+    """Publish this browser session's state size to the metrics registry.
+
+    The registry only exports totals over sessions; the size of this one is
+    logged at debug level.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    size = sum(
+        _approx_size(key) + _approx_size(value)
+        for key, value in st.session_state.to_dict().items()
+    )
+    logger.debug("Session %s holds about %s bytes of state", ctx.session_id, size)
+    metrics.observe_session_bytes(ctx.session_id, size)
+
+
 def main():
+    # Already running under serve.py; this covers a plain `streamlit run`.
+    # Both calls do nothing after the first one in the process.
+    status_server.start(queue_metrics=PROCESSING_MODE == "queue")
+    if PROCESSING_MODE != "queue":
+        warmup.start()
     st.title("📄 License Renewal Document Processor")
     st.markdown("---")
     st.markdown(
-        "Upload a license renewal form PDF. The app extracts text locally, "
+        "Upload one or more license renewal form PDFs. The app extracts text locally, "
         "calls your configured LLM endpoint, and lets you download Excel results."
     )
 
-    if "excel_data" not in st.session_state:
-        st.session_state.excel_data = None
-    if "table_data" not in st.session_state:
-        st.session_state.table_data = None
+    # Only handles into the shared result store live in session state; the
+    # payloads are on disk and may be evicted when the store is full.
+    if "excel_handle" not in st.session_state:
+        st.session_state.excel_handle = None
+    if "table_handle" not in st.session_state:
+        st.session_state.table_handle = None
     if "processed_filename" not in st.session_state:
         st.session_state.processed_filename = None
 
@@ -276,76 +541,91 @@ def main():
         f"Model: `{os.getenv('LLM_MODEL')}` · Endpoint configured from `.env`"
     )
 
-    uploaded_file = st.file_uploader(
-        "Choose a PDF file",
-        type=["pdf"],
-        help="Upload a license renewal form in PDF format",
+    uploaded_files = st.file_uploader(
+        "Choose PDF or ZIP files",
+        type=["pdf", "zip"],
+        accept_multiple_files=True,
+        help="Upload license renewal forms as PDFs, or ZIP archives of PDFs",
+    )
+    schema_name = st.selectbox(
+        "Fields to extract",
+        schemas.names(),
+        help="A smaller field schema gives shorter, faster and cheaper LLM replies",
     )
 
-    if uploaded_file is not None:
-        st.info(f"📎 File uploaded: {uploaded_file.name} ({uploaded_file.size} bytes)")
+    if uploaded_files:
+        for uploaded_file in uploaded_files:
+            st.info(f"📎 File uploaded: {uploaded_file.name} ({uploaded_file.size} bytes)")
 
         if st.button("🔄 Process Document", type="primary"):
-            with st.spinner("Processing document..."):
-                st.info("📄 Extracting text from PDF...")
-                text_content = extract_text_from_pdf(uploaded_file)
-
-                if text_content:
-                    if len(text_content.strip()) < 50:
-                        st.warning(
-                            "⚠️ Very little text extracted. The PDF may be scanned; "
-                            "OCR may be required for better results."
+            with st.spinner("Processing document..."), schemas.use(schema_name):
+                pdf_files = [f for f in uploaded_files if not is_archive(f.name)]
+                archive_files = [f for f in uploaded_files if is_archive(f.name)]
+                table_data, usage_rows, entry_rows = [], [], []
+                if pdf_files:
+                    if PROCESSING_MODE == "queue":
+                        table_data, usage_rows = process_via_queue(pdf_files)
+                    else:
+                        with track_documents(len(pdf_files)):
+                            table_data, usage_rows = process_inline(pdf_files)
+                    if archive_files and len(pdf_files) == 1:
+                        table_data = [
+                            {"source_file": pdf_files[0].name, **row} for row in table_data
+                        ]
+                for archive_file in archive_files:
+                    rows, archive_usage, entries = process_archive_upload(archive_file)
+                    table_data += rows
+                    usage_rows += archive_usage
+                    entry_rows += entries
+                if any("partial" in row for row in table_data):
+                    for row in table_data:
+                        row.setdefault("partial", False)
+                if usage_rows:
+                    with st.expander("🧮 Token usage per document", expanded=False):
+                        st.dataframe(pd.DataFrame(usage_rows), use_container_width=True)
+
+                if table_data:
+                    st.success("✅ Document processed successfully!")
+                    st.session_state.table_handle = result_store.put_json(table_data)
+
+                    st.subheader("Extracted Data")
+                    st.dataframe(pd.DataFrame(table_data), use_container_width=True)
+
+                    st.info("📊 Creating Excel file...")
+                    excel_data = create_excel_file(table_data, entry_rows)
+                    if excel_data:
+                        st.session_state.excel_handle = result_store.put_bytes(excel_data)
+                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        st.session_state.processed_filename = (
+                            f"license_renewal_{timestamp}.xlsx"
+                        )
+                        st.download_button(
+                            label="📥 Download as Excel",
+                            data=excel_data,
+                            file_name=st.session_state.processed_filename,
+                            mime=XLSX_MIME,
                         )
 
-                    with st.expander("📋 View Extracted Text (Preview)", expanded=False):
-                        preview = text_content[:1000]
-                        st.text(preview + ("..." if len(text_content) > 1000 else ""))
-
-                    st.info("🤖 Extracting structured data using your LLM endpoint...")
-                    table_data = convert_to_table_with_llm(text_content)
-
-                    if table_data:
-                        st.success("✅ Document processed successfully!")
-                        st.session_state.table_data = table_data
-
-                        st.subheader("Extracted Data")
-                        st.dataframe(pd.DataFrame([table_data]), use_container_width=True)
-
-                        st.info("📊 Creating Excel file...")
-                        excel_data = create_excel_file(table_data)
-                        if excel_data:
-                            st.session_state.excel_data = excel_data
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            st.session_state.processed_filename = (
-                                f"license_renewal_{timestamp}.xlsx"
-                            )
-                            st.download_button(
-                                label="📥 Download as Excel",
-                                data=excel_data,
-                                file_name=st.session_state.processed_filename,
-                                mime=(
-                                    "application/vnd.openxmlformats-officedocument"
-                                    ".spreadsheetml.sheet"
-                                ),
-                            )
-                else:
-                    st.error("Could not extract text from the PDF.")
-
-    elif st.session_state.table_data is not None:
-        st.subheader("Last Extracted Data")
-        st.dataframe(
-            pd.DataFrame([st.session_state.table_data]), use_container_width=True
-        )
-        if st.session_state.excel_data and st.session_state.processed_filename:
-            st.download_button(
-                label="📥 Download as Excel",
-                data=st.session_state.excel_data,
-                file_name=st.session_state.processed_filename,
-                mime=(
-                    "application/vnd.openxmlformats-officedocument"
-                    ".spreadsheetml.sheet"
-                ),
-            )
+    elif st.session_state.table_handle is not None:
+        table_data = result_store.get_json(st.session_state.table_handle)
+        if table_data is None:
+            st.info("Your previous results have expired. Process the document again.")
+            st.session_state.table_handle = None
+            st.session_state.excel_handle = None
+        else:
+            st.subheader("Last Extracted Data")
+            st.dataframe(pd.DataFrame(table_data), use_container_width=True)
+            excel_data = result_store.get_bytes(st.session_state.excel_handle)
+            if excel_data and st.session_state.processed_filename:
+                st.download_button(
+                    label="📥 Download as Excel",
+                    data=excel_data,
+                    file_name=st.session_state.processed_filename,
+                    mime=XLSX_MIME,
+                )
+
+    show_ledger_summary()
+    record_session_metrics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+Streaming ingestion of ZIP archives of PDFs.
+
+Agencies send their filings as ZIP files of hundreds of PDFs. Only the
+archive's central directory is read up front; the PDF members are then
+opened a batch of ``ARCHIVE_BATCH_SIZE`` at a time and handed, as
+streams, to a pool of ``ARCHIVE_WORKERS`` threads. The pipeline
+decompresses each member straight into its own spool file, so the
+archive is never extracted to memory or disk as a whole.
+
+At most ``ARCHIVE_WORKERS + ARCHIVE_PREFETCH`` batches are open at once:
+the extra batches are ready and waiting when a worker frees up, and
+memory stays flat however large the archive is.
+
+Every member gets an ``entry_status`` for the export: done, partial,
+failed, or skipped. Members are skipped when they are not PDFs, are
+encrypted, are larger than ``ARCHIVE_MAX_ENTRY_MB``, or come after the
+first ``ARCHIVE_MAX_ENTRIES``.
+"""
+import contextvars
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import cancellation
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "4"))
+ARCHIVE_PREFETCH = int(os.getenv("ARCHIVE_PREFETCH", "2"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "4"))
+ARCHIVE_MAX_ENTRIES = int(os.getenv("ARCHIVE_MAX_ENTRIES", "1000"))
+ARCHIVE_MAX_ENTRY_BYTES = int(os.getenv("ARCHIVE_MAX_ENTRY_MB", "50")) * 1024 * 1024
+
+# (filename, stream, size), as taken by ``pipeline.process_documents``.
+Document = Tuple[str, BinaryIO, int]
+
+
+def is_archive(filename: str) -> bool:
+    """Whether an upload is a ZIP archive rather than a single PDF."""
+    return filename.lower().endswith(".zip")
+
+
+def _listed(info: zipfile.ZipInfo) -> bool:
+    """Members worth reporting: not folders or macOS resource forks."""
+    name = info.filename
+    return not (
+        info.is_dir()
+        or name.startswith("__MACOSX/")
+        or os.path.basename(name).startswith("._")
+    )
+
+
+def _skip_reason(info: zipfile.ZipInfo) -> Optional[str]:
+    if not info.filename.lower().endswith(".pdf"):
+        return "Not a PDF."
+    if info.flag_bits & 0x1:
+        return "Encrypted archive member."
+    if info.file_size == 0:
+        return "Empty file."
+    if info.file_size > ARCHIVE_MAX_ENTRY_BYTES:
+        return f"Larger than {ARCHIVE_MAX_ENTRY_BYTES // (1024 * 1024)} MB."
+    return None
+
+
+def entry_status(result: Dict) -> str:
+    """done, partial or failed, from a pipeline result."""
+    if result.get("record") is None:
+        return "failed"
+    return "partial" if result.get("partial") else "done"
+
+
+def _skipped(info: zipfile.ZipInfo, reason: str) -> Dict:
+    return {
+        "filename": info.filename,
+        "record": None,
+        "error": reason,
+        "usage": None,
+        "size": info.file_size,
+        "entry_status": "skipped",
+    }
+
+
+def process_archive(
+    archive: BinaryIO,
+    process_batch: Callable[[List[Document]], List[Dict]],
+    progress: Optional[Dict] = None,
+) -> List[Dict]:
+    """Process the PDF members of a ZIP archive, streaming them in batches.
+
+    ``process_batch`` takes a list of documents and returns one pipeline
+    result for each. Use ``pipeline.process_documents`` to process them
+    here, or ``jobqueue.run_jobs`` to send them to the worker tier.
+    Returns one result per archive member, in archive order, with
+    ``filename``, ``size`` and ``entry_status`` added. ``progress``, if
+    given, is kept updated with ``total`` and ``finished`` member counts.
+    """
+    progress = progress if progress is not None else {}
+    with zipfile.ZipFile(archive) as zipped:
+        entries = [info for info in zipped.infolist() if _listed(info)]
+        results: List[Optional[Dict]] = [None] * len(entries)
+        batches: List[List[int]] = [[]]
+        for position, info in enumerate(entries):
+            reason = (
+                f"Archive has more than {ARCHIVE_MAX_ENTRIES} entries."
+                if position >= ARCHIVE_MAX_ENTRIES
+                else _skip_reason(info)
+            )
+            if reason:
+                results[position] = _skipped(info, reason)
+            elif len(batches[-1]) < ARCHIVE_BATCH_SIZE:
+                batches[-1].append(position)
+            else:
+                batches.append([position])
+        batches = [batch for batch in batches if batch]
+        lock = threading.Lock()
+        progress.update(
+            total=len(entries), finished=sum(1 for result in results if result is not None)
+        )
+        logger.info(
+            "Archive with %s entries: %s PDFs in %s batches",
+            len(entries),
+            sum(len(batch) for batch in batches),
+            len(batches),
+        )
+
+        def run(batch: List[int], documents: List[Document]) -> None:
+            try:
+                try:
+                    outcomes = process_batch(documents)
+                except cancellation.Cancelled:
+                    raise
+                except Exception as exc:
+                    logger.error("Archive batch failed: %s", exc, exc_info=True)
+                    outcomes = [
+                        {"record": None, "error": f"Processing failed: {exc}", "usage": None}
+                        for _ in batch
+                    ]
+                for position, outcome in zip(batch, outcomes):
+                    info = entries[position]
+                    outcome.update(filename=info.filename, size=info.file_size)
+                    outcome["entry_status"] = entry_status(outcome)
+                    metrics.inc("docproc_archive_entries_total", status=outcome["entry_status"])
+                    results[position] = outcome
+                with lock:
+                    progress["finished"] += len(batch)
+            finally:
+                for _, stream, _ in documents:
+                    stream.close()
+                slots.release()
+
+        # Batches running plus batches opened and waiting for a worker.
+        slots = threading.BoundedSemaphore(ARCHIVE_WORKERS + ARCHIVE_PREFETCH)
+        futures: List[Future] = []
+        with ThreadPoolExecutor(
+            max_workers=ARCHIVE_WORKERS, thread_name_prefix="docproc-archive"
+        ) as pool:
+            for batch in batches:
+                while not slots.acquire(timeout=0.5):
+                    cancellation.check("archive")
+                opened: List[int] = []
+                documents: List[Document] = []
+                try:
+                    cancellation.check("archive")
+                    for position in batch:
+                        info = entries[position]
+                        try:
+                            stream = zipped.open(info)
+                        except (zipfile.BadZipFile, NotImplementedError, OSError) as exc:
+                            results[position] = {
+                                **_skipped(info, f"Could not read archive member: {exc}"),
+                                "entry_status": "failed",
+                            }
+                            with lock:
+                                progress["finished"] += 1
+                            continue
+                        opened.append(position)
+                        documents.append((info.filename, stream, info.file_size))
+                    if not documents:
+                        slots.release()
+                        continue
+                    # Workers run with this thread's cancel token and deadline.
+                    futures.append(
+                        pool.submit(contextvars.copy_context().run, run, opened, documents)
+                    )
+                except BaseException:
+                    for _, stream, _ in documents:
+                        stream.close()
+                    slots.release()
+                    raise
+            for future in futures:
+                future.result()
+    return results
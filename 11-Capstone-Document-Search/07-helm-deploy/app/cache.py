@@ -0,0 +1,174 @@
+"""
+Cache for extracted text and LLM results, shared across replicas.
+
+A small in-process LRU (L1) sits in front of a pluggable shared backend
+(L2) chosen with ``CACHE_BACKEND``:
+
+- ``none``   (default) L1 only.
+- ``sqlite`` a SQLite file, put it on a volume every Pod mounts.
+- ``redis``  anything that speaks the Redis protocol at ``CACHE_URL``
+  (needs the optional ``redis`` package).
+
+Keys follow ``docproc:v1:<kind>:<sha256 of the inputs>``, so a document
+processed on one Pod is a hit on every other. Every entry carries a TTL
+(``CACHE_TTL_SECONDS`` unless the caller passes one). Backend errors are
+logged and treated as misses: the cache must never fail a document.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "none").lower()
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "/tmp/docproc-cache.sqlite3")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_L1_ENTRIES = int(os.getenv("CACHE_L1_ENTRIES", "256"))
+CACHE_L1_TTL_SECONDS = int(os.getenv("CACHE_L1_TTL_SECONDS", "300"))
+KEY_PREFIX = "docproc:v1"
+
+
+def cache_key(kind: str, *parts: Any) -> str:
+    """Stable key for ``kind`` derived from JSON-serialisable ``parts``."""
+    digest = hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"{KEY_PREFIX}:{kind}:{digest}"
+
+
+class SQLiteBackend:
+    """Key/value table in a SQLite file; expired rows are purged on write."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, now + ttl),
+        )
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+
+
+class RedisBackend:
+    """Any Redis-protocol server; TTL handled by the server (SET ... EX)."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=2)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._client.set(key, value, ex=ttl)
+
+
+_l1: "OrderedDict[str, tuple]" = OrderedDict()
+_l1_lock = threading.Lock()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    if CACHE_BACKEND == "none":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            if CACHE_BACKEND == "sqlite":
+                _backend = SQLiteBackend(CACHE_SQLITE_PATH)
+            elif CACHE_BACKEND == "redis":
+                _backend = RedisBackend(CACHE_URL)
+            else:
+                raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+            logger.info("Using %s cache backend", CACHE_BACKEND)
+        return _backend
+
+
+def _l1_put(key: str, value: bytes, ttl: int) -> None:
+    with _l1_lock:
+        _l1[key] = (time.time() + min(ttl, CACHE_L1_TTL_SECONDS), value)
+        _l1.move_to_end(key)
+        while len(_l1) > CACHE_L1_ENTRIES:
+            _l1.popitem(last=False)
+
+
+def get(key: str) -> Optional[bytes]:
+    """Cached bytes for ``key`` (L1 first, then the shared backend)."""
+    kind = key.split(":")[2]
+    with _l1_lock:
+        entry = _l1.get(key)
+        if entry and entry[0] > time.time():
+            _l1.move_to_end(key)
+            metrics.inc("docproc_cache_hits_total", layer="l1", kind=kind)
+            return entry[1]
+        _l1.pop(key, None)
+
+    try:
+        backend = _get_backend()
+        value = backend.get(key) if backend else None
+    except Exception as exc:
+        logger.warning("Cache backend read failed: %s", exc)
+        value = None
+    if value is None:
+        metrics.inc("docproc_cache_misses_total", kind=kind)
+        return None
+    metrics.inc("docproc_cache_hits_total", layer="l2", kind=kind)
+    _l1_put(key, value, CACHE_L1_TTL_SECONDS)
+    return value
+
+
+def put(key: str, value: bytes, ttl: Optional[int] = None) -> None:
+    """Store ``value`` in L1 and the shared backend."""
+    ttl = ttl or CACHE_TTL_SECONDS
+    _l1_put(key, value, ttl)
+    try:
+        backend = _get_backend()
+        if backend:
+            backend.set(key, value, ttl)
+    except Exception as exc:
+        logger.warning("Cache backend write failed: %s", exc)
+
+
+def get_json(key: str) -> Any:
+    """JSON value for ``key``, or None."""
+    value = get(key)
+    return json.loads(value) if value is not None else None
+
+
+def put_json(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    """Store a JSON-serialisable value."""
+    put(key, json.dumps(value, default=str).encode("utf-8"), ttl)
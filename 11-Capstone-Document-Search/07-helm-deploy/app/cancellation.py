@@ -0,0 +1,267 @@
+"""
+Cooperative cancellation for document processing.
+
+A ``CancelToken`` is made for each unit of work (a Streamlit run, a worker
+batch) and made current with ``use(token)``. Long-running code calls
+``check()`` between steps (pages, OCR batches, LLM calls) and stops with
+``Cancelled`` once the token is cancelled.
+
+A time budget set with ``deadline(seconds)`` travels the same way: once it
+has passed, ``check()`` raises ``DeadlineExceeded`` and ``timeout()`` caps
+request timeouts to the time that is left, so callers can stop and keep
+what they already have.
+
+LLM requests made through ``http_session()`` register their connection on
+the current token, so cancelling also shuts the socket down and the
+blocked ``requests.post`` returns at once instead of running to completion.
+"""
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_THREADS = int(os.getenv("BACKGROUND_THREADS", "8"))
+# Keep-alive connections kept per LLM host; extra concurrent calls open
+# throwaway connections.
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", "10"))
+
+
+class Cancelled(RuntimeError):
+    """The work was abandoned (rerun, new upload, cancelled job)."""
+
+
+class DeadlineExceeded(Cancelled):
+    """The time budget set with ``deadline()`` ran out."""
+
+
+class CancelToken:
+    """Thread-safe flag plus callbacks run once when cancelled."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the work and run the registered callbacks (once)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info("Cancelling work: %s", reason)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:
+                logger.debug("Cancel callback failed: %s", exc)
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run ``callback`` on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback: Callable[[], None]) -> None:
+        """Forget a callback whose resource is no longer in use."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to ``timeout`` seconds; True when cancelled meanwhile."""
+        return self._event.wait(timeout)
+
+
+_current: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+
+def current() -> Optional[CancelToken]:
+    """The token of the work running in this thread/context, if any."""
+    return _current.get()
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+@contextmanager
+def use(token: CancelToken) -> Iterator[CancelToken]:
+    """Make ``token`` current for the block."""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Give the block at most ``seconds`` (no limit when None or <= 0).
+
+    A deadline inside another keeps whichever ends first.
+    """
+    ends = _deadline.get()
+    if seconds is not None and seconds > 0:
+        own = time.monotonic() + seconds
+        ends = own if ends is None else min(ends, own)
+    reset = _deadline.set(ends)
+    try:
+        yield
+    finally:
+        _deadline.reset(reset)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    ends = _deadline.get()
+    return None if ends is None else max(ends - time.monotonic(), 0.0)
+
+
+def expired() -> bool:
+    """True once the current deadline has passed."""
+    return remaining() == 0.0
+
+
+def timeout(default: float) -> float:
+    """``default`` capped to the time left before the current deadline."""
+    left = remaining()
+    return default if left is None else max(min(default, left), 0.001)
+
+
+def check(stage: str = "processing") -> None:
+    """Raise ``Cancelled`` if the current work was cancelled or ran out of time."""
+    token = _current.get()
+    if token is not None and token.cancelled:
+        metrics.inc("docproc_cancelled_total", stage=stage)
+        raise Cancelled(f"{stage} cancelled: {token.reason}")
+    if expired():
+        metrics.inc("docproc_deadline_exceeded_total", stage=stage)
+        raise DeadlineExceeded(f"{stage} ran out of time")
+
+
+def _abort_connection(conn) -> None:
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _CancellableMixin:
+    """Registers the connection on the current token for each request."""
+
+    def request(self, *args, **kwargs):
+        token = _current.get()
+        if token is not None:
+            abort = getattr(self, "_abort_callback", None)
+            if abort is None:
+                abort = self._abort_callback = lambda: _abort_connection(self)
+            token.on_cancel(abort)
+        return super().request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            token = _current.get()
+            abort = getattr(self, "_abort_callback", None)
+            if token is not None and abort is not None and not token.cancelled:
+                # Reading the body of a small JSON reply is quick; keeping
+                # the callback would shut down a pooled keep-alive socket.
+                token.discard(abort)
+
+
+class _CancellableHTTPConnection(_CancellableMixin, HTTPConnection):
+    pass
+
+
+class _CancellableHTTPSConnection(_CancellableMixin, HTTPSConnection):
+    pass
+
+
+class _CancellableHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _CancellableHTTPConnection
+
+
+class _CancellableHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+
+class CancellableAdapter(HTTPAdapter):
+    """HTTP adapter whose in-flight requests abort when their token is cancelled."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CancellableHTTPPool,
+            "https": _CancellableHTTPSPool,
+        }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def submit(token: CancelToken, func: Callable, *args, **kwargs) -> Future:
+    """Run ``func`` on a background thread with ``token`` current.
+
+    Lets a caller that must stay responsive (the Streamlit script thread)
+    wait in short steps and cancel the work when it is interrupted. The
+    caller's deadline, if any, applies to the work as well.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=BACKGROUND_THREADS, thread_name_prefix="docproc-work"
+            )
+
+    def run():
+        with use(token):
+            return func(*args, **kwargs)
+
+    return _executor.submit(contextvars.copy_context().run, run)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    """Process-wide ``requests`` session with cancellable connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = CancellableAdapter(pool_maxsize=LLM_POOL_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
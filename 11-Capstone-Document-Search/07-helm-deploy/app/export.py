@@ -0,0 +1,31 @@
+"""
+Excel export of extracted records, shared by the Streamlit UI and the API.
+"""
+from io import BytesIO
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+
+import memprofile
+
+RECORDS_SHEET = "License Renewal Data"
+ENTRIES_SHEET = "Archive Entries"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def records_to_xlsx(
+    rows: Union[Dict, List[Dict]], entries: Optional[List[Dict]] = None
+) -> bytes:
+    """Workbook bytes with the records, plus per-file archive status rows."""
+    rows = rows if isinstance(rows, list) else [rows]
+    with memprofile.document(f"export-{len(rows)}-rows"):
+        with memprofile.stage("dataframe"):
+            df = pd.DataFrame(rows)
+            entries_df = pd.DataFrame(entries) if entries else None
+        with memprofile.stage("excel"):
+            output = BytesIO()
+            with pd.ExcelWriter(output, engine="openpyxl") as writer:
+                df.to_excel(writer, index=False, sheet_name=RECORDS_SHEET)
+                if entries_df is not None:
+                    entries_df.to_excel(writer, index=False, sheet_name=ENTRIES_SHEET)
+            return output.getvalue()
@@ -0,0 +1,140 @@
+"""
+Optional HTTP/2 transport for LLM calls.
+
+With ``LLM_HTTP_VERSION=2`` every chat completions request goes through one
+process-wide ``httpx`` client that multiplexes the requests in flight as
+streams over at most ``LLM_HTTP2_CONNECTIONS`` connections, instead of one
+HTTP/1.1 connection (and socket) per concurrent request. Over https the
+protocol is negotiated with ALPN, so servers without HTTP/2 still work;
+plain http endpoints are spoken to in HTTP/2 directly (prior knowledge).
+
+Requests from all threads are handed to one background event loop running
+an ``httpx.AsyncClient``, so streams on a connection are opened in order
+and no thread waits on another's reads. Cancelling the current token
+resets just that request's stream, leaving the connection to the others.
+
+Requires the optional ``httpx[http2]`` package; without it the app logs a
+warning and stays on HTTP/1.1. Responses and errors are converted to their
+``requests`` equivalents, so callers handle both transports alike.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import cancellation
+
+logger = logging.getLogger(__name__)
+
+LLM_HTTP_VERSION = os.getenv("LLM_HTTP_VERSION", "1.1")
+LLM_HTTP2_CONNECTIONS = int(os.getenv("LLM_HTTP2_CONNECTIONS", "4"))
+
+_clients: Dict[bool, object] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_enabled: Optional[bool] = None
+
+
+def available() -> bool:
+    """True when ``httpx`` with HTTP/2 support is installed."""
+    try:
+        import h2  # noqa: F401
+        import httpx  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def enabled() -> bool:
+    """True when LLM calls should use HTTP/2 (decided once per process)."""
+    global _enabled
+    if _enabled is None:
+        _enabled = LLM_HTTP_VERSION in ("2", "2.0")
+        if _enabled and not available():
+            logger.warning("LLM_HTTP_VERSION=2 needs httpx[http2]; using HTTP/1.1")
+            _enabled = False
+    return _enabled
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="docproc-http2", daemon=True).start()
+        return _loop
+
+
+def _client(url: str):
+    """The client for ``url``'s scheme; only used on the event loop thread."""
+    import httpx
+
+    # Cleartext endpoints have no ALPN to negotiate HTTP/2 with.
+    cleartext = urlsplit(url).scheme == "http"
+    client = _clients.get(cleartext)
+    if client is None:
+        client = httpx.AsyncClient(
+            http1=not cleartext,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP2_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP2_CONNECTIONS,
+            ),
+        )
+        _clients[cleartext] = client
+    return client
+
+
+async def _send(method: str, url: str, headers, json, timeout):
+    return await _client(url).request(method, url, headers=headers, json=json, timeout=timeout)
+
+
+def _to_requests(response, url: str) -> requests.Response:
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.reason = response.reason_phrase
+    converted.headers = CaseInsensitiveDict(response.headers)
+    converted._content = response.content
+    converted.encoding = response.encoding
+    converted.url = url
+    return converted
+
+
+def request(
+    method: str,
+    url: str,
+    headers: Optional[Dict] = None,
+    json: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> requests.Response:
+    """Send one request over the shared HTTP/2 client.
+
+    Raises ``requests.Timeout`` and ``requests.ConnectionError`` like the
+    HTTP/1.1 session does, including when the current cancel token fires.
+    """
+    import httpx
+
+    future = asyncio.run_coroutine_threadsafe(
+        _send(method, url, headers, json, timeout), _event_loop()
+    )
+    token = cancellation.current()
+    if token is not None:
+        token.on_cancel(future.cancel)
+    try:
+        response = future.result()
+    except concurrent.futures.CancelledError as exc:
+        raise requests.ConnectionError("HTTP/2 request aborted") from exc
+    except httpx.TimeoutException as exc:
+        raise requests.Timeout(str(exc)) from exc
+    except httpx.TransportError as exc:
+        raise requests.ConnectionError(str(exc)) from exc
+    finally:
+        if token is not None:
+            token.discard(future.cancel)
+    return _to_requests(response, url)
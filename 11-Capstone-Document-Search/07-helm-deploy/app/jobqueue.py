@@ -0,0 +1,590 @@
+"""
+Job queue between the Streamlit UI and the processing workers.
+
+The UI submits each PDF as a job; ``worker.py`` processes jobs and writes
+the result back onto the job record, which the UI polls. The backend is
+chosen with ``QUEUE_BACKEND``:
+
+- ``local`` (default) a directory (``QUEUE_DIR``). Claims are atomic
+  renames, so several worker processes on one host (or on a shared
+  ReadWriteMany volume) can consume it safely. This is the stand-in used
+  for development and single-node setups.
+- ``redis`` a Redis list plus per-job keys at ``QUEUE_URL`` (Redis 6.2 or
+  later: claims move a job atomically onto a list of claimed jobs).
+
+Job records are plain dicts: ``id``, ``filename``, ``status`` (queued,
+running, done, failed, cancelled), timestamps, ``attempts``, ``result`` /
+``error`` and ``cancel_requested``.
+
+A claim is a lease of ``JOB_LEASE_SECONDS`` that the worker renews while
+it processes the job (``renew_lease``). Claims whose lease ran out, because
+the worker crashed or lost its node, are put back on the queue by the next
+``claim_job`` (at most every ``REQUEUE_SWEEP_SECONDS``) or at worker
+start-up (``requeue_stale``); after ``JOB_MAX_ATTEMPTS`` claims the job
+fails instead of being retried again.
+
+Job records change through ``update``, an atomic read-modify-write (a
+WATCH transaction on Redis, a lock file on the local queue), so a cancel
+and a completion arriving together cannot overwrite each other.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+import cancellation
+import schemas
+
+logger = logging.getLogger(__name__)
+
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "local").lower()
+QUEUE_DIR = os.getenv("QUEUE_DIR") or os.path.join(tempfile.gettempdir(), "docproc-queue")
+QUEUE_URL = os.getenv("QUEUE_URL", "redis://localhost:6379/0")
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+REQUEUE_SWEEP_SECONDS = float(os.getenv("REQUEUE_SWEEP_SECONDS", "15"))
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+Payload = Union[bytes, BinaryIO]
+Change = Callable[[Dict], Dict]
+
+
+def _chunks(payload: Payload):
+    """The payload in ``UPLOAD_CHUNK_BYTES`` pieces, read from the stream if it is one."""
+    if isinstance(payload, (bytes, bytearray)):
+        for start in range(0, len(payload), UPLOAD_CHUNK_BYTES):
+            yield payload[start:start + UPLOAD_CHUNK_BYTES]
+        return
+    payload.seek(0)
+    yield from iter(lambda: payload.read(UPLOAD_CHUNK_BYTES), b"")
+
+
+class LocalQueue:
+    """Directory-backed queue: pending/, running/, jobs/ and blobs/."""
+
+    def __init__(self, root: str):
+        self._root = root
+        for name in ("pending", "running", "jobs", "blobs"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _path(self, folder: str, name: str) -> str:
+        return os.path.join(self._root, folder, name)
+
+    def _write(self, path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+
+    def save(self, job: Dict) -> None:
+        self._write(self._path("jobs", f"{job['id']}.json"), json.dumps(job).encode())
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path("jobs", f"{job_id}.json"), "rb") as handle:
+                return json.loads(handle.read())
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id: str, change: Change) -> Optional[Dict]:
+        # One lock for every record: the changes are a few small writes.
+        with open(os.path.join(self._root, "update.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            job = self.load(job_id)
+            if job is None:
+                return None
+            job = change(job)
+            self.save(job)
+            return job
+
+    def enqueue(self, job: Dict, payload: Payload) -> None:
+        path = self._path("blobs", f"{job['id']}.pdf")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as handle:
+            for chunk in _chunks(payload):
+                handle.write(chunk)
+        os.replace(tmp_path, path)
+        self.save(job)
+        self.push(job)
+
+    def push(self, job: Dict) -> None:
+        # Zero-padded submit time keeps pending/ in FIFO order.
+        name = f"{int(job['submitted_at'] * 1000):015d}-{job['id']}"
+        self._write(self._path("pending", name), b"")
+
+    def claim(self, timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + timeout
+        while True:
+            for name in sorted(os.listdir(self._path("pending", ""))):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    os.rename(self._path("pending", name), self._path("running", name))
+                except FileNotFoundError:
+                    continue  # another worker claimed it first
+                # The lease runs from the claim: rename keeps the old mtime.
+                os.utime(self._path("running", name))
+                return name.split("-", 1)[1]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.2)
+
+    def _running_name(self, job_id: str) -> Optional[str]:
+        for name in os.listdir(self._path("running", "")):
+            if name.endswith(job_id):
+                return name
+        return None
+
+    def renew(self, job_id: str) -> None:
+        name = self._running_name(job_id)
+        if name is not None:
+            try:
+                os.utime(self._path("running", name))
+            except FileNotFoundError:
+                pass
+
+    def _is_stale(self, name: str, lease: float) -> bool:
+        try:
+            stat = os.stat(self._path("running", name))
+        except FileNotFoundError:
+            return False
+        # ctime covers the rename of a claim made just before utime.
+        return max(stat.st_mtime, stat.st_ctime) < time.time() - lease
+
+    def stale_claims(self, lease: float) -> List[str]:
+        return [
+            name.split("-", 1)[1]
+            for name in os.listdir(self._path("running", ""))
+            if self._is_stale(name, lease)
+        ]
+
+    def reclaim(self, job_id: str, lease: float, requeue: bool) -> bool:
+        name = self._running_name(job_id)
+        if name is None or not self._is_stale(name, lease):
+            return False  # finished or renewed meanwhile
+        try:
+            if requeue:
+                os.rename(self._path("running", name), self._path("pending", name))
+            else:
+                os.remove(self._path("running", name))
+        except FileNotFoundError:
+            return False  # another sweep got there first
+        return True
+
+    def payload(self, job_id: str) -> Optional[bytes]:
+        try:
+            with open(self._path("blobs", f"{job_id}.pdf"), "rb") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+    def finish(self, job_id: str) -> None:
+        name = self._running_name(job_id)
+        for path in (
+            self._path("running", name) if name else None,
+            self._path("blobs", f"{job_id}.pdf"),
+        ):
+            try:
+                if path:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def depth(self) -> int:
+        return sum(1 for name in os.listdir(self._path("pending", "")) if not name.endswith(".tmp"))
+
+    def oldest_submitted_at(self) -> Optional[float]:
+        names = sorted(
+            name for name in os.listdir(self._path("pending", "")) if not name.endswith(".tmp")
+        )
+        return int(names[0].split("-", 1)[0]) / 1000 if names else None
+
+
+class RedisQueue:
+    """Redis list ``docproc:jobs:queue`` plus ``docproc:job:<id>`` keys.
+
+    A claim moves the job id onto the list ``docproc:jobs:claimed`` in one
+    command (BLMOVE), so a job is on one of the two lists at all times. Its
+    lease sits in the sorted set ``docproc:jobs:running``, scored by when
+    it runs out; a claimed job without a lease (its worker died right after
+    BLMOVE) gets one at the next sweep.
+    """
+
+    QUEUE_KEY = "docproc:jobs:queue"
+    CLAIMED_KEY = "docproc:jobs:claimed"
+    RUNNING_KEY = "docproc:jobs:running"
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis
+        self._client = redis.Redis.from_url(url, socket_timeout=30)
+
+    def save(self, job: Dict) -> None:
+        self._client.set(f"docproc:job:{job['id']}", json.dumps(job), ex=JOB_TTL_SECONDS)
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        data = self._client.get(f"docproc:job:{job_id}")
+        return json.loads(data) if data else None
+
+    def update(self, job_id: str, change: Change) -> Optional[Dict]:
+        key = f"docproc:job:{job_id}"
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if not data:
+                        return None
+                    job = change(json.loads(data))
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job), ex=JOB_TTL_SECONDS)
+                    pipe.execute()
+                    return job
+                except self._redis.WatchError:
+                    continue  # changed meanwhile: apply the change again
+
+    def enqueue(self, job: Dict, payload: Payload) -> None:
+        key = f"docproc:job:{job['id']}:pdf"
+        # Appended chunk by chunk, so a large upload is never one more
+        # in-memory copy here.
+        self._client.set(key, b"", ex=JOB_TTL_SECONDS)
+        for chunk in _chunks(payload):
+            self._client.append(key, chunk)
+        self.save(job)
+        self._client.lpush(self.QUEUE_KEY, job["id"])
+
+    def push(self, job: Dict) -> None:
+        # Right-hand end: a retried job is the next one claimed.
+        self._client.rpush(self.QUEUE_KEY, job["id"])
+
+    def claim(self, timeout: float) -> Optional[str]:
+        item = self._client.blmove(
+            self.QUEUE_KEY, self.CLAIMED_KEY, max(int(timeout), 1), "RIGHT", "LEFT"
+        )
+        if not item:
+            return None
+        job_id = item.decode()
+        self._client.zadd(self.RUNNING_KEY, {job_id: time.time() + JOB_LEASE_SECONDS})
+        return job_id
+
+    def renew(self, job_id: str) -> None:
+        self._client.zadd(self.RUNNING_KEY, {job_id: time.time() + JOB_LEASE_SECONDS}, xx=True)
+
+    def stale_claims(self, lease: float) -> List[str]:
+        claimed = self._client.lrange(self.CLAIMED_KEY, 0, -1)
+        if claimed:
+            # Start a lease for claims whose worker never got to record one.
+            self._client.zadd(
+                self.RUNNING_KEY, {job_id: time.time() + lease for job_id in claimed}, nx=True
+            )
+        # Scores already include the lease.
+        return [
+            job_id.decode()
+            for job_id in self._client.zrangebyscore(self.RUNNING_KEY, "-inf", time.time())
+        ]
+
+    def reclaim(self, job_id: str, lease: float, requeue: bool) -> bool:
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.CLAIMED_KEY, self.RUNNING_KEY)
+                    expires = pipe.zscore(self.RUNNING_KEY, job_id)
+                    if expires is None or expires > time.time():
+                        return False  # finished or renewed meanwhile
+                    pipe.multi()
+                    pipe.lrem(self.CLAIMED_KEY, 1, job_id)
+                    pipe.zrem(self.RUNNING_KEY, job_id)
+                    if requeue:
+                        pipe.rpush(self.QUEUE_KEY, job_id)
+                    pipe.execute()
+                    return True
+                except self._redis.WatchError:
+                    continue
+
+    def payload(self, job_id: str) -> Optional[bytes]:
+        return self._client.get(f"docproc:job:{job_id}:pdf")
+
+    def finish(self, job_id: str) -> None:
+        with self._client.pipeline() as pipe:
+            pipe.lrem(self.CLAIMED_KEY, 1, job_id)
+            pipe.zrem(self.RUNNING_KEY, job_id)
+            pipe.delete(f"docproc:job:{job_id}:pdf")
+            pipe.execute()
+
+    def depth(self) -> int:
+        return int(self._client.llen(self.QUEUE_KEY))
+
+    def oldest_submitted_at(self) -> Optional[float]:
+        # LPUSH adds on the left, so the oldest job is the right-most one.
+        job_id = self._client.lindex(self.QUEUE_KEY, -1)
+        job = self.load(job_id.decode()) if job_id else None
+        return job["submitted_at"] if job else None
+
+
+_queue = None
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def get_queue():
+    """The configured queue backend (created on first use)."""
+    global _queue
+    if _queue is None:
+        if QUEUE_BACKEND == "local":
+            _queue = LocalQueue(QUEUE_DIR)
+        elif QUEUE_BACKEND == "redis":
+            _queue = RedisQueue(QUEUE_URL)
+        else:
+            raise ValueError(f"Unknown QUEUE_BACKEND: {QUEUE_BACKEND}")
+    return _queue
+
+
+def submit_job(
+    filename: str, payload: Payload, schema: Optional[str] = None, size: Optional[int] = None
+) -> str:
+    """Queue one PDF for processing and return the job id.
+
+    ``payload`` is the PDF bytes or a binary stream, which is copied to the
+    queue in chunks (give its ``size``). ``schema`` names the field schema to
+    extract with; by default the one in use by the caller.
+    """
+    if size is None:
+        size = len(payload) if isinstance(payload, (bytes, bytearray)) else 0
+    job = {
+        "id": uuid.uuid4().hex,
+        "filename": filename,
+        "schema": schemas.validate(schema or schemas.current_name()),
+        "size": size,
+        "status": "queued",
+        "submitted_at": time.time(),
+        "started_at": None,
+        "attempts": 0,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "cancel_requested": False,
+    }
+    get_queue().enqueue(job, payload)
+    logger.info("Queued job %s for %s", job["id"], filename)
+    return job["id"]
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Current job record, or None when unknown or expired."""
+    return get_queue().load(job_id)
+
+
+def claim_job(timeout: float = 5.0) -> Optional[Dict]:
+    """Take the next job off the queue (worker side) and mark it running.
+
+    The caller keeps the claim with ``renew_lease`` while it works.
+    """
+    queue = get_queue()
+    _maybe_requeue_stale()
+    job_id = queue.claim(timeout)
+    if job_id is None:
+        return None
+
+    def start(job: Dict) -> Dict:
+        if not job.get("cancel_requested"):
+            job.update(status="running", started_at=time.time(), attempts=job.get("attempts", 0) + 1)
+        return job
+
+    job = queue.update(job_id, start)
+    if job is None or job["status"] != "running":
+        if job is not None:
+            _finish(job, "cancelled", "Cancelled before processing started.")
+        queue.finish(job_id)
+        return None
+    return job
+
+
+def renew_lease(job_id: str) -> None:
+    """Extend a claimed job's lease by ``JOB_LEASE_SECONDS`` from now."""
+    get_queue().renew(job_id)
+
+
+def requeue_stale() -> List[str]:
+    """Put claimed jobs whose lease ran out back on the queue.
+
+    Jobs that were already claimed ``JOB_MAX_ATTEMPTS`` times fail
+    instead, and cancelled ones are finished as cancelled. Returns the ids
+    put back.
+    """
+    queue = get_queue()
+    requeued = []
+    for job_id in queue.stale_claims(JOB_LEASE_SECONDS):
+        job = queue.load(job_id)
+        retry = bool(
+            job
+            and job["status"] not in FINISHED_STATUSES
+            and not job.get("cancel_requested")
+            and job.get("attempts", 1) < JOB_MAX_ATTEMPTS
+        )
+        # Taking the claim and putting the job back is one step, so the job
+        # is never off both the queue and the claims.
+        if not queue.reclaim(job_id, JOB_LEASE_SECONDS, requeue=retry):
+            continue  # renewed, finished or swept by someone else meanwhile
+        if job is None or job["status"] in FINISHED_STATUSES:
+            continue
+        if retry:
+            logger.warning("Job %s lost its worker; putting it back on the queue", job_id)
+            queue.update(job_id, lambda current: _requeued(current, job["attempts"]))
+            requeued.append(job_id)
+        elif job.get("cancel_requested"):
+            _finish(job, "cancelled", "Cancelled while processing.")
+        else:
+            logger.warning("Job %s lost its worker %s times; giving up", job_id, job["attempts"])
+            _finish(
+                job, "failed", f"Processing stopped without a result {job['attempts']} times."
+            )
+    return requeued
+
+
+def _requeued(job: Dict, attempts: int) -> Dict:
+    # A worker may already have claimed the job again: leave that claim be.
+    if job["status"] == "running" and job.get("attempts") == attempts:
+        job.update(status="queued", started_at=None)
+    return job
+
+
+def _maybe_requeue_stale() -> None:
+    global _last_sweep
+    with _sweep_lock:
+        now = time.monotonic()
+        if now - _last_sweep < REQUEUE_SWEEP_SECONDS:
+            return
+        _last_sweep = now
+    try:
+        requeue_stale()
+    except Exception as exc:
+        logger.warning("Could not requeue stale jobs: %s", exc)
+
+
+def job_payload(job_id: str) -> Optional[bytes]:
+    """PDF bytes submitted with the job."""
+    return get_queue().payload(job_id)
+
+
+def _finish(job: Dict, status: str, error: Optional[str], result: Optional[Dict] = None) -> None:
+    """Store the outcome, as "cancelled" if a cancel was recorded meanwhile."""
+
+    def finish(current: Dict) -> Dict:
+        if current.get("cancel_requested") and status != "cancelled":
+            current.update(
+                status="cancelled", result=None, error="Cancelled while processing."
+            )
+        else:
+            current.update(status=status, result=result, error=error)
+        current["finished_at"] = time.time()
+        return current
+
+    queue = get_queue()
+    stored = queue.update(job["id"], finish)
+    if stored is None:
+        stored = finish(job)
+        queue.save(stored)
+    job.update(stored)
+    queue.finish(job["id"])
+
+
+def complete_job(job: Dict, result: Dict) -> None:
+    """Store the pipeline result on the job and release its payload."""
+    _finish(
+        job,
+        "failed" if result.get("record") is None else "done",
+        result.get("error"),
+        result,
+    )
+
+
+def fail_job(job: Dict, error: str) -> None:
+    """Mark a job failed (or cancelled, if that was asked for) without a result."""
+    _finish(job, "failed", error)
+
+
+def cancel_job(job_id: str) -> None:
+    """Ask for a job to be abandoned.
+
+    A queued job is skipped when claimed; a running job's worker polls the
+    flag and aborts its extraction and LLM calls.
+    """
+
+    def cancel(job: Dict) -> Dict:
+        if job["status"] not in FINISHED_STATUSES:
+            job["cancel_requested"] = True
+        return job
+
+    job = get_queue().update(job_id, cancel)
+    if job is None or not job.get("cancel_requested"):
+        return
+    logger.info("Cancellation requested for job %s", job_id)
+
+
+def cancel_requested(job_id: str) -> bool:
+    """Whether someone asked for this job to be abandoned."""
+    job = get_queue().load(job_id)
+    return bool(job and job.get("cancel_requested"))
+
+
+def queue_depth() -> int:
+    """Jobs waiting to be claimed."""
+    return get_queue().depth()
+
+
+def oldest_job_age() -> float:
+    """Seconds the oldest unclaimed job has been waiting (0 when empty)."""
+    submitted_at = get_queue().oldest_submitted_at()
+    return max(time.time() - submitted_at, 0.0) if submitted_at else 0.0
+
+
+def wait_for_jobs(job_ids: List[str], timeout: float, poll: float = 0.5) -> List[Optional[Dict]]:
+    """Poll until every job has finished or ``timeout`` seconds pass."""
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = [get_job(job_id) for job_id in job_ids]
+        finished = all(job and job["status"] in FINISHED_STATUSES for job in jobs)
+        if finished or time.monotonic() >= deadline:
+            return jobs
+        time.sleep(poll)
+
+
+def run_jobs(documents: List[Tuple[str, BinaryIO, int]], timeout: float) -> List[Dict]:
+    """Process documents on the worker tier and wait for their results.
+
+    The queue counterpart of ``pipeline.process_documents``: returns one
+    pipeline result per (filename, upload, size) document. The jobs are
+    cancelled if the current cancel token fires while waiting.
+    """
+    job_ids = [submit_job(filename, upload, size=size) for filename, upload, size in documents]
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            cancellation.check("queue")
+            jobs = wait_for_jobs(job_ids, timeout=1.0)
+            finished = all(job and job["status"] in FINISHED_STATUSES for job in jobs)
+            if finished or time.monotonic() >= deadline:
+                break
+    except cancellation.Cancelled:
+        for job_id in job_ids:
+            cancel_job(job_id)
+        raise
+    results = []
+    for (filename, _, _), job in zip(documents, jobs):
+        if job and job["status"] in FINISHED_STATUSES and job["result"]:
+            results.append({**job["result"], "filename": filename})
+            continue
+        if job and job["status"] in FINISHED_STATUSES:
+            error = job["error"]
+        else:
+            error = f"Still processing after {timeout:.0f}s."
+        results.append({"filename": filename, "record": None, "error": error, "usage": None})
+    return results
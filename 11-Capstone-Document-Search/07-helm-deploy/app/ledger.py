@@ -0,0 +1,197 @@
+"""
+Append-only ledger of LLM calls.
+
+Every chat completions call (successful or not) is written as one row to a
+SQLite file at ``LEDGER_PATH``: time, model, endpoint, documents in the
+request, token counts, wall time, retries and estimated cost. Triggers
+reject UPDATE and DELETE, so the table only ever grows. Set
+``LEDGER_PATH`` to an empty string to turn the ledger off.
+
+Summaries per day and model feed the app's usage view; the same report is
+available from the command line:
+
+    python app/ledger.py --days 7
+    python app/ledger.py --days 30 --by model --csv
+"""
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv("LEDGER_PATH", "/tmp/docproc-ledger.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    model TEXT,
+    endpoint TEXT,
+    status TEXT NOT NULL,
+    http_status INTEGER,
+    documents INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_seconds REAL NOT NULL,
+    retries INTEGER NOT NULL,
+    estimated_cost REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS llm_calls_day ON llm_calls (day, model);
+CREATE TRIGGER IF NOT EXISTS llm_calls_no_update BEFORE UPDATE ON llm_calls
+BEGIN SELECT RAISE(ABORT, 'the LLM ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS llm_calls_no_delete BEFORE DELETE ON llm_calls
+BEGIN SELECT RAISE(ABORT, 'the LLM ledger is append-only'); END;
+"""
+
+# Grouping columns the summary accepts, mapped to SQL expressions.
+GROUPINGS = {"day": "day", "model": "model", "endpoint": "endpoint", "status": "status"}
+
+_local = threading.local()
+
+
+def _connect() -> Optional[sqlite3.Connection]:
+    if not LEDGER_PATH:
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LEDGER_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(LEDGER_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def record_call(
+    model: Optional[str],
+    endpoint: Optional[str],
+    documents: int,
+    usage: Optional[Dict] = None,
+    latency_seconds: float = 0.0,
+    retries: int = 0,
+    status: str = "ok",
+    http_status: Optional[int] = None,
+    error: Optional[str] = None,
+) -> None:
+    """Append one LLM call. Failures are logged, never raised."""
+    usage = usage or {}
+    now = time.time()
+    try:
+        conn = _connect()
+        if conn is None:
+            return
+        conn.execute(
+            "INSERT INTO llm_calls (ts, day, model, endpoint, status, http_status, "
+            "documents, prompt_tokens, completion_tokens, cached_tokens, "
+            "latency_seconds, retries, estimated_cost, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                now,
+                time.strftime("%Y-%m-%d", time.gmtime(now)),
+                model,
+                endpoint,
+                status,
+                http_status,
+                documents,
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                usage.get("cached_tokens", 0),
+                round(latency_seconds, 3),
+                retries,
+                usage.get("estimated_cost", 0.0),
+                (error or "")[:500] or None,
+            ),
+        )
+    except sqlite3.Error as exc:
+        logger.warning("Could not write LLM ledger entry: %s", exc)
+
+
+def summary(days: int = 7, by: Sequence[str] = ("day", "model")) -> List[Dict]:
+    """Calls, tokens, latency and cost per group over the last ``days`` days."""
+    columns = [GROUPINGS[name] for name in by]
+    conn = _connect()
+    if conn is None:
+        return []
+    since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+    group = ", ".join(columns)
+    cursor = conn.execute(
+        f"SELECT {group}, COUNT(*), SUM(status != 'ok'), SUM(documents), "
+        "SUM(prompt_tokens), SUM(cached_tokens), SUM(completion_tokens), "
+        "AVG(latency_seconds), MAX(latency_seconds), SUM(retries), SUM(estimated_cost) "
+        f"FROM llm_calls WHERE day >= ? GROUP BY {group} ORDER BY {group}",
+        (since,),
+    )
+    stats = (
+        "calls",
+        "errors",
+        "documents",
+        "prompt_tokens",
+        "cached_tokens",
+        "completion_tokens",
+        "avg_latency_seconds",
+        "max_latency_seconds",
+        "retries",
+        "estimated_cost",
+    )
+    rows = []
+    for values in cursor.fetchall():
+        row = dict(zip(by, values[: len(by)]))
+        row.update(zip(stats, values[len(by):]))
+        for name in ("avg_latency_seconds", "max_latency_seconds"):
+            row[name] = round(row[name] or 0, 3)
+        row["estimated_cost"] = round(row["estimated_cost"] or 0, 6)
+        row["cost_per_document"] = (
+            round(row["estimated_cost"] / row["documents"], 6) if row["documents"] else 0.0
+        )
+        rows.append(row)
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Summarise the LLM call ledger.")
+    parser.add_argument("--days", type=int, default=7, help="days to include (default 7)")
+    parser.add_argument(
+        "--by",
+        default="day,model",
+        help=f"comma-separated grouping, from: {', '.join(GROUPINGS)}",
+    )
+    parser.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+    args = parser.parse_args(argv)
+
+    by = [name.strip() for name in args.by.split(",") if name.strip()]
+    unknown = [name for name in by if name not in GROUPINGS]
+    if unknown or not by:
+        parser.error(f"unknown grouping: {', '.join(unknown) or '(none)'}")
+    if not LEDGER_PATH or not os.path.exists(LEDGER_PATH):
+        print(f"No ledger at {LEDGER_PATH or '(LEDGER_PATH is empty)'}", file=sys.stderr)
+        return 1
+
+    rows = summary(args.days, by)
+    if not rows:
+        print(f"No LLM calls in the last {args.days} days.")
+        return 0
+    if args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return 0
+    headers = list(rows[0])
+    cells = [[str(row[name]) for name in headers] for row in rows]
+    widths = [max(len(name), *(len(line[i]) for line in cells)) for i, name in enumerate(headers)]
+    print("  ".join(name.ljust(width) for name, width in zip(headers, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
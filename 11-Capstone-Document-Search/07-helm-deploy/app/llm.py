@@ -0,0 +1,627 @@
+"""
+LLM helpers for the License Renewal Document Processor.
+
+Builds extraction prompts, calls the OpenAI-compatible chat completions
+endpoint, and parses the JSON replies. Nothing here touches Streamlit:
+errors are raised (or returned per document) and the UI decides how to
+show them.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import cache
+import cancellation
+import http2_client
+import ledger
+import metrics
+import revisions
+import schemas
+from cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+# Packing: several short documents share one request so the fixed
+# instruction block is paid for once instead of once per document.
+PACK_TOKEN_BUDGET = int(os.getenv("LLM_PACK_TOKEN_BUDGET", "6000"))
+PACK_MAX_DOCUMENTS = int(os.getenv("LLM_PACK_MAX_DOCUMENTS", "8"))
+
+# Throttled, overloaded and unreachable endpoints are retried with
+# exponential backoff before the call fails.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "1"))
+# Per request; a document deadline (``cancellation.deadline``) caps it further.
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class LLMResponseError(ValueError):
+    """The endpoint answered, but not with anything we can use."""
+
+
+def chat_completions_url(endpoint: str) -> str:
+    """Accept a base URL (.../v1) or a full chat completions URL."""
+    endpoint = endpoint.rstrip("/") if endpoint else endpoint
+    if endpoint and not endpoint.endswith("/chat/completions"):
+        endpoint = f"{endpoint}/chat/completions"
+    return endpoint
+
+
+def estimate_cost(usage: Dict) -> float:
+    """Estimated USD cost of one call from its token counts.
+
+    Prices are per 1K tokens and come from the environment, because they
+    differ per provider and model. Cached prompt tokens are billed at the
+    cached rate when one is configured.
+    """
+    prompt_price = float(os.getenv("LLM_PRICE_PROMPT_PER_1K", "0") or 0)
+    cached_price = float(os.getenv("LLM_PRICE_CACHED_PER_1K", "") or prompt_price)
+    completion_price = float(os.getenv("LLM_PRICE_COMPLETION_PER_1K", "0") or 0)
+    cached = usage.get("cached_tokens", 0)
+    uncached = max(usage.get("prompt_tokens", 0) - cached, 0)
+    return (
+        uncached * prompt_price
+        + cached * cached_price
+        + usage.get("completion_tokens", 0) * completion_price
+    ) / 1000
+
+
+def parse_usage(payload: Dict, elapsed: float) -> Dict:
+    """Normalise the ``usage`` block of a chat completions reply."""
+    usage = payload.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    # OpenAI reports cached tokens under prompt_tokens_details; some
+    # compatible gateways use the Anthropic-style name instead.
+    cached = details.get("cached_tokens") or usage.get("cache_read_input_tokens") or 0
+    normalised = {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cached_tokens": int(cached),
+        "latency_seconds": round(elapsed, 3),
+    }
+    normalised["estimated_cost"] = round(estimate_cost(normalised), 6)
+    return normalised
+
+
+def split_usage(usage: Dict, weights: List[int]) -> List[Dict]:
+    """Share one request's usage between the documents packed into it."""
+    total = sum(weights) or 1
+    shares = []
+    for weight in weights:
+        fraction = weight / total
+        share = {
+            key: round(value * fraction, 6) if key == "estimated_cost" else value
+            for key, value in usage.items()
+        }
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            share[key] = round(usage.get(key, 0) * fraction)
+        share["shared_with"] = len(weights)
+        shares.append(share)
+    return shares
+
+
+def post_json(url: str, headers: Dict, body: Dict, timeout: float) -> requests.Response:
+    """POST over HTTP/2 when ``LLM_HTTP_VERSION=2``, else the shared session."""
+    if http2_client.enabled():
+        return http2_client.request("POST", url, headers=headers, json=body, timeout=timeout)
+    return cancellation.http_session().post(url, headers=headers, json=body, timeout=timeout)
+
+
+def _post_with_retries(endpoint: str, headers: Dict, body: Dict):
+    """POST to the endpoint, retrying throttling, 5xx and connection errors.
+
+    Returns the last response and the number of retries made; re-raises
+    the connection error when the final attempt did not get a response.
+    Raises ``Cancelled`` as soon as the current cancel token fires, which
+    also aborts the request in flight. Each request's timeout is capped to
+    the current deadline, and no retry is made whose back-off would not
+    leave time for another attempt (``DeadlineExceeded`` once it passed).
+    """
+    token = cancellation.current()
+    retries = 0
+    while True:
+        cancellation.check("llm")
+        response = None
+        try:
+            with metrics.track_inflight("docproc_llm_inflight_calls"):
+                response = post_json(
+                    endpoint, headers, body, cancellation.timeout(LLM_REQUEST_TIMEOUT_SECONDS)
+                )
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if token is not None and token.cancelled:
+                metrics.inc("docproc_llm_calls_aborted_total")
+                raise cancellation.Cancelled(f"LLM call aborted: {token.reason}") from exc
+            cancellation.check("llm")
+            if not _can_retry(retries):
+                exc.retries = retries
+                raise
+            logger.warning("LLM request failed (%s), retrying", exc)
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or not _can_retry(retries):
+                return response, retries
+            logger.warning("LLM endpoint returned %s, retrying", response.status_code)
+        retries += 1
+        metrics.inc("docproc_llm_retries_total")
+        delay = _retry_delay(retries)
+        if token is not None:
+            token.wait(delay)
+        else:
+            time.sleep(delay)
+
+
+def _retry_delay(retry: int) -> float:
+    return LLM_RETRY_BACKOFF_SECONDS * 2 ** (retry - 1)
+
+
+def _can_retry(retries: int) -> bool:
+    """Retries left, and time left after the back-off for another attempt."""
+    if retries >= LLM_MAX_RETRIES:
+        return False
+    left = cancellation.remaining()
+    return left is None or left > _retry_delay(retries + 1)
+
+
+def _failure_status(exc: Exception) -> str:
+    if isinstance(exc, cancellation.DeadlineExceeded):
+        return "deadline"
+    if isinstance(exc, cancellation.Cancelled):
+        return "cancelled"
+    return "error"
+
+
+def call_llm(messages: List[Dict], documents: int = 1) -> Tuple[str, Dict]:
+    """Call OpenAI-compatible chat completions endpoint.
+
+    Returns the reply text and the normalised token usage for the call.
+    Every call, including failed ones, is appended to the ``ledger`` with
+    ``documents`` as the number of documents in the request.
+    """
+    endpoint = chat_completions_url(os.getenv("LLM_API_ENDPOINT"))
+    api_key = os.getenv("LLM_API_KEY")
+    model = os.getenv("LLM_MODEL")
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    body = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.1,
+    }
+
+    # Out of time before the request was made: nothing to record.
+    cancellation.check("llm")
+    logger.info("Calling LLM endpoint: %s model=%s", endpoint, model)
+    started = time.perf_counter()
+    try:
+        response, retries = _post_with_retries(endpoint, headers, body)
+    except (requests.RequestException, cancellation.Cancelled) as exc:
+        ledger.record_call(
+            model,
+            endpoint,
+            documents,
+            latency_seconds=time.perf_counter() - started,
+            retries=getattr(exc, "retries", 0),
+            status=_failure_status(exc),
+            error=str(exc),
+        )
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.observe_cold_start(
+        "docproc_llm_call_seconds", elapsed, "docproc_llm_first_call_seconds"
+    )
+    try:
+        response.raise_for_status()
+        payload = response.json()
+    except (requests.HTTPError, ValueError) as exc:
+        ledger.record_call(
+            model,
+            endpoint,
+            documents,
+            latency_seconds=elapsed,
+            retries=retries,
+            status="error",
+            http_status=response.status_code,
+            error=str(exc),
+        )
+        raise
+    usage = parse_usage(payload, elapsed)
+    usage["retries"] = retries
+    ledger.record_call(
+        model,
+        endpoint,
+        documents,
+        usage,
+        latency_seconds=elapsed,
+        retries=retries,
+        http_status=response.status_code,
+    )
+    logger.info(
+        "LLM usage: prompt=%s cached=%s completion=%s latency=%.2fs",
+        usage["prompt_tokens"],
+        usage["cached_tokens"],
+        usage["completion_tokens"],
+        usage["latency_seconds"],
+    )
+
+    choices = payload.get("choices") or []
+    if not choices:
+        logger.error("LLM response missing choices: %s", payload)
+        raise LLMResponseError("Empty response from LLM endpoint")
+
+    message = choices[0].get("message") or {}
+    content = message.get("content")
+    if not content:
+        # Some providers return plain text under "text"
+        content = choices[0].get("text")
+    if not content:
+        raise LLMResponseError("LLM response did not include message content")
+    return content, usage
+
+
+# The static instructions (generated from the field schema in use, see
+# ``schemas``) live in the system message and the document is appended
+# last, so every request shares the same prefix and providers with prefix
+# caching only bill the document itself at the full rate.
+def build_extraction_messages(text_content: str) -> List[Dict]:
+    """Messages for a single document."""
+    return [
+        {"role": "system", "content": schemas.system_prompt()},
+        {"role": "user", "content": f"Document content:\n\n{text_content}"},
+    ]
+
+
+def build_packed_messages(texts: List[str]) -> List[Dict]:
+    """Messages for several documents, each wrapped in numbered markers."""
+    sections = "\n\n".join(
+        f"=== DOCUMENT {number} START ===\n{text}\n=== DOCUMENT {number} END ==="
+        for number, text in enumerate(texts, start=1)
+    )
+    return [
+        {"role": "system", "content": schemas.packed_system_prompt()},
+        {"role": "user", "content": f"{len(texts)} documents:\n\n{sections}"},
+    ]
+
+
+def parse_json_object(text_response: str) -> Dict:
+    """Parse the first JSON object in an LLM reply."""
+    json_start = text_response.find("{")
+    json_end = text_response.rfind("}") + 1
+    if json_start != -1 and json_end > json_start:
+        return json.loads(text_response[json_start:json_end])
+    return json.loads(text_response)
+
+
+def parse_json_array(text_response: str) -> List:
+    """Parse the JSON array in a packed LLM reply."""
+    json_start = text_response.find("[")
+    json_end = text_response.rfind("]") + 1
+    if json_start != -1 and json_end > json_start:
+        parsed = json.loads(text_response[json_start:json_end])
+    else:
+        parsed = json.loads(text_response)
+    if not isinstance(parsed, list):
+        raise LLMResponseError("Packed LLM response was not a JSON array")
+    return parsed
+
+
+def extract_fields(text_content: str) -> Tuple[Dict, Dict]:
+    """Extract structured fields from one document.
+
+    Returns the record, in the shape of the current field schema, and the
+    token usage of the call.
+    """
+    reply, usage = call_llm(build_extraction_messages(text_content))
+    parsed_data = schemas.shape_record(parse_json_object(reply))
+    logger.info("Successfully extracted %s fields", len(parsed_data))
+    return parsed_data, usage
+
+
+def requery_fields(snippets: str, fields: List[str]) -> Tuple[Dict, Dict]:
+    """Ask only for ``fields``, given excerpts of a document.
+
+    The prompt is the current schema's, narrowed to those fields. Returns
+    the answers (one per field, "N/A" when not found) and the usage.
+    """
+    schema = schemas.current()
+    subset = {
+        **schema,
+        "fields": {field: schema["fields"].get(field, field) for field in fields},
+        "extra_fields": False,
+    }
+    messages = [
+        {"role": "system", "content": schemas.system_prompt(subset)},
+        {"role": "user", "content": f"Document excerpts:\n\n{snippets}"},
+    ]
+    reply, usage = call_llm(messages)
+    return schemas.shape_record(parse_json_object(reply), subset), {**usage, "requery": True}
+
+
+def describe_llm_error(exc: Exception) -> str:
+    """Turn an LLM failure into a message an operator can act on."""
+    if isinstance(exc, requests.HTTPError):
+        status_code = exc.response.status_code if exc.response is not None else None
+        if status_code == 401:
+            message = "LLM endpoint returned 401 Unauthorized. Check `LLM_API_KEY` in `.env`."
+        elif status_code == 403:
+            message = (
+                "LLM endpoint returned 403 Forbidden. Your key may lack permission for "
+                "this model/endpoint, or network policy is blocking access."
+            )
+        else:
+            message = f"LLM HTTP error: {exc}"
+        if exc.response is not None and exc.response.text:
+            message += f"\n\n{exc.response.text[:500]}"
+        return message
+    if isinstance(exc, json.JSONDecodeError):
+        return "Failed to parse JSON response from LLM"
+    if isinstance(exc, LLMResponseError):
+        return str(exc)
+    return f"Error calling LLM: {exc}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def plan_packs(
+    texts: List[str],
+    token_budget: Optional[int] = None,
+    max_documents: Optional[int] = None,
+) -> List[List[int]]:
+    """Group document indexes so each request stays within the token budget.
+
+    The budget covers the shared instructions, every document section and
+    the reply reserved for each record. A document that is too large to
+    share a request ends up in a pack of its own.
+    """
+    budget = token_budget or PACK_TOKEN_BUDGET
+    limit = max_documents or PACK_MAX_DOCUMENTS
+    overhead = estimate_tokens(schemas.packed_system_prompt())
+    reply_tokens = schemas.output_tokens()
+
+    packs: List[List[int]] = []
+    current: List[int] = []
+    used = overhead
+    for index, text in enumerate(texts):
+        cost = estimate_tokens(text) + reply_tokens + 20
+        if current and (used + cost > budget or len(current) >= limit):
+            packs.append(current)
+            current, used = [], overhead
+        current.append(index)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def merge_usage(first: Optional[Dict], second: Optional[Dict]) -> Dict:
+    """Add up the usage of two calls made for the same document."""
+    merged = dict(first or {})
+    for key, value in (second or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "shared_with":
+            merged[key] = round(merged.get(key, 0) + value, 6)
+        else:
+            merged.setdefault(key, value)
+    return merged
+
+
+def _timed_out() -> Dict:
+    """Result for a document whose time budget ran out before the LLM replied."""
+    return {
+        "record": None,
+        "error": "Ran out of time before the LLM replied; please try again.",
+        "usage": None,
+        "partial": True,
+    }
+
+
+def _extract_one(text_content: str) -> Dict:
+    try:
+        record, usage = extract_fields(text_content)
+        return {"record": record, "error": None, "usage": usage}
+    except cancellation.DeadlineExceeded:
+        return _timed_out()
+    except cancellation.Cancelled:
+        raise
+    except Exception as exc:
+        logger.error("Error extracting document: %s", exc, exc_info=True)
+        return {"record": None, "error": describe_llm_error(exc), "usage": None}
+
+
+def _records_by_number(records: List) -> Dict[int, Dict]:
+    by_number = {}
+    for position, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            continue
+        number = record.pop("document_index", position)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = position
+        by_number[number] = schemas.shape_record(record)
+    return by_number
+
+
+def record_cache_key(text_content: str) -> str:
+    """Cache key for one document's record under the current model and schema."""
+    schema = schemas.current()
+    return cache_key(
+        "llm", os.getenv("LLM_MODEL"), schema["id"], schemas.system_prompt(schema), text_content
+    )
+
+
+def _zero_usage(**flags) -> Dict:
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "latency_seconds": 0.0,
+        "estimated_cost": 0.0,
+        **flags,
+    }
+
+
+def _revision_summary(previous: Dict, record: Dict, diff: Dict, incremental: bool) -> Dict:
+    return {
+        "incremental": incremental,
+        "changed_lines": diff["changed_lines"],
+        "total_lines": diff["total_lines"],
+        "previous_updated_at": previous.get("updated_at"),
+        "changes": revisions.field_changes(previous["record"], record),
+    }
+
+
+def _extract_revision(text_content: str, previous: Dict, diff: Dict) -> Optional[Dict]:
+    """Re-extract only the changed regions of a revised form.
+
+    Returns None when the partial extraction fails, so the caller falls
+    back to extracting the whole document.
+    """
+    if not diff["changed_lines"]:
+        record = dict(previous["record"])
+        return {
+            "record": record,
+            "error": None,
+            "usage": _zero_usage(incremental=True),
+            "revision": _revision_summary(previous, record, diff, True),
+        }
+    logger.info(
+        "Revised form: re-extracting %s of %s lines",
+        diff["changed_lines"],
+        diff["total_lines"],
+    )
+    partial = _extract_one("\n...\n".join(diff["regions"]))
+    if partial["record"] is None:
+        logger.warning("Partial extraction failed, extracting whole form: %s", partial["error"])
+        return None
+    record = revisions.merge_records(
+        previous["record"], partial["record"], diff["removed"], text_content
+    )
+    metrics.inc("docproc_incremental_extractions_total")
+    return {
+        "record": record,
+        "error": None,
+        "usage": {**partial["usage"], "incremental": True},
+        "revision": _revision_summary(previous, record, diff, True),
+    }
+
+
+def extract_fields_batch(
+    texts: List[str], find_revisions: bool = True, remember: bool = True
+) -> List[Dict]:
+    """Extract fields from several documents, using cached records first.
+
+    Documents already extracted with the same model and prompt (on any
+    replica sharing the cache backend) cost nothing. A revised version of
+    a form seen before only has its changed regions re-extracted (see
+    ``revisions``); the rest go through ``_extract_fields_uncached``.
+    Successful records are cached, and results for known forms carry a
+    ``revision`` report of the fields that changed.
+
+    ``find_revisions=False`` skips the look-up of earlier versions and
+    ``remember=False`` does not store the texts as the latest version:
+    a retry with more pages of the same upload is not a revision of it,
+    and only its final record should be remembered.
+    """
+    keys = [record_cache_key(text) for text in texts]
+    results: List[Dict] = [{} for _ in texts]
+    previous_versions: Dict[int, Tuple[Dict, Dict]] = {}
+    pending = []
+    for index, key in enumerate(keys):
+        record = cache.get_json(key)
+        if record is not None:
+            results[index] = {
+                "record": record,
+                "error": None,
+                "usage": _zero_usage(cache_hit=True),
+            }
+            continue
+        previous = revisions.find_previous(texts[index]) if find_revisions else None
+        if previous:
+            diff = revisions.diff_text(previous["text"], texts[index])
+            previous_versions[index] = (previous, diff)
+            changed_ratio = diff["changed_lines"] / diff["total_lines"]
+            if changed_ratio <= revisions.REVISION_MAX_CHANGED_RATIO:
+                result = _extract_revision(texts[index], previous, diff)
+                if result is not None:
+                    results[index] = result
+                    cache.put_json(key, result["record"])
+                    if remember:
+                        revisions.remember(texts[index], result["record"])
+                    continue
+        pending.append(index)
+    if pending:
+        fresh = _extract_fields_uncached([texts[index] for index in pending])
+        for index, result in zip(pending, fresh):
+            results[index] = result
+            if result["record"] is None:
+                continue
+            cache.put_json(keys[index], result["record"])
+            if remember:
+                revisions.remember(texts[index], result["record"])
+            if index in previous_versions:
+                previous, diff = previous_versions[index]
+                result["revision"] = _revision_summary(previous, result["record"], diff, False)
+    return results
+
+
+def _extract_fields_uncached(texts: List[str]) -> List[Dict]:
+    """Extract fields from several documents, packing short ones together.
+
+    Returns one result per input text, in order, with ``record``, ``error``
+    and ``usage`` keys. A packed request's usage is shared between its
+    documents by size. A document that the packed reply leaves out (or
+    that fails to parse) is retried on its own, so one bad document does
+    not sink its pack. Documents still waiting when the deadline passes
+    come back without a record and with ``partial`` set.
+    """
+    results: List[Dict] = [{} for _ in texts]
+    for pack in plan_packs(texts):
+        if len(pack) == 1:
+            results[pack[0]] = _extract_one(texts[pack[0]])
+            continue
+
+        logger.info("Packing %s documents into one LLM request", len(pack))
+        records: Dict[int, Dict] = {}
+        shares: List[Optional[Dict]] = [None] * len(pack)
+        try:
+            reply, usage = call_llm(
+                build_packed_messages([texts[index] for index in pack]), documents=len(pack)
+            )
+            shares = split_usage(usage, [estimate_tokens(texts[index]) for index in pack])
+            records = _records_by_number(parse_json_array(reply))
+        except cancellation.DeadlineExceeded:
+            for index in pack:
+                results[index] = _timed_out()
+            continue
+        except requests.HTTPError as exc:
+            status_code = exc.response.status_code if exc.response is not None else None
+            if status_code in (401, 403):
+                # Retrying each document alone would fail the same way.
+                for index in pack:
+                    results[index] = {
+                        "record": None,
+                        "error": describe_llm_error(exc),
+                        "usage": None,
+                    }
+                continue
+            logger.warning("Packed request failed, retrying individually: %s", exc)
+        except (requests.RequestException, ValueError) as exc:
+            logger.warning("Packed request failed, retrying individually: %s", exc)
+
+        for number, (index, share) in enumerate(zip(pack, shares), start=1):
+            if number in records:
+                results[index] = {"record": records[number], "error": None, "usage": share}
+            else:
+                logger.info("Document %s missing from packed reply, retrying alone", index)
+                result = _extract_one(texts[index])
+                result["usage"] = merge_usage(share, result["usage"])
+                results[index] = result
+    return results
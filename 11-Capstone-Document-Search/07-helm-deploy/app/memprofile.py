@@ -0,0 +1,239 @@
+"""
+Per-stage memory profile of the document pipeline, switched on by environment.
+
+A Pod killed for running out of memory does not say which document or
+stage was to blame. With ``MEMORY_PROFILE_EVERY_N`` set, every Nth
+document (and every Nth Excel export) is traced with ``tracemalloc``
+through its stages:
+
+- ``upload``     copying the upload to the spool file and mapping it
+- ``pdf_pages``  text extraction: the PDF parser's page objects, OCR, tables
+- ``text_join``  clean-up, which joins the page texts to cost the prompt
+- ``dataframe``  building the pandas DataFrame of an export
+- ``excel``      writing the workbook into the in-memory Excel buffer
+
+For each stage the peak (highest traced memory above what was allocated
+when the stage started) and the net (what the stage left allocated) are
+published as ``docproc_memory_stage_peak_bytes`` and
+``docproc_memory_stage_net_bytes`` gauges, with a high-water mark and
+running totals per stage. Each traced document is also written to
+``MEMORY_PROFILE_DIR`` as a JSON dump with its figures and, per stage,
+the ``MEMORY_PROFILE_TOP`` allocation sites that grew the most. Only the
+newest ``MEMORY_PROFILE_MAX_FILES`` dumps are kept.
+
+``tracemalloc`` counts the whole process, so traced documents take turns:
+one is traced at a time and the next waits for it (untraced documents
+and LLM calls carry on). Tracing slows every Python allocation while it
+runs, hence the sampling. Memory outside Python's allocators, such as
+the memory-mapped upload or buffers of C libraries, is not seen.
+
+With ``MEMORY_PROFILE_EVERY_N=0`` (the default) the functions here do
+nothing beyond one check.
+"""
+import fnmatch
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import cancellation
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PROFILE_EVERY_N = int(os.getenv("MEMORY_PROFILE_EVERY_N", "0"))
+MEMORY_PROFILE_TOP = int(os.getenv("MEMORY_PROFILE_TOP", "10"))
+# Frames kept per allocation; more than one groups sites by call path.
+MEMORY_PROFILE_FRAMES = int(os.getenv("MEMORY_PROFILE_FRAMES", "1"))
+MEMORY_PROFILE_DIR = os.getenv("MEMORY_PROFILE_DIR", "/tmp/docproc-memory")
+MEMORY_PROFILE_MAX_FILES = int(os.getenv("MEMORY_PROFILE_MAX_FILES", "50"))
+
+_turn = threading.Lock()
+_seen_lock = threading.Lock()
+_seen = 0
+_local = threading.local()
+_IGNORED = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+# Compile the filter patterns now, or the first filtered snapshot shows
+# fnmatch's pattern cache as allocated by whichever stage it ran in.
+for _filter in _IGNORED:
+    fnmatch.fnmatch(__file__, _filter.filename_pattern)
+
+
+def enabled() -> bool:
+    return MEMORY_PROFILE_EVERY_N > 0
+
+
+def _take_turn() -> None:
+    """Wait until no other document is being traced."""
+    while not _turn.acquire(timeout=0.5):
+        cancellation.check()
+
+
+def _snapshot() -> Optional[tracemalloc.Snapshot]:
+    if MEMORY_PROFILE_TOP <= 0:
+        return None
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+
+def _top_sites(before: Optional[tracemalloc.Snapshot]) -> List[Dict]:
+    if before is None:
+        return []
+    key = "traceback" if MEMORY_PROFILE_FRAMES > 1 else "lineno"
+    grown = [
+        stat
+        for stat in _snapshot().compare_to(before, key)
+        if stat.size_diff > 0
+    ]
+    grown.sort(key=lambda stat: stat.size_diff, reverse=True)
+    return [
+        {
+            "site": [str(frame) for frame in stat.traceback],
+            "net_bytes": stat.size_diff,
+            "allocations": stat.count_diff,
+        }
+        for stat in grown[:MEMORY_PROFILE_TOP]
+    ]
+
+
+@contextmanager
+def document(label: str) -> Iterator[None]:
+    """Trace the stages of one document (or export) when it is the Nth.
+
+    Nested calls on the same thread are folded into the outermost one.
+    """
+    if not enabled() or getattr(_local, "report", None) is not None:
+        yield
+        return
+    global _seen
+    with _seen_lock:
+        _seen += 1
+        nth = _seen % MEMORY_PROFILE_EVERY_N == 0
+    if not nth:
+        yield
+        return
+    _take_turn()
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(MEMORY_PROFILE_FRAMES)
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        report = {"label": label, "stages": [], "peak": baseline}
+        _local.report = report
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _local.report = None
+            current, peak = tracemalloc.get_traced_memory()
+            report["peak"] = max(report["peak"], peak)
+            _finish(report, baseline, current, time.perf_counter() - started)
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _turn.release()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Record the peak and net memory of the block in the traced document.
+
+    Does nothing outside a traced document, or inside another stage.
+    """
+    report = getattr(_local, "report", None)
+    if report is None or getattr(_local, "stage", None):
+        yield
+        return
+    _local.stage = name
+    try:
+        before = _snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        report["peak"] = max(report["peak"], peak)
+        baseline = current
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            report["peak"] = max(report["peak"], peak)
+            figures = {
+                "stage": name,
+                "peak_bytes": max(peak - baseline, 0),
+                "net_bytes": current - baseline,
+                "seconds": round(elapsed, 4),
+                "top": _top_sites(before),
+            }
+            report["stages"].append(figures)
+            _publish(figures)
+    finally:
+        _local.stage = None
+
+
+def _publish(figures: Dict) -> None:
+    name = figures["stage"]
+    metrics.set_gauge("docproc_memory_stage_peak_bytes", figures["peak_bytes"], stage=name)
+    metrics.set_gauge("docproc_memory_stage_net_bytes", figures["net_bytes"], stage=name)
+    metrics.max_gauge("docproc_memory_stage_max_peak_bytes", figures["peak_bytes"], stage=name)
+    metrics.inc("docproc_memory_stage_peak_bytes_total", figures["peak_bytes"], stage=name)
+    metrics.inc("docproc_memory_stage_runs_total", stage=name)
+
+
+def _finish(report: Dict, baseline: int, current: int, elapsed: float) -> None:
+    peak = max(report["peak"] - baseline, 0)
+    dump = {
+        "label": report["label"],
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": round(elapsed, 4),
+        "peak_bytes": peak,
+        "net_bytes": current - baseline,
+        "stages": report["stages"],
+    }
+    metrics.set_gauge("docproc_memory_document_peak_bytes", peak)
+    metrics.max_gauge("docproc_memory_document_max_peak_bytes", peak)
+    metrics.inc("docproc_memory_profiled_documents_total")
+    logger.info(
+        "Memory profile of %s: peak %.1f MiB (%s)",
+        report["label"],
+        peak / 2**20,
+        ", ".join(
+            f"{figures['stage']} {figures['peak_bytes'] / 2**20:.1f}" for figures in report["stages"]
+        ),
+    )
+    try:
+        write_dump(dump)
+    except OSError as exc:
+        logger.warning("Could not write memory profile: %s", exc)
+
+
+def write_dump(dump: Dict) -> str:
+    """Write one document's figures and allocation sites; returns the path."""
+    os.makedirs(MEMORY_PROFILE_DIR, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{now % 1:.3f}"[1:]
+    label = re.sub(r"[^\w.-]+", "_", dump["label"])[:60]
+    path = os.path.join(MEMORY_PROFILE_DIR, f"{stamp}-{label}.json")
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(dump, handle, indent=2)
+    _rotate()
+    return path
+
+
+def _rotate() -> None:
+    names = sorted(name for name in os.listdir(MEMORY_PROFILE_DIR) if name.endswith(".json"))
+    for name in names[: max(len(names) - MEMORY_PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(os.path.join(MEMORY_PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,181 @@
+"""
+In-process metrics for the document processor.
+
+Counters and gauges live in module-level dictionaries keyed by metric name
+and label set, shared by every Streamlit session on the replica. Latencies
+are kept as a rolling window (``METRICS_LATENCY_WINDOW_SECONDS``) so their
+percentiles follow current load. ``render_prometheus`` formats everything
+in the Prometheus text format.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+SESSION_METRIC_TTL = 3600
+LATENCY_WINDOW_SECONDS = float(os.getenv("METRICS_LATENCY_WINDOW_SECONDS", "300"))
+LATENCY_QUANTILES = (0.5, 0.95)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_gauges: Dict[Tuple[str, Tuple], float] = {}
+_session_sizes: Dict[str, Tuple[float, int]] = {}  # session id -> (last seen, bytes)
+_latencies: Dict[str, Deque[Tuple[float, float]]] = {}
+_first_seen: set = set()
+
+
+def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    """Add ``amount`` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to ``value``."""
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+
+
+def add_gauge(name: str, amount: float, **labels) -> None:
+    """Move a gauge up or down by ``amount``."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0.0) + amount
+
+
+def max_gauge(name: str, value: float, **labels) -> None:
+    """Raise a gauge to ``value`` if that is higher (a high-water mark)."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = max(_gauges.get(key, float(value)), float(value))
+
+
+@contextmanager
+def track_inflight(name: str, **labels) -> Iterator[None]:
+    """Count the block as in flight on gauge ``name`` while it runs."""
+    add_gauge(name, 1, **labels)
+    try:
+        yield
+    finally:
+        add_gauge(name, -1, **labels)
+
+
+def gauge_value(name: str, **labels) -> float:
+    """Current value of a gauge (0 when never set)."""
+    with _lock:
+        return _gauges.get(_key(name, labels), 0.0)
+
+
+def _prune(samples: Deque[Tuple[float, float]], now: float) -> None:
+    while samples and now - samples[0][0] > LATENCY_WINDOW_SECONDS:
+        samples.popleft()
+
+
+def observe_latency(name: str, seconds: float) -> None:
+    """Add one duration to the rolling window for ``name``."""
+    now = time.time()
+    with _lock:
+        samples = _latencies.setdefault(name, deque())
+        samples.append((now, seconds))
+        _prune(samples, now)
+
+
+def observe_cold_start(name: str, seconds: float, first_gauge: str) -> None:
+    """``observe_latency``, except the process's first duration goes to ``first_gauge``.
+
+    That first one pays for connection set-up and imports, so it is
+    reported on its own and kept out of the steady-state percentiles.
+    """
+    with _lock:
+        first = name not in _first_seen
+        _first_seen.add(name)
+        if first:
+            _gauges[_key(first_gauge, {})] = float(seconds)
+            return
+    observe_latency(name, seconds)
+
+
+def latency_percentile(name: str, quantile: float) -> Optional[float]:
+    """Nearest-rank percentile over the rolling window, None when empty."""
+    with _lock:
+        samples = _latencies.get(name)
+        if not samples:
+            return None
+        _prune(samples, time.time())
+        values = sorted(seconds for _, seconds in samples)
+    if not values:
+        return None
+    return values[max(math.ceil(quantile * len(values)) - 1, 0)]
+
+
+def observe_session_bytes(session_id: str, size: int) -> None:
+    """Record one session's state size and forget sessions gone quiet.
+
+    Only aggregates over the live sessions are exported (their count and
+    the sum and largest of their sizes): a series per session id would
+    grow without bound.
+    """
+    now = time.time()
+    with _lock:
+        _session_sizes[session_id] = (now, size)
+        for stale in [
+            sid for sid, (seen, _) in _session_sizes.items() if now - seen > SESSION_METRIC_TTL
+        ]:
+            del _session_sizes[stale]
+        sizes = [bytes_ for _, bytes_ in _session_sizes.values()]
+        _gauges[_key("docproc_sessions", {})] = float(len(sizes))
+        _gauges[_key("docproc_session_state_bytes_sum", {})] = float(sum(sizes))
+        _gauges[_key("docproc_session_state_bytes_max", {})] = float(max(sizes))
+
+
+def snapshot() -> Dict[str, Dict]:
+    """Copy of all metric values, for tests and the UI."""
+    now = time.time()
+    with _lock:
+        for samples in _latencies.values():
+            _prune(samples, now)
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "latencies": {name: list(samples) for name, samples in _latencies.items()},
+        }
+
+
+def _format(name: str, labels: Tuple, value: float) -> str:
+    if labels:
+        rendered = ",".join(
+            f'{key}="{val}"'.replace("\n", " ") for key, val in labels
+        )
+        return f"{name}{{{rendered}}} {value:g}"
+    return f"{name} {value:g}"
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    data = snapshot()
+    for kind, values in (("counter", data["counters"]), ("gauge", data["gauges"])):
+        seen = set()
+        for (name, labels), value in sorted(values.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            lines.append(_format(name, labels, value))
+    for name in sorted(data["latencies"]):
+        values = [seconds for _, seconds in data["latencies"][name]]
+        lines.append(f"# TYPE {name} summary")
+        for quantile in LATENCY_QUANTILES:
+            value = latency_percentile(name, quantile)
+            if value is not None:
+                lines.append(_format(name, (("quantile", str(quantile)),), value))
+        lines.append(f"{name}_sum {sum(values):g}")
+        lines.append(f"{name}_count {len(values)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,191 @@
+"""
+OCR stage for scanned pages.
+
+Only pages that came back from the text extractors without usable text are
+rasterized (with pypdfium2, which ships with pdfplumber) and sent to a
+local Tesseract engine. OCR runs in a process pool sized to the CPU count,
+and results are cached on disk by the SHA-256 of the rendered page image,
+so resubmitting the same scan costs a render and a hash, not an OCR run.
+
+Requires the optional ``pytesseract`` package and the ``tesseract`` binary;
+without them ``ocr_available()`` is False and the stage is skipped.
+"""
+import hashlib
+import io
+import logging
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import BinaryIO, Dict, List, Optional
+
+import cancellation
+
+logger = logging.getLogger(__name__)
+
+# "auto" enables OCR when Tesseract is installed; "false" turns it off.
+OCR_ENABLED = os.getenv("OCR_ENABLED", "auto").lower()
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "ocr-cache"
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class _MappedStream(io.RawIOBase):
+    """Readable stream over a memory map; pypdfium2 needs ``readinto``."""
+
+    def __init__(self, mapped: mmap.mmap):
+        self._mapped = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._mapped.read(len(buffer))
+        memoryview(buffer).cast("B")[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self):
+        return self._mapped.tell()
+
+
+def ocr_available() -> bool:
+    """True when OCR is enabled and pytesseract plus tesseract are installed."""
+    if OCR_ENABLED in ("0", "false", "no", "off"):
+        return False
+    try:
+        import pytesseract  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which("tesseract") is not None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the Streamlit server is multi-threaded.
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Started OCR process pool with %s workers", OCR_WORKERS)
+        return _pool
+
+
+def _ocr_png(png: bytes, lang: str) -> str:
+    """Run Tesseract on one PNG page image (executes in a pool process)."""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(png)) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, digest[:2], f"{digest}.txt")
+
+
+def _cache_get(digest: str) -> Optional[str]:
+    try:
+        with open(_cache_path(digest), encoding="utf-8") as handle:
+            return handle.read()
+    except OSError:
+        return None
+
+
+def _cache_put(digest: str, text: str) -> None:
+    path = _cache_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial entry.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    os.replace(tmp_path, path)
+
+
+def render_pages(pdf_file: BinaryIO, page_indexes: List[int]) -> Dict[int, bytes]:
+    """Rasterize the given zero-based pages to PNG bytes."""
+    import pypdfium2
+
+    pdf_file.seek(0)
+    source = _MappedStream(pdf_file) if isinstance(pdf_file, mmap.mmap) else pdf_file
+    document = pypdfium2.PdfDocument(source)
+    images = {}
+    try:
+        for index in page_indexes:
+            cancellation.check("ocr")
+            page = document[index]
+            try:
+                image = page.render(scale=OCR_DPI / 72).to_pil()
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                images[index] = buffer.getvalue()
+            finally:
+                page.close()
+    finally:
+        document.close()
+    return images
+
+
+def ocr_pages(pdf_file: BinaryIO, page_indexes: List[int]) -> Dict[int, str]:
+    """OCR the given zero-based pages, reusing cached results by image hash."""
+    results: Dict[int, str] = {}
+    pending = {}
+    cached_pages = 0
+    for index, png in render_pages(pdf_file, page_indexes).items():
+        digest = hashlib.sha256(png).hexdigest()
+        cached = _cache_get(digest)
+        if cached is not None:
+            results[index] = cached
+            cached_pages += 1
+        else:
+            pending[index] = (digest, png)
+
+    if pending:
+        pool = _get_pool()
+        futures = {
+            index: (digest, pool.submit(_ocr_png, png, OCR_LANG))
+            for index, (digest, png) in pending.items()
+        }
+        token = cancellation.current()
+        if token is not None:
+            # Pages still queued for the pool are dropped on cancel; pages
+            # already being OCR'd finish in their worker process.
+            token.on_cancel(lambda: [future.cancel() for _, future in futures.values()])
+        for index, (digest, future) in futures.items():
+            try:
+                text = future.result(timeout=cancellation.remaining())
+            except FutureTimeout:
+                # Out of time: keep the pages OCR'd so far.
+                for _, waiting in futures.values():
+                    waiting.cancel()
+                logger.warning(
+                    "OCR ran out of time; keeping %s of %s pages", len(results), len(page_indexes)
+                )
+                break
+            except CancelledError:
+                cancellation.check("ocr")
+                raise
+            _cache_put(digest, text)
+            results[index] = text
+    logger.info(
+        "OCR: %s pages (%s from cache)", len(results), cached_pages
+    )
+    return results
@@ -0,0 +1,116 @@
+"""
+Relevance-based page selection for long filings.
+
+Long submissions bury the applicant, license and payment details in a few
+pages among attachments. Each page is scored locally by which target
+fields it appears to contain (label keywords plus value shapes such as
+emails, dates and amounts), and only the best pages that fit
+``PAGE_TOKEN_BUDGET`` are sent to the LLM, in their original order.
+
+Only the fields of the current field schema (see ``schemas``) count
+towards a page's score. When a required field (``REQUIRED_FIELDS``, if
+the schema has it) comes back "N/A", the caller retries with a doubled
+budget until every page has been sent.
+"""
+import logging
+import os
+import re
+from typing import Dict, List
+
+import schemas
+from llm import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PAGE_TOKEN_BUDGET = int(os.getenv("PAGE_TOKEN_BUDGET", "3000"))
+REQUIRED_FIELDS = [
+    name.strip()
+    for name in os.getenv("REQUIRED_FIELDS", "applicant_name,license_number").split(",")
+    if name.strip()
+]
+
+# Evidence that a page holds each target field.
+FIELD_FEATURES = {
+    "applicant_name": [r"\bapplicant\b", r"\b(full )?name\s*:"],
+    "license_number": [r"\blicen[cs]e\s*(number|no\.?|#|id)\b", r"\b[A-Z]{2,}-[A-Z0-9]+-[A-Z0-9-]+\b"],
+    "license_type": [r"\b(type of licen[cs]e|licen[cs]e type)\b"],
+    "expiry_date": [r"\bexpir(y|ation|es)\b"],
+    "renewal_date": [r"\brenewal (date|application)\b", r"\bdate of renewal\b"],
+    "address": [
+        r"\baddress\b",
+        r"\b\d+ [\w ]+ (street|st|avenue|ave|road|rd|blvd|lane|ln|drive|dr)\b",
+    ],
+    "contact_number": [r"\b(phone|contact number|telephone|mobile)\b", r"\+?\d[\d ().-]{7,}\d"],
+    "email": [r"[\w.+-]+@[\w-]+\.[\w.]+"],
+    "payment_status": [r"\bpayment (status|method|date)\b", r"\bpaid\b"],
+    "payment_amount": [r"[$€£]\s?\d", r"\bamount\b", r"\bfee\b"],
+    "transaction_id": [r"\btransaction\b", r"\b(payment )?reference\b", r"\breceipt\b"],
+    "date_of_birth": [r"\b(date of birth|dob|birth date)\b"],
+    "previous_violations": [r"\bviolations?\b", r"\bdisciplinary\b", r"\bconvictions?\b"],
+}
+_DATE_RE = re.compile(r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b")
+_COMPILED = {
+    field: [re.compile(pattern, re.I) for pattern in patterns]
+    for field, patterns in FIELD_FEATURES.items()
+}
+
+
+def evidence_patterns(field: str) -> List[re.Pattern]:
+    """Compiled patterns that show a text holds ``field`` (none if unknown)."""
+    return _COMPILED.get(field, [])
+
+
+def page_fields(text: str) -> List[str]:
+    """Target fields of the current schema this page shows evidence of."""
+    wanted = schemas.current()["fields"]
+    return [
+        field
+        for field, patterns in _COMPILED.items()
+        if field in wanted and any(pattern.search(text) for pattern in patterns)
+    ]
+
+
+def score_page(text: str, position: int = 0) -> float:
+    """Relevance of one page: fields found, plus dates and a first-page nudge."""
+    if not text.strip():
+        return 0.0
+    score = float(len(page_fields(text)))
+    score += 0.25 * min(len(_DATE_RE.findall(text)), 4)
+    if position == 0:
+        # Application forms nearly always open with the applicant block.
+        score += 0.5
+    return score
+
+
+def select_pages(pages: List[str], token_budget: int = PAGE_TOKEN_BUDGET) -> List[int]:
+    """Indexes of the most relevant pages fitting ``token_budget``, in page order.
+
+    Every page is returned when the document already fits. Pages without
+    any evidence are only sent when the budget covers the whole document.
+    """
+    costs = [estimate_tokens(page) for page in pages]
+    if sum(costs) <= token_budget:
+        return list(range(len(pages)))
+    scores = [score_page(page, position) for position, page in enumerate(pages)]
+    ranked = sorted(range(len(pages)), key=lambda index: (-scores[index], index))
+    chosen: List[int] = []
+    used = 0
+    for index in ranked:
+        if scores[index] <= 0 and chosen:
+            break
+        if chosen and used + costs[index] > token_budget:
+            continue
+        chosen.append(index)
+        used += costs[index]
+    return sorted(chosen)
+
+
+def missing_required(record: Dict) -> List[str]:
+    """Required fields of the current schema the record left empty or "N/A"."""
+    wanted = schemas.current()["fields"]
+    return [
+        field
+        for field in REQUIRED_FIELDS
+        if field in wanted
+        and str(record.get(field) or "N/A").strip().upper() in ("", "N/A", "NA")
+    ]
@@ -0,0 +1,331 @@
+"""
+PDF text extraction engines for the License Renewal Document Processor.
+
+Extractors are registered with a relative cost. ``extract_pages`` runs a
+cheap probe over the PDF structure (page count, text layer, fonts, images),
+starts with the cheapest extractor likely to cope, and falls back to the
+next heavier one when the text it produced scores below the quality
+threshold. Every extractor returns one string per page; pages that are
+still empty afterwards are handed to the OCR stage, and payment and
+violation tables are then read into fields (see ``tables``) on the pages
+the probe found ruled, reusing pdfplumber's document when the text came
+from it. The report times the probe and the table pass separately.
+
+Extractors stop at the current deadline (see ``cancellation.deadline``)
+and return the pages read so far; the report is then marked ``partial``.
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+import cache
+import cancellation
+import tables
+from cache import cache_key
+from ocr import ocr_available, ocr_pages
+
+logger = logging.getLogger(__name__)
+
+# "auto" picks per document; any registered name forces that engine.
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "auto")
+PDF_MIN_QUALITY = float(os.getenv("PDF_MIN_QUALITY", "0.6"))
+MIN_CHARS_PER_PAGE = 10
+# Pages with many fonts or any images usually have layout that the simple
+# PyPDF2 text walk scrambles, so they start with pdfplumber.
+HEAVY_FONTS_PER_PAGE = 8
+
+_FILL_LINE_RE = re.compile(r"[_.]{3,}")
+
+EXTRACTORS: Dict[str, Dict] = {}
+
+_local = threading.local()
+
+
+def register_extractor(name: str, cost: int, requires: str = ""):
+    """Register ``func(pdf_file) -> List[str]`` as an extractor.
+
+    ``cost`` orders the fallback chain (cheapest first). ``requires`` names
+    an optional module; the extractor is skipped when it is not installed.
+    """
+
+    def decorator(func: Callable[[BinaryIO], List[str]]):
+        EXTRACTORS[name] = {"func": func, "cost": cost, "requires": requires}
+        return func
+
+    return decorator
+
+
+def available_extractors() -> List[str]:
+    """Registered extractor names whose dependencies are installed, cheapest first."""
+    names = [
+        name
+        for name, entry in EXTRACTORS.items()
+        if not entry["requires"] or importlib.util.find_spec(entry["requires"])
+    ]
+    return sorted(names, key=lambda name: EXTRACTORS[name]["cost"])
+
+
+@register_extractor("pypdf2", cost=1)
+def extract_with_pypdf2(pdf_file: BinaryIO) -> List[str]:
+    pdf_file.seek(0)
+    reader = PyPDF2.PdfReader(pdf_file)
+    texts = []
+    for page in reader.pages:
+        if cancellation.expired():
+            break
+        cancellation.check("extraction")
+        texts.append(page.extract_text() or "")
+    return texts
+
+
+@contextmanager
+def _extraction_run(pdf_file: BinaryIO) -> Iterator[None]:
+    """Keep a pdfplumber document opened for ``pdf_file`` until the run ends."""
+    _local.run = {"file": pdf_file, "pdfplumber": None, "ruled": []}
+    try:
+        yield
+    finally:
+        run, _local.run = _local.run, None
+        if run["pdfplumber"] is not None:
+            run["pdfplumber"].close()
+
+
+def _open_pdfplumber_document() -> Optional[object]:
+    """The pdfplumber document this extraction run already opened, if any."""
+    run = getattr(_local, "run", None)
+    return run["pdfplumber"] if run else None
+
+
+@contextmanager
+def _pdfplumber_document(pdf_file: BinaryIO):
+    """pdfplumber document of ``pdf_file``, left open for the run's table pass."""
+    import pdfplumber
+
+    run = getattr(_local, "run", None)
+    if run is None or run["file"] is not pdf_file:
+        pdf_file.seek(0)
+        with pdfplumber.open(pdf_file) as pdf:
+            yield pdf
+        return
+    if run["pdfplumber"] is None:
+        pdf_file.seek(0)
+        run["pdfplumber"] = pdfplumber.open(pdf_file)
+    yield run["pdfplumber"]
+
+
+@register_extractor("pdfplumber", cost=3, requires="pdfplumber")
+def extract_with_pdfplumber(pdf_file: BinaryIO) -> List[str]:
+    texts = []
+    run = getattr(_local, "run", None)
+    keep = run["ruled"] if run and run["file"] is pdf_file else []
+    with _pdfplumber_document(pdf_file) as pdf:
+        for index, page in enumerate(pdf.pages):
+            if cancellation.expired():
+                break
+            cancellation.check("extraction")
+            text = page.extract_text() or ""
+            texts.append(text)
+            # Drop the page's parsed layout objects before moving on, so
+            # peak memory tracks one page rather than the whole document;
+            # pages the table pass will search keep theirs for it.
+            if index not in keep or not tables.is_candidate(text):
+                page.flush_cache()
+    return texts
+
+
+def probe_pdf(pdf_file: BinaryIO) -> Dict:
+    """Inspect PDF structure without extracting any text.
+
+    With ``TABLE_EXTRACTION`` on, ``ruled_pages`` lists the pages that draw
+    enough lines to hold a table.
+    """
+    pdf_file.seek(0)
+    reader = PyPDF2.PdfReader(pdf_file)
+    probe = {"page_count": 0, "text_pages": 0, "font_count": 0, "image_count": 0}
+    if tables.TABLE_EXTRACTION:
+        probe["ruled_pages"] = []
+    for index, page in enumerate(reader.pages):
+        probe["page_count"] += 1
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources else {}
+        fonts = resources.get("/Font")
+        fonts = fonts.get_object() if fonts else {}
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects else {}
+        probe["font_count"] += len(fonts)
+        probe["image_count"] += sum(
+            1 for xobject in xobjects.values()
+            if xobject.get_object().get("/Subtype") == "/Image"
+        )
+        if fonts:
+            probe["text_pages"] += 1
+        if tables.TABLE_EXTRACTION and tables.count_segments(page) >= tables.MIN_TABLE_SEGMENTS:
+            probe["ruled_pages"].append(index)
+    return probe
+
+
+def text_quality(pages: List[str], probe: Dict) -> float:
+    """Share (0-1) of text-layer pages that came back as readable text."""
+    expected = max(probe.get("text_pages", 0), 1)
+    good = 0
+    for text in pages:
+        # Blank form fields ("_____", "......") are not extraction noise.
+        stripped = _FILL_LINE_RE.sub(" ", text).strip()
+        if len(stripped) < MIN_CHARS_PER_PAGE:
+            continue
+        readable = sum(
+            ch.isalnum() or ch.isspace() or ch in ".,:;/-()@#$%'&+|" for ch in stripped
+        ) / len(stripped)
+        words = stripped.split()
+        mean_word = sum(len(word) for word in words) / max(len(words), 1)
+        # Glued-together words are the usual failure of simple extractors.
+        if readable >= 0.85 and mean_word <= 12:
+            good += 1
+    return min(good / expected, 1.0)
+
+
+def choose_extractors(probe: Dict) -> List[str]:
+    """Fallback chain for a document, starting with the one to try first."""
+    chain = available_extractors()
+    if PDF_EXTRACTOR != "auto" and PDF_EXTRACTOR in chain:
+        return [PDF_EXTRACTOR] + [name for name in chain if name != PDF_EXTRACTOR]
+
+    if probe["page_count"] and not probe["text_pages"]:
+        # No text layer anywhere: heavier extractors would find nothing
+        # either, so only the cheapest runs and OCR does the real work.
+        return chain[:1]
+
+    pages = max(probe["page_count"], 1)
+    heavy = probe["image_count"] > 0 or probe["font_count"] / pages > HEAVY_FONTS_PER_PAGE
+    if heavy:
+        return [name for name in chain if EXTRACTORS[name]["cost"] > 1] + [
+            name for name in chain if EXTRACTORS[name]["cost"] <= 1
+        ]
+    return chain
+
+
+def _sha256(pdf_file: BinaryIO) -> str:
+    pdf_file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: pdf_file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_pages(pdf_file: BinaryIO) -> Tuple[List[str], Dict]:
+    """Extract per-page text with the cheapest adequate extractor.
+
+    Returns the page texts and a report with the probe, the engine that
+    was used, its quality score and every attempt made. Results are cached
+    by the SHA-256 of the PDF bytes plus the extraction settings.
+    """
+    digest = _sha256(pdf_file)
+    key = cache_key(
+        "text", digest, PDF_EXTRACTOR, PDF_MIN_QUALITY, ocr_available(), tables.TABLE_EXTRACTION
+    )
+    cached = cache.get_json(key)
+    if cached is not None:
+        logger.info("Text cache hit for %s", digest[:12])
+        cached["report"]["cached"] = True
+        return cached["pages"], cached["report"]
+
+    pages, report = _extract_pages(pdf_file)
+    if not report["partial"]:
+        cache.put_json(key, {"pages": pages, "report": report})
+    return pages, report
+
+
+def _extract_pages(pdf_file: BinaryIO) -> Tuple[List[str], Dict]:
+    with _extraction_run(pdf_file):
+        return _run_extractors(pdf_file)
+
+
+def _run_extractors(pdf_file: BinaryIO) -> Tuple[List[str], Dict]:
+    started = time.perf_counter()
+    try:
+        probe = probe_pdf(pdf_file)
+    except Exception as exc:
+        # A damaged cross-reference table can upset the probe but still be
+        # readable by pdfplumber, so carry on without probe hints.
+        logger.warning("PDF probe failed, using default extractor order: %s", exc)
+        probe = {"page_count": 0, "text_pages": 0, "font_count": 0, "image_count": 0}
+
+    _local.run["ruled"] = probe.get("ruled_pages", [])
+    report = {
+        "probe": probe,
+        "probe_seconds": round(time.perf_counter() - started, 4),
+        "engine": None,
+        "quality": 0.0,
+        "attempts": [],
+        "partial": False,
+    }
+    best: List[str] = []
+    for name in choose_extractors(probe):
+        started = time.perf_counter()
+        try:
+            pages = EXTRACTORS[name]["func"](pdf_file)
+        except cancellation.Cancelled:
+            raise
+        except Exception as exc:
+            logger.warning("Extractor %s failed: %s", name, exc)
+            report["attempts"].append({"engine": name, "error": str(exc)})
+            continue
+        quality = text_quality(pages, probe)
+        elapsed = round(time.perf_counter() - started, 4)
+        report["attempts"].append({"engine": name, "quality": quality, "seconds": elapsed})
+        logger.info("Extractor %s: quality=%.2f in %.3fs", name, quality, elapsed)
+        if quality > report["quality"] or report["engine"] is None:
+            best, report["engine"], report["quality"] = pages, name, quality
+        if quality >= PDF_MIN_QUALITY or cancellation.expired():
+            break
+    if report["engine"] is None:
+        cancellation.check("extraction")
+        raise RuntimeError("; ".join(attempt["error"] for attempt in report["attempts"]))
+
+    # Only pages that came back (nearly) empty go through OCR, so a mixed
+    # document pays for rasterizing its scanned pages and nothing else.
+    report["ocr_pages"] = []
+    missing = [
+        index for index, text in enumerate(best)
+        if len(text.strip()) < MIN_CHARS_PER_PAGE
+    ]
+    if missing and ocr_available() and not cancellation.expired():
+        try:
+            recognised = ocr_pages(pdf_file, missing)
+            for index, text in recognised.items():
+                best[index] = text
+            report["ocr_pages"] = sorted(recognised)
+        except cancellation.DeadlineExceeded:
+            logger.warning("OCR ran out of time, keeping extracted text only")
+        except cancellation.Cancelled:
+            raise
+        except Exception as exc:
+            logger.warning("OCR failed, keeping extracted text only: %s", exc)
+    # Payment and violation tables become fields and leave the prompt text.
+    report["tables"] = tables.empty_report()
+    if not cancellation.expired():
+        try:
+            best, report["tables"] = tables.extract(
+                pdf_file, best, probe.get("ruled_pages"), _open_pdfplumber_document()
+            )
+        except cancellation.Cancelled:
+            raise
+        except Exception as exc:
+            logger.warning("Table extraction failed, keeping the flattened text: %s", exc)
+    ocr_unfinished = missing and ocr_available() and len(report["ocr_pages"]) < len(missing)
+    if cancellation.expired() and (len(best) < probe["page_count"] or ocr_unfinished):
+        report["partial"] = True
+        logger.warning(
+            "Text extraction ran out of time after %s of %s pages",
+            len(best) - len(missing) + len(report["ocr_pages"]),
+            probe["page_count"] or len(best),
+        )
+    return best, report
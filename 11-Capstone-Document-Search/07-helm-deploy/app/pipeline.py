@@ -0,0 +1,311 @@
+"""
+Document processing pipeline without any Streamlit dependency.
+
+The UI, the queue worker and other entry points share these functions:
+upload admission and spooling, text extraction and clean-up, page
+selection, then LLM extraction.
+Failures are returned in the result instead of being raised, so one bad
+document never stops a batch; only ``cancellation.Cancelled`` propagates,
+when the caller abandons the work.
+
+Each document has an end-to-end budget of ``DOCUMENT_DEADLINE_SECONDS``,
+of which its text extraction may use ``EXTRACTION_DEADLINE_SHARE``. The
+LLM stage of documents processed together runs until the sum of their
+budgets, counted from the start of the batch, so one slow document does not
+starve the others. When the budget runs out the stages stop and the result
+keeps whatever was obtained, with ``partial`` set.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import cache
+import cancellation
+import memprofile
+import metrics
+import page_selection
+import profiling
+import requery
+import revisions
+import schemas
+from llm import extract_fields_batch, merge_usage, record_cache_key
+from pdf_text import extract_pages
+from text_cleanup import clean_pages
+from uploads import admit_upload, spooled_pdf
+
+logger = logging.getLogger(__name__)
+
+# 0 turns the deadline off.
+DOCUMENT_DEADLINE_SECONDS = float(os.getenv("DOCUMENT_DEADLINE_SECONDS", "300"))
+# Extraction stops early enough to leave the rest of the budget for the LLM.
+EXTRACTION_DEADLINE_SHARE = float(os.getenv("EXTRACTION_DEADLINE_SHARE", "0.5"))
+
+
+def document_deadline(count: int = 1, started: Optional[float] = None):
+    """Budget of ``count`` documents processed together: their budgets added up.
+
+    Counted from ``started`` (a ``time.perf_counter()`` value, default now).
+    """
+    if DOCUMENT_DEADLINE_SECONDS <= 0:
+        return cancellation.deadline(None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    # A zero or negative budget would mean no deadline at all.
+    return cancellation.deadline(max(DOCUMENT_DEADLINE_SECONDS * count - elapsed, 0.001))
+
+
+@contextmanager
+def track_documents(count: int) -> Iterator[None]:
+    """Count ``count`` documents as in flight and record their latency.
+
+    The first document of the process is reported on its own, as
+    ``docproc_first_document_seconds``.
+    """
+    started = time.perf_counter()
+    metrics.add_gauge("docproc_inflight_documents", count)
+    try:
+        yield
+    finally:
+        metrics.add_gauge("docproc_inflight_documents", -count)
+        elapsed = time.perf_counter() - started
+        for _ in range(count):
+            metrics.observe_cold_start(
+                "docproc_document_seconds", elapsed, "docproc_first_document_seconds"
+            )
+
+
+def extract_document_pages(
+    upload: BinaryIO, size: int, name: str = "document"
+) -> Tuple[List[str], Dict]:
+    """Spool an upload and extract its cleaned page texts.
+
+    Returns the pages and the extraction report from
+    ``pdf_text.extract_pages``, with the ``text_cleanup`` report under
+    ``cleanup``. The report is ``partial`` when extraction ran out of time.
+    ``name`` labels the document in memory profiles.
+    """
+    with profiling.profile("extraction"), memprofile.document(name):
+        with cancellation.deadline(DOCUMENT_DEADLINE_SECONDS * EXTRACTION_DEADLINE_SHARE):
+            with admit_upload(size), spooled_pdf(upload) as pdf_data:
+                with memprofile.stage("pdf_pages"):
+                    pages, report = extract_pages(pdf_data)
+        with memprofile.stage("text_join"):
+            pages, report["cleanup"] = clean_pages(pages)
+    logger.info(
+        "PDF has %s pages; used %s (quality %.2f), tables took %.3fs",
+        len(pages),
+        report["engine"],
+        report["quality"],
+        report["tables"].get("seconds", 0.0),
+    )
+    return pages, report
+
+
+def join_pages(pages: List[str], indexes: Optional[List[int]] = None) -> str:
+    """Text of the given pages (all by default), one page after another."""
+    chosen = pages if indexes is None else [pages[index] for index in indexes]
+    return "".join(page_text + "\n" for page_text in chosen if page_text)
+
+
+def extract_records(
+    documents: List[List[str]], table_fields: Optional[List[Dict]] = None
+) -> List[Dict]:
+    """LLM extraction for documents given as page lists.
+
+    Long documents only send their most relevant pages (see
+    ``page_selection``). Documents whose required fields come back "N/A"
+    are retried with twice the page budget until all pages were sent.
+    Each result gains a ``pages`` entry: the selected page indexes, the
+    total page count and the number of rounds. When the deadline passes
+    before a retry round, the earlier record is kept and marked ``partial``.
+    Fields already read from tables (``table_fields``, one dict per
+    document, from the extraction report) fill the record; with
+    ``FIELD_REQUERY``, fields still unresolved are then asked for on their
+    own (see ``requery``). Only the final record of each document is
+    remembered for revision tracking, with the text of its last round.
+    """
+    # Documents are counted for ``PROFILE_EVERY_N`` at extraction, so this
+    # block is only profiled on its own when it turns out slow.
+    with profiling.profile("llm", documents=0):
+        results = _extract_records(documents)
+        settled: List[List[str]] = [[] for _ in results]
+        for index, fields in enumerate(table_fields or []):
+            settled[index] = _fill_from_tables(results[index], fields)
+        if requery.FIELD_REQUERY:
+            for pages, result, filled in zip(documents, results, settled):
+                _refine(pages, result, filled)
+        for pages, result in zip(documents, results):
+            if result["record"] is not None and not result.get("partial"):
+                text = join_pages(pages, result["pages"]["selected"])
+                revisions.remember(text, result["record"])
+        return results
+
+
+def _fill_from_tables(result: Dict, fields: Dict) -> List[str]:
+    """Table values win: their region was not in the prompt text.
+
+    Returns the fields filled.
+    """
+    if result.get("record") is None:
+        return []
+    wanted = schemas.field_names()
+    filled = []
+    for field, value in fields.items():
+        if field in wanted:
+            result["record"][field] = value
+            filled.append(field)
+    return filled
+
+
+def _refine(pages: List[str], result: Dict, settled: List[str]) -> None:
+    """Second pass for unresolved fields; the improved record is cached.
+
+    ``settled`` fields (read from tables, so not in ``pages``) are not asked again.
+    """
+    if (result.get("usage") or {}).get("cache_hit"):
+        return
+    if requery.refine(pages, result, settled):
+        text = join_pages(pages, result["pages"]["selected"])
+        cache.put_json(record_cache_key(text), result["record"])
+
+
+def _extract_records(documents: List[List[str]]) -> List[Dict]:
+    budgets = [page_selection.PAGE_TOKEN_BUDGET] * len(documents)
+    selections = [
+        page_selection.select_pages(pages, budget) for pages, budget in zip(documents, budgets)
+    ]
+    results = extract_fields_batch(
+        [join_pages(pages, selected) for pages, selected in zip(documents, selections)],
+        remember=False,
+    )
+    for index, result in enumerate(results):
+        result["pages"] = {
+            "selected": selections[index],
+            "total": len(documents[index]),
+            "rounds": 1,
+        }
+
+    pending = list(range(len(documents)))
+    while True:
+        retry = []
+        for index in pending:
+            result = results[index]
+            if (
+                result["record"] is None
+                or len(selections[index]) == len(documents[index])
+                or not page_selection.missing_required(result["record"])
+            ):
+                continue
+            while len(selections[index]) < len(documents[index]):
+                budgets[index] *= 2
+                wider = page_selection.select_pages(documents[index], budgets[index])
+                if len(wider) > len(selections[index]):
+                    selections[index] = wider
+                    retry.append(index)
+                    break
+        if not retry:
+            return results
+        try:
+            cancellation.check("extraction")
+        except cancellation.DeadlineExceeded:
+            for index in retry:
+                results[index]["partial"] = True
+            return results
+        logger.info("Retrying %s documents with more pages for missing fields", len(retry))
+        # More pages of the same upload: not a revision of the first round.
+        wider_results = extract_fields_batch(
+            [join_pages(documents[index], selections[index]) for index in retry],
+            find_revisions=False,
+            remember=False,
+        )
+        for index, wider in zip(retry, wider_results):
+            previous = results[index]
+            if wider["record"] is not None:
+                wider["usage"] = merge_usage(previous["usage"], wider["usage"])
+                wider["pages"] = {
+                    "selected": selections[index],
+                    "total": len(documents[index]),
+                    "rounds": previous["pages"]["rounds"] + 1,
+                }
+                _carry_revision(previous, wider)
+                results[index] = wider
+            elif wider.get("partial"):
+                previous["partial"] = True
+        pending = retry
+
+
+def _carry_revision(earlier: Dict, wider: Dict) -> None:
+    """Keep the first round's revision report, with changes up to the final record.
+
+    Retry rounds skip the revision look-up. The stored version's record is
+    the earlier record with the reported changes undone.
+    """
+    revision = earlier.get("revision")
+    if not revision:
+        return
+    stored = dict(earlier["record"])
+    stored.update({change["field"]: change["previous"] for change in revision["changes"]})
+    wider["revision"] = {
+        **revision,
+        "incremental": False,
+        "changes": revisions.field_changes(stored, wider["record"]),
+    }
+
+
+def process_documents(documents: List[Tuple[str, BinaryIO, int]]) -> List[Dict]:
+    """Run the whole pipeline for (filename, upload, size) documents.
+
+    Returns one result per document with ``filename``, ``record``,
+    ``error``, ``usage``, ``extraction``, ``partial`` and ``seconds`` keys.
+    """
+    with track_documents(len(documents)):
+        with profiling.profile("process_documents", documents=len(documents)):
+            return _process_documents(documents)
+
+
+def _process_documents(documents: List[Tuple[str, BinaryIO, int]]) -> List[Dict]:
+    started = time.perf_counter()
+    results = []
+    page_lists = []
+    for filename, upload, size in documents:
+        result = {
+            "filename": filename,
+            "record": None,
+            "error": None,
+            "usage": None,
+            "extraction": None,
+            "partial": False,
+        }
+        try:
+            pages, report = extract_document_pages(upload, size, filename)
+            result["extraction"] = report
+            result["partial"] = report.get("partial", False)
+            if join_pages(pages).strip():
+                page_lists.append((len(results), pages))
+            else:
+                result["error"] = "Could not extract text from the PDF."
+        except cancellation.DeadlineExceeded:
+            result["error"] = "Ran out of time extracting text from the PDF."
+            result["partial"] = True
+        except cancellation.Cancelled:
+            raise
+        except Exception as exc:
+            logger.error("Error extracting text from %s: %s", filename, exc, exc_info=True)
+            result["error"] = f"Error extracting text from PDF: {exc}"
+        results.append(result)
+
+    if page_lists:
+        with document_deadline(len(documents), started):
+            extracted = extract_records(
+                [pages for _, pages in page_lists],
+                [results[index]["extraction"]["tables"]["fields"] for index, _ in page_lists],
+            )
+        for (index, _), outcome in zip(page_lists, extracted):
+            partial = results[index]["partial"] or outcome.get("partial", False)
+            results[index].update(outcome, partial=partial)
+
+    elapsed = round(time.perf_counter() - started, 3)
+    for result in results:
+        result["seconds"] = elapsed
+    return results
@@ -0,0 +1,223 @@
+"""
+Sampling profiler for the document pipeline, switched on by environment.
+
+- ``PROFILE_EVERY_N``       profile every Nth document (0 = off).
+- ``PROFILE_SLOW_SECONDS``  keep the profile of any run slower than this
+  (0 = off). Every run is then sampled, and only slow ones are written.
+
+While a run is profiled, one sampler thread reads the thread's Python
+stack every ``PROFILE_INTERVAL_MS``. That covers text extraction, the LLM
+call and JSON handling without touching the code being measured. Each
+kept profile is written to ``PROFILE_DIR`` twice: as a ``.folded`` file
+of collapsed stacks (open it in speedscope, or pass it to flamegraph.pl)
+and as a self-contained ``.svg`` flamegraph. Only the newest
+``PROFILE_MAX_FILES`` profiles are kept.
+
+With both triggers off, ``profile()`` does nothing beyond one check.
+"""
+import html
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_EVERY_N = int(os.getenv("PROFILE_EVERY_N", "0"))
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/docproc-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+MAX_STACK_DEPTH = 128
+
+_active: Dict[int, Counter] = {}
+_active_lock = threading.Lock()
+_wake = threading.Event()
+_sampler: Optional[threading.Thread] = None
+_documents_seen = 0
+_local = threading.local()
+
+
+def enabled() -> bool:
+    return PROFILE_EVERY_N > 0 or PROFILE_SLOW_SECONDS > 0
+
+
+def _frame_name(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _stack(frame) -> str:
+    names: List[str] = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_forever() -> None:
+    interval = PROFILE_INTERVAL_MS / 1000
+    while True:
+        _wake.wait()
+        frames = sys._current_frames()
+        with _active_lock:
+            for thread_id, samples in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_stack(frame)] += 1
+            if not _active:
+                _wake.clear()
+        del frames
+        time.sleep(interval)
+
+
+def _start_sampling() -> Counter:
+    global _sampler
+    samples: Counter = Counter()
+    with _active_lock:
+        _active[threading.get_ident()] = samples
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, name="profiler", daemon=True)
+            _sampler.start()
+    _wake.set()
+    return samples
+
+
+def _stop_sampling() -> None:
+    with _active_lock:
+        _active.pop(threading.get_ident(), None)
+
+
+@contextmanager
+def profile(label: str, documents: int = 1) -> Iterator[None]:
+    """Profile the block when it is the Nth document or turns out slow.
+
+    Nested calls on the same thread are folded into the outermost one.
+    """
+    if not enabled() or getattr(_local, "active", False):
+        yield
+        return
+    global _documents_seen
+    with _active_lock:
+        before = _documents_seen
+        _documents_seen += documents
+        nth = PROFILE_EVERY_N > 0 and (
+            _documents_seen // PROFILE_EVERY_N > before // PROFILE_EVERY_N
+        )
+    # Mark the thread even when not sampling, so nested calls do not
+    # count the same documents again.
+    _local.active = True
+    try:
+        if not nth and PROFILE_SLOW_SECONDS <= 0:
+            yield
+            return
+        samples = _start_sampling()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            _stop_sampling()
+            slow = PROFILE_SLOW_SECONDS > 0 and elapsed >= PROFILE_SLOW_SECONDS
+            if (nth or slow) and samples:
+                try:
+                    write_profile(label, samples, elapsed, "slow" if slow else "nth", documents)
+                except OSError as exc:
+                    logger.warning("Could not write profile: %s", exc)
+    finally:
+        _local.active = False
+
+
+def write_profile(
+    label: str, samples: Counter, elapsed: float, reason: str, documents: int
+) -> str:
+    """Write folded stacks and an SVG flamegraph; returns the file stem."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{now % 1:.3f}"[1:]
+    stem = os.path.join(PROFILE_DIR, f"{stamp}-{label}-{reason}-{elapsed:.2f}s")
+    with open(f"{stem}.folded", "w", encoding="utf-8") as handle:
+        for stack, count in samples.most_common():
+            handle.write(f"{stack} {count}\n")
+    title = f"{label}: {documents} document(s), {elapsed:.2f}s, {reason}"
+    with open(f"{stem}.svg", "w", encoding="utf-8") as handle:
+        handle.write(render_flamegraph(samples, title))
+    metrics.inc("docproc_profiles_written_total", reason=reason)
+    logger.info("Profile written: %s.folded (%s samples)", stem, sum(samples.values()))
+    _rotate()
+    return stem
+
+
+def _rotate() -> None:
+    stems = sorted(
+        {
+            name.rsplit(".", 1)[0]
+            for name in os.listdir(PROFILE_DIR)
+            if name.endswith((".folded", ".svg"))
+        }
+    )
+    for stem in stems[: max(len(stems) - PROFILE_MAX_FILES, 0)]:
+        for suffix in (".folded", ".svg"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _tree(samples: Counter) -> Dict:
+    root: Dict = {"count": 0, "children": {}}
+    for stack, count in samples.items():
+        node = root
+        node["count"] += count
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"count": 0, "children": {}})
+            node["count"] += count
+    return root
+
+
+def render_flamegraph(samples: Counter, title: str, width: int = 1200) -> str:
+    """A self-contained SVG flamegraph (root at the bottom, hover for names)."""
+    row = 16
+    rects: List[Tuple[float, int, float, str, int]] = []
+    root = _tree(samples)
+    total = max(root["count"], 1)
+
+    def walk(node: Dict, x: float, depth: int) -> int:
+        deepest = depth
+        for name, child in sorted(node["children"].items()):
+            span = child["count"] / total * width
+            if span >= 0.5:
+                rects.append((x, depth, span, name, child["count"]))
+                deepest = max(deepest, walk(child, x, depth + 1))
+            x += span
+        return deepest
+
+    depth = walk(root, 0.0, 0)
+    height = (depth + 1) * row + 30
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        'font-family="monospace" font-size="11">',
+        f'<text x="4" y="16">{html.escape(title)} ({total} samples)</text>',
+    ]
+    for x, level, span, name, count in rects:
+        y = height - (level + 1) * row
+        hue = 20 + zlib.crc32(name.encode("utf-8")) % 40
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label}: {count} samples ({100 * count / total:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{span:.1f}" height="{row - 1}" '
+            f'fill="hsl({hue},85%,60%)"/>'
+        )
+        if span > 40:
+            text = html.escape(name[: int(span / 7)])
+            parts.append(f'<text x="{x + 2:.1f}" y="{y + 12}">{text}</text>')
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
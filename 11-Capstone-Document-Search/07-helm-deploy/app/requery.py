@@ -0,0 +1,168 @@
+"""
+Targeted second pass for fields the first extraction did not resolve.
+
+After extraction, a record's unresolved fields are those that came back
+"N/A" and, with ``REQUERY_UNVERIFIED``, those whose value does not occur
+anywhere in the document text (a cheap sign the model guessed). For
+these fields only, the lines that show evidence of them (the
+``page_selection`` patterns, with ``REQUERY_CONTEXT_LINES`` of context)
+are gathered from every page, up to ``REQUERY_TOKEN_BUDGET`` estimated
+tokens, and sent to the LLM with just those field names. Answers that do
+occur in the document replace the unresolved values; everything else in
+the record is left alone.
+
+Fields without any evidence in the document, not even their label, are
+not asked about again, and values already filled are never made worse.
+Fields the caller has settled otherwise (read from a table, whose text is
+no longer in the pages) are left out.
+The pass is off unless ``FIELD_REQUERY`` is set.
+"""
+import logging
+import os
+import re
+from typing import Collection, Dict, List, Tuple
+
+import cancellation
+import llm
+import metrics
+import page_selection
+import schemas
+
+logger = logging.getLogger(__name__)
+
+FIELD_REQUERY = os.getenv("FIELD_REQUERY", "false").lower() in ("1", "true", "yes")
+REQUERY_UNVERIFIED = os.getenv("REQUERY_UNVERIFIED", "true").lower() not in ("0", "false", "no")
+REQUERY_TOKEN_BUDGET = int(os.getenv("REQUERY_TOKEN_BUDGET", "800"))
+REQUERY_CONTEXT_LINES = int(os.getenv("REQUERY_CONTEXT_LINES", "2"))
+
+MISSING_VALUES = ("", "N/A", "NA", "NONE", "NONE PROVIDED")
+_NOT_ALNUM_RE = re.compile(r"[^0-9A-Z]+")
+
+
+def _squash(text: str) -> str:
+    """Letters and digits only, so layout and punctuation do not matter."""
+    return _NOT_ALNUM_RE.sub("", str(text).upper())
+
+
+def _is_missing(value) -> bool:
+    """Empty, "N/A" and the like, or only a blank fill line ("___")."""
+    return value is None or str(value).strip().upper() in MISSING_VALUES or not _squash(value)
+
+
+def _verified(value, document: str) -> bool:
+    squashed = _squash(value)
+    return bool(squashed) and squashed in document
+
+
+def unresolved_fields(
+    record: Dict, pages: List[str], settled: Collection[str] = ()
+) -> List[str]:
+    """Schema fields of ``record`` worth asking about again, except ``settled`` ones."""
+    document = _squash("\n".join(pages))
+    fields = []
+    for field in schemas.field_names():
+        if field in settled:
+            continue
+        value = record.get(field)
+        if _is_missing(value):
+            fields.append(field)
+        elif (
+            REQUERY_UNVERIFIED
+            and page_selection.evidence_patterns(field)
+            and not _verified(value, document)
+        ):
+            fields.append(field)
+    return fields
+
+
+def field_snippets(
+    pages: List[str], fields: List[str], token_budget: int = REQUERY_TOKEN_BUDGET
+) -> Tuple[str, List[str]]:
+    """Lines around the evidence for ``fields``, within ``token_budget``.
+
+    Returns the snippets, in document order and separated by "...", and
+    the fields they show evidence of. Windows matching more of the fields
+    are kept first when the budget is short.
+    """
+    windows = []
+    for page_index, page in enumerate(pages):
+        lines = page.splitlines()
+        spans: List[List] = []
+        for line_index, line in enumerate(lines):
+            matched = {
+                field
+                for field in fields
+                if any(pattern.search(line) for pattern in page_selection.evidence_patterns(field))
+            }
+            if not matched:
+                continue
+            start = max(line_index - REQUERY_CONTEXT_LINES, 0)
+            end = min(line_index + REQUERY_CONTEXT_LINES + 1, len(lines))
+            if spans and start <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+                spans[-1][2] |= matched
+            else:
+                spans.append([start, end, matched])
+        for start, end, matched in spans:
+            text = "\n".join(line.strip() for line in lines[start:end] if line.strip())
+            windows.append(((page_index, start), text, matched))
+
+    ranked = sorted(windows, key=lambda window: (-len(window[2]), window[0]))
+    chosen = []
+    found = set()
+    used = 0
+    for window in ranked:
+        cost = llm.estimate_tokens(window[1])
+        if chosen and used + cost > token_budget:
+            continue
+        chosen.append(window)
+        found |= window[2]
+        used += cost
+    chosen.sort(key=lambda window: window[0])
+    snippets = "\n...\n".join(text for _, text, _ in chosen)
+    return snippets, [field for field in fields if field in found]
+
+
+def refine(pages: List[str], result: Dict, settled: Collection[str] = ()) -> List[str]:
+    """Re-ask for the unresolved fields of ``result["record"]`` and merge.
+
+    Fields in ``settled`` are never asked about or replaced.
+
+    Updates ``result`` in place: the record gains the answers that occur
+    in the document, ``usage`` adds the call, and ``requery`` reports the
+    fields asked for and filled. Returns the filled fields. A failed or
+    timed-out second pass leaves the record as it was.
+    """
+    record = result.get("record")
+    if record is None or cancellation.expired():
+        return []
+    unresolved = unresolved_fields(record, pages, settled)
+    if not unresolved:
+        return []
+    snippets, fields = field_snippets(pages, unresolved)
+    if not fields:
+        return []
+    logger.info("Re-asking for %s fields from %s characters", len(fields), len(snippets))
+    try:
+        answers, usage = llm.requery_fields(snippets, fields)
+    except cancellation.DeadlineExceeded:
+        return []
+    except cancellation.Cancelled:
+        raise
+    except Exception as exc:
+        logger.warning("Field re-query failed: %s", llm.describe_llm_error(exc))
+        return []
+
+    document = _squash("\n".join(pages))
+    filled = []
+    for field in fields:
+        value = answers.get(field)
+        if not _is_missing(value) and _verified(value, document):
+            record[field] = value
+            filled.append(field)
+    result["usage"] = llm.merge_usage(result.get("usage"), usage)
+    result["requery"] = {"fields": fields, "filled": filled}
+    metrics.inc("docproc_requery_calls_total")
+    metrics.inc("docproc_requery_fields_total", len(fields), outcome="asked")
+    metrics.inc("docproc_requery_fields_total", len(filled), outcome="filled")
+    return filled
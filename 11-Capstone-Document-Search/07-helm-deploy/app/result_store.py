@@ -0,0 +1,103 @@
+"""
+Shared, size-capped on-disk store for processing results.
+
+Sessions keep only the short handle returned by ``put_bytes`` / ``put_json``
+in ``st.session_state``; the payloads (Excel bytes, extracted rows) live in
+one directory shared by every session on the replica. Reading an entry
+refreshes its modification time, and writes evict the least recently used
+entries once the directory is over ``RESULT_STORE_MAX_MB``. An evicted
+handle simply reads back as ``None``.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from typing import Any, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR") or os.path.join(
+    tempfile.gettempdir(), "result-store"
+)
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_MB", "256")) * 1024 * 1024
+
+_evict_lock = threading.Lock()
+
+
+def _path(handle: str) -> str:
+    # Handles are generated here, but they round-trip through session
+    # state, so never let one escape the store directory.
+    if not handle or not handle.isalnum():
+        raise ValueError(f"Invalid result handle: {handle!r}")
+    return os.path.join(RESULT_STORE_DIR, f"{handle}.bin")
+
+
+def _evict() -> None:
+    with _evict_lock:
+        entries = []
+        with os.scandir(RESULT_STORE_DIR) as scan:
+            for entry in scan:
+                if entry.name.endswith(".bin"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= RESULT_STORE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info("Evicted %s result(s) from the store", evicted)
+            metrics.inc("docproc_result_store_evictions_total", evicted)
+        metrics.set_gauge("docproc_result_store_bytes", total)
+        metrics.set_gauge("docproc_result_store_entries", len(entries) - evicted)
+
+
+def put_bytes(payload: bytes) -> str:
+    """Store ``payload`` and return its handle."""
+    os.makedirs(RESULT_STORE_DIR, exist_ok=True)
+    handle = uuid.uuid4().hex
+    path = _path(handle)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as handle_file:
+        handle_file.write(payload)
+    os.replace(tmp_path, path)
+    _evict()
+    return handle
+
+
+def get_bytes(handle: Optional[str]) -> Optional[bytes]:
+    """Payload for ``handle``, or None if it was never stored or was evicted."""
+    if not handle:
+        return None
+    path = _path(handle)
+    try:
+        with open(path, "rb") as handle_file:
+            payload = handle_file.read()
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return payload
+
+
+def put_json(value: Any) -> str:
+    """Store a JSON-serialisable value and return its handle."""
+    return put_bytes(json.dumps(value, default=str).encode("utf-8"))
+
+
+def get_json(handle: Optional[str]) -> Any:
+    """Value stored with ``put_json``, or None."""
+    payload = get_bytes(handle)
+    return json.loads(payload) if payload is not None else None
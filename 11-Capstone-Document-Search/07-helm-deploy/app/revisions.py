@@ -0,0 +1,189 @@
+"""
+Revision tracking for resubmitted forms.
+
+Applicants often resubmit a corrected form that differs by a line or two.
+The text and record of every extracted form are kept in the shared cache
+under its license number and applicant name. When a new upload names a
+form we have seen, its text is diffed line by line against the stored
+text; if only a small part changed, just the changed regions (plus a few
+lines of context, so labels travel with their values) are sent to the
+LLM and the result is merged into the stored record. Forms are kept per
+field schema (see ``schemas``), so a record is only ever merged with one
+of the same shape.
+
+PDF text layers rarely keep paragraph breaks, so lines are the diff unit;
+blank-line separated paragraphs still diff as runs of lines.
+"""
+import difflib
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cache
+import schemas
+from cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+REVISION_TRACKING = os.getenv("REVISION_TRACKING", "true").lower() not in ("0", "false", "no")
+REVISION_MAX_CHANGED_RATIO = float(os.getenv("REVISION_MAX_CHANGED_RATIO", "0.3"))
+REVISION_CONTEXT_LINES = int(os.getenv("REVISION_CONTEXT_LINES", "2"))
+REVISION_TTL_SECONDS = int(os.getenv("REVISION_TTL_SECONDS", str(90 * 24 * 3600)))
+
+MISSING_VALUES = ("", "N/A", "NA", "NONE PROVIDED")
+
+# Identity lines as they appear on the forms: "License Number: X" or the
+# label on one line and the value on the next.
+_LICENSE_RE = re.compile(
+    r"licen[cs]e\s*(?:number|no\.?|#|id)\s*:?[ \t]*\n?[ \t]*([A-Z0-9][A-Z0-9/-]{3,})",
+    re.I,
+)
+_APPLICANT_RE = re.compile(
+    r"(?:applicant\s*name|full\s*name|name\s*of\s*applicant)\s*:?[ \t]*\n?[ \t]*([^\n:]{3,80})",
+    re.I,
+)
+
+
+def _normalise(value: str) -> str:
+    return re.sub(r"\s+", " ", str(value)).strip().upper()
+
+
+def _is_missing(value) -> bool:
+    return value is None or _normalise(value) in MISSING_VALUES
+
+
+def _text_license(text: str) -> Optional[str]:
+    match = _LICENSE_RE.search(text)
+    return match.group(1) if match else None
+
+
+def identity_keys(text: str = "", record: Optional[Dict] = None) -> List[str]:
+    """Cache keys that identify a form, from its record or its text.
+
+    The license key, when there is a license number, comes first. The keys
+    belong to the field schema in use.
+    """
+    record = record or {}
+    scope = schemas.current()["id"]
+    license_number = record.get("license_number")
+    applicant = record.get("applicant_name")
+    if _is_missing(license_number):
+        license_number = _text_license(text)
+    if _is_missing(applicant):
+        match = _APPLICANT_RE.search(text)
+        applicant = match.group(1) if match else None
+    keys = []
+    if not _is_missing(license_number):
+        keys.append(cache_key("revision", scope, "license", _normalise(license_number)))
+    if not _is_missing(applicant):
+        keys.append(cache_key("revision", scope, "applicant", _normalise(applicant)))
+    return keys
+
+
+def find_previous(text: str) -> Optional[Dict]:
+    """Stored text and record of an earlier version of this form, if any.
+
+    A form with a license number is only matched by that number: two
+    applicants may share a name. The applicant name is used only when the
+    text has no license number, and a stored form whose record names a
+    different license number is never a match.
+    """
+    if not REVISION_TRACKING:
+        return None
+    license_number = _text_license(text)
+    keys = identity_keys(text)
+    if license_number:
+        keys = keys[:1]
+    for key in keys:
+        previous = cache.get_json(key)
+        if not previous:
+            continue
+        stored = (previous.get("record") or {}).get("license_number")
+        if (
+            license_number
+            and not _is_missing(stored)
+            and _normalise(stored) != _normalise(license_number)
+        ):
+            logger.info("Stored form is for license %s, not %s", stored, license_number)
+            continue
+        return previous
+    return None
+
+
+def remember(text: str, record: Dict) -> None:
+    """Store a form's text and record under each of its identity keys."""
+    if not REVISION_TRACKING or record is None:
+        return
+    entry = {"text": text, "record": record, "updated_at": time.time()}
+    for key in identity_keys(text, record):
+        cache.put_json(key, entry, ttl=REVISION_TTL_SECONDS)
+
+
+def _lines(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def diff_text(old_text: str, new_text: str) -> Dict:
+    """Line diff of two versions of a form.
+
+    Returns ``changed_lines`` (count of inserted or replaced lines),
+    ``total_lines``, ``regions`` (changed parts of the new text with
+    context) and ``removed`` (lines only in the old text).
+    """
+    old_lines = _lines(old_text)
+    new_lines = _lines(new_text)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    spans: List[Tuple[int, int]] = []
+    removed: List[str] = []
+    changed = 0
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        removed.extend(old_lines[old_start:old_end])
+        changed += max(new_end - new_start, old_end - old_start)
+        start = max(new_start - REVISION_CONTEXT_LINES, 0)
+        end = min(max(new_end, new_start + 1) + REVISION_CONTEXT_LINES, len(new_lines))
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return {
+        "changed_lines": changed,
+        "total_lines": max(len(new_lines), len(old_lines), 1),
+        "regions": ["\n".join(new_lines[start:end]) for start, end in spans],
+        "removed": removed,
+    }
+
+
+def merge_records(previous: Dict, partial: Dict, removed: List[str], new_text: str) -> Dict:
+    """Overlay fields found in the changed regions onto the stored record.
+
+    A field the regions do not mention keeps its stored value, unless that
+    value only appeared on lines the revision removed.
+    """
+    merged = dict(previous)
+    removed_text = _normalise("\n".join(removed))
+    current_text = _normalise(new_text)
+    for field, value in partial.items():
+        if not _is_missing(value):
+            merged[field] = value
+    for field, value in previous.items():
+        if _is_missing(value) or not _is_missing(partial.get(field)):
+            continue
+        old_value = _normalise(value)
+        if old_value in removed_text and old_value not in current_text:
+            merged[field] = "N/A"
+    return merged
+
+
+def field_changes(previous: Dict, record: Dict) -> List[Dict]:
+    """Fields whose value differs between two records."""
+    changes = []
+    for field in list(previous) + [name for name in record if name not in previous]:
+        old_value = previous.get(field, "N/A")
+        new_value = record.get(field, "N/A")
+        if _normalise(old_value) != _normalise(new_value):
+            changes.append({"field": field, "previous": old_value, "current": new_value})
+    return changes
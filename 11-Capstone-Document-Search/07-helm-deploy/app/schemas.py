@@ -0,0 +1,253 @@
+"""
+Named, versioned field schemas for LLM extraction.
+
+A schema lists the fields a workflow needs, with a description of each.
+It generates the extraction prompts and the shape of the records that
+come back: a lean schema asks only for its fields, so the model writes a
+much shorter reply. ``renewal-full`` is the complete form and also keeps
+any extra fields the model finds; ``renewal-minimal`` covers identity,
+expiry and payment status only.
+
+``FIELD_SCHEMA`` names the default schema. Callers pick one per batch
+with ``use(name)``, which travels with the work like a cancel token.
+``FIELD_SCHEMAS_FILE`` may name a JSON file of further schemas::
+
+    {"renewal-payment": {"version": 1,
+                         "fields": {"license_number": "License number or ID",
+                                    "payment_amount": "Amount paid"}}}
+
+Bump a schema's ``version`` whenever its fields or descriptions change:
+the version is part of the cache key, so records extracted under the old
+definition are not reused.
+"""
+import contextvars
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FIELD_SCHEMA = os.getenv("FIELD_SCHEMA", "renewal-full")
+FIELD_SCHEMAS_FILE = os.getenv("FIELD_SCHEMAS_FILE", "")
+
+# Rough reply size per field; used to reserve output tokens when packing.
+OUTPUT_TOKENS_PER_FIELD = 22
+MISSING = "N/A"
+
+_FULL_FIELDS = {
+    "applicant_name": "Full name of the applicant/license holder",
+    "license_number": "License number or ID",
+    "license_type": "Type of license (e.g., Driver's License, Professional License, etc.)",
+    "expiry_date": "Current expiration date of the license",
+    "renewal_date": "Date of renewal application or renewal date",
+    "address": "Complete address (street, city, state, zip)",
+    "contact_number": "Phone number or contact number",
+    "email": "Email address",
+    "payment_status": "Payment status (Paid, Pending, etc.)",
+    "payment_amount": "Amount paid (if mentioned)",
+    "transaction_id": "Transaction or payment reference number (if mentioned)",
+    "date_of_birth": "Date of birth (if mentioned)",
+    "previous_violations": "Any violations or disciplinary actions (if mentioned)",
+    "additional_notes": "Any additional information, notes, or remarks",
+}
+
+SCHEMAS: Dict[str, Dict] = {
+    "renewal-full": {"version": 1, "fields": _FULL_FIELDS, "extra_fields": True},
+    "renewal-minimal": {
+        "version": 1,
+        "fields": {
+            name: _FULL_FIELDS[name]
+            for name in ("applicant_name", "license_number", "expiry_date", "payment_status")
+        },
+        "extra_fields": False,
+    },
+}
+
+
+class UnknownSchema(ValueError):
+    """No field schema is registered under the requested name."""
+
+
+def register(name: str, fields: Dict[str, str], version: int = 1, extra_fields: bool = False):
+    """Add (or replace) a schema in the registry."""
+    if not fields:
+        raise ValueError(f"Field schema {name} has no fields")
+    SCHEMAS[name] = {
+        "version": int(version),
+        "fields": dict(fields),
+        "extra_fields": bool(extra_fields),
+    }
+
+
+def _load_file(path: str) -> None:
+    try:
+        with open(path, encoding="utf-8") as handle:
+            definitions = json.load(handle)
+        for name, definition in definitions.items():
+            register(
+                name,
+                definition["fields"],
+                definition.get("version", 1),
+                definition.get("extra_fields", False),
+            )
+    except (OSError, ValueError, KeyError, AttributeError, TypeError) as exc:
+        logger.warning("Could not load field schemas from %s: %s", path, exc)
+
+
+if FIELD_SCHEMAS_FILE:
+    _load_file(FIELD_SCHEMAS_FILE)
+
+
+_current: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "field_schema", default=None
+)
+
+
+def names() -> List[str]:
+    """Registered schema names, the default first."""
+    return sorted(SCHEMAS, key=lambda name: (name != FIELD_SCHEMA, name))
+
+
+def validate(name: Optional[str]) -> str:
+    """The schema name to use for ``name`` (the default when empty)."""
+    name = name or FIELD_SCHEMA
+    if name not in SCHEMAS:
+        raise UnknownSchema(f"Unknown field schema {name!r}; choose one of {', '.join(names())}")
+    return name
+
+
+@contextmanager
+def use(name: Optional[str]) -> Iterator[str]:
+    """Extract with the named schema for the block (the default when empty)."""
+    reset = _current.set(validate(name))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(reset)
+
+
+def current_name() -> str:
+    """Name of the schema in use in this thread/context."""
+    return _current.get() or validate(None)
+
+
+def current() -> Dict:
+    """Definition of the schema in use, with its ``name`` and ``id``."""
+    name = current_name()
+    schema = SCHEMAS[name]
+    return {**schema, "name": name, "id": f"{name}@v{schema['version']}"}
+
+
+def field_names(schema: Optional[Dict] = None) -> List[str]:
+    return list((schema or current())["fields"])
+
+
+def output_tokens(schema: Optional[Dict] = None) -> int:
+    """Reply tokens to reserve for one record under the schema."""
+    schema = schema or current()
+    extra = 4 if schema["extra_fields"] else 0
+    return (len(schema["fields"]) + extra) * OUTPUT_TOKENS_PER_FIELD + 20
+
+
+_INTRO = (
+    "You are a document processing assistant specialized in extracting "
+    "structured data from government license renewal forms."
+)
+
+
+def _field_block(schema: Dict) -> str:
+    return json.dumps(schema["fields"], indent=4, ensure_ascii=False)
+
+
+def _rules(schema: Dict, packed: bool) -> List[str]:
+    rules = [
+        "Extract values exactly as they appear in the document",
+        f'If a field is not present in the document, set it to "{MISSING}"',
+        "For dates, preserve the format as shown in the document",
+    ]
+    if schema["extra_fields"]:
+        rules.append(
+            "Include ALL fields you find, even if they don't match the standard fields "
+            "above - add them as additional fields"
+        )
+    else:
+        rules.append("Return ONLY the fields listed above, with no other fields")
+    if packed:
+        rules += [
+            'Add a "document_index" field to every object holding the document number '
+            "<n> from its markers",
+            "Return ONLY a valid JSON array with one object per document, in document "
+            "order, no markdown formatting, no code blocks, no additional text before or "
+            "after the JSON",
+        ]
+    else:
+        rules.append(
+            "Return ONLY valid JSON, no markdown formatting, no code blocks, no additional "
+            "text before or after the JSON"
+        )
+    rules.append("Ensure all string values are properly quoted and escaped if needed")
+    return [f"{number}. {rule}" for number, rule in enumerate(rules, start=1)]
+
+
+def system_prompt(schema: Optional[Dict] = None) -> str:
+    """Instructions for extracting one document under the schema."""
+    schema = schema or current()
+    full = schema["extra_fields"]
+    return "\n".join(
+        [
+            _INTRO,
+            "",
+            f"Extract {'ALL information' if full else 'the fields below'} from the license "
+            "renewal form document in the user message. Analyze the document and extract "
+            f"{'all' if full else 'the'} fields and their corresponding values. "
+            "Return the data as a JSON object with the following structure. Map the fields "
+            "from the document to these standard fields:",
+            "",
+            _field_block(schema),
+            "",
+            "Important instructions:",
+            *_rules(schema, packed=False),
+        ]
+    )
+
+
+def packed_system_prompt(schema: Optional[Dict] = None) -> str:
+    """Instructions for extracting several marked documents under the schema."""
+    schema = schema or current()
+    return "\n".join(
+        [
+            _INTRO,
+            "",
+            'The user message contains several license renewal form documents. Every '
+            'document is wrapped in "=== DOCUMENT <n> START ===" and "=== DOCUMENT <n> '
+            'END ===" markers. Treat each document separately and never mix values '
+            "between documents.",
+            "",
+            f"For each document, extract {'all' if schema['extra_fields'] else 'the'} fields "
+            "and their corresponding values as a "
+            "JSON object with the following structure. Map the fields from the document "
+            "to these standard fields:",
+            "",
+            _field_block(schema),
+            "",
+            "Important instructions:",
+            *_rules(schema, packed=True),
+        ]
+    )
+
+
+def shape_record(record: Dict, schema: Optional[Dict] = None) -> Dict:
+    """A parsed reply in the schema's shape.
+
+    Every schema field is present, in schema order ("N/A" when the model
+    left it out). Other fields are kept only by schemas with
+    ``extra_fields``.
+    """
+    schema = schema or current()
+    shaped = {name: record.get(name, MISSING) for name in schema["fields"]}
+    if schema["extra_fields"]:
+        for name, value in record.items():
+            shaped.setdefault(name, value)
+    return shaped
@@ -0,0 +1,84 @@
+"""
+Launch the Streamlit UI with the status server already running.
+
+The readiness probe asks ``/ready`` on the status server, but Streamlit
+only runs ``app.py`` (which used to start that server) when a browser
+session opens, and a Pod that is never Ready never gets one. This
+launcher starts the status server when the process boots, then runs
+``streamlit run app/app.py`` in the same process so both share the
+metrics registry. Until Streamlit answers its own health check,
+``/ready`` reports it as not up yet.
+
+When this Pod calls the LLM itself (``PROCESSING_MODE`` other than
+``queue``), the connection warm-up (``warmup``) starts here too, so it is
+done before the first session rather than started by it.
+
+    python app/serve.py --server.port=8501 --server.address=0.0.0.0
+
+Arguments are passed on to ``streamlit run``.
+"""
+import os
+import sys
+import urllib.request
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# Before the imports below: they read their settings from the environment.
+load_dotenv()
+
+import status_server  # noqa: E402
+import warmup  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(HERE, "app.py")
+HEALTH_TIMEOUT_SECONDS = 1.0
+
+_streamlit_up = False
+
+
+def streamlit_port(args: List[str]) -> int:
+    """The port Streamlit will listen on, from the arguments or environment."""
+    port = os.getenv("STREAMLIT_SERVER_PORT", "8501")
+    for position, arg in enumerate(args):
+        if arg.startswith("--server.port="):
+            port = arg.split("=", 1)[1]
+        elif arg == "--server.port" and position + 1 < len(args):
+            port = args[position + 1]
+    return int(port)
+
+
+def streamlit_check(port: int):
+    """Readiness check that fails until Streamlit's health endpoint answers."""
+    url = f"http://127.0.0.1:{port}/_stcore/health"
+
+    def check() -> Optional[str]:
+        global _streamlit_up
+        if _streamlit_up:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=HEALTH_TIMEOUT_SECONDS) as response:
+                _streamlit_up = response.status == 200
+        except OSError:
+            pass
+        return None if _streamlit_up else "Streamlit is not serving yet"
+
+    return check
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    status_server.add_readiness_check(streamlit_check(streamlit_port(args)))
+    queue_mode = os.getenv("PROCESSING_MODE", "inline").lower() == "queue"
+    status_server.start(queue_metrics=queue_mode)
+    if not queue_mode:
+        warmup.start()
+
+    from streamlit.web import cli as streamlit_cli
+
+    sys.argv = ["streamlit", "run", APP_SCRIPT, *args]
+    return streamlit_cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
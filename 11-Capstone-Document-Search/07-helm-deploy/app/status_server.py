@@ -0,0 +1,130 @@
+"""
+Metrics and readiness endpoints for the document processor.
+
+Streamlit does not let the app add its own HTTP routes, so a small side
+server on ``METRICS_PORT`` serves:
+
+- ``/metrics`` the Prometheus text from ``metrics`` (queue depth, oldest
+  job age, in-flight LLM calls and documents, rolling latency percentiles).
+- ``/ready``   200 while the replica has headroom, 503 with the reasons
+  when it is saturated, so the Service stops sending it new sessions.
+- ``/healthz`` 200 while the process is up.
+
+A ``READY_*`` limit of 0 switches that check off. The UI Pod starts this
+server from ``serve.py`` before Streamlit, so ``/ready`` answers (503
+until Streamlit itself is up) without waiting for a first browser session.
+"""
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+import metrics
+from uploads import inflight_upload_bytes, waiting_uploads
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+READY_MAX_INFLIGHT_LLM = int(os.getenv("READY_MAX_INFLIGHT_LLM", "8"))
+READY_MAX_INFLIGHT_DOCUMENTS = int(os.getenv("READY_MAX_INFLIGHT_DOCUMENTS", "0"))
+READY_MAX_P95_SECONDS = float(os.getenv("READY_MAX_P95_SECONDS", "0"))
+
+_server = None
+_server_lock = threading.Lock()
+_queue_metrics = False
+_readiness_checks: List[Callable[[], Optional[str]]] = []
+
+
+def refresh_queue_metrics() -> None:
+    """Publish the shared job queue's depth and oldest-job age."""
+    import jobqueue
+
+    try:
+        metrics.set_gauge("docproc_queue_depth", jobqueue.queue_depth())
+        metrics.set_gauge("docproc_oldest_job_age_seconds", jobqueue.oldest_job_age())
+    except Exception as exc:
+        logger.warning("Could not read queue metrics: %s", exc)
+
+
+def add_readiness_check(check: Callable[[], Optional[str]]) -> None:
+    """Make ``/ready`` fail while ``check`` returns a reason (None when ready)."""
+    _readiness_checks.append(check)
+
+
+def saturation_reasons() -> List[str]:
+    """Why this replica should not take new work (empty when it can)."""
+    reasons = [reason for reason in (check() for check in _readiness_checks) if reason]
+    llm_calls = metrics.gauge_value("docproc_llm_inflight_calls")
+    if READY_MAX_INFLIGHT_LLM and llm_calls >= READY_MAX_INFLIGHT_LLM:
+        reasons.append(f"{llm_calls:.0f} LLM calls in flight (limit {READY_MAX_INFLIGHT_LLM})")
+    documents = metrics.gauge_value("docproc_inflight_documents")
+    if READY_MAX_INFLIGHT_DOCUMENTS and documents >= READY_MAX_INFLIGHT_DOCUMENTS:
+        reasons.append(
+            f"{documents:.0f} documents in flight (limit {READY_MAX_INFLIGHT_DOCUMENTS})"
+        )
+    if waiting_uploads():
+        reasons.append(f"{waiting_uploads()} uploads waiting for admission")
+    p95 = metrics.latency_percentile("docproc_document_seconds", 0.95)
+    if READY_MAX_P95_SECONDS and p95 is not None and p95 > READY_MAX_P95_SECONDS:
+        reasons.append(f"p95 document latency {p95:.1f}s (limit {READY_MAX_P95_SECONDS:g}s)")
+    return reasons
+
+
+def _refresh() -> List[str]:
+    if _queue_metrics:
+        refresh_queue_metrics()
+    metrics.set_gauge("docproc_inflight_upload_bytes", inflight_upload_bytes())
+    metrics.set_gauge("docproc_waiting_uploads", waiting_uploads())
+    reasons = saturation_reasons()
+    metrics.set_gauge("docproc_saturated", 1 if reasons else 0)
+    return reasons
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            _refresh()
+            self._reply(
+                200,
+                metrics.render_prometheus().encode("utf-8"),
+                "text/plain; version=0.0.4",
+            )
+        elif path == "/ready":
+            reasons = _refresh()
+            body = json.dumps({"ready": not reasons, "reasons": reasons}).encode("utf-8")
+            self._reply(503 if reasons else 200, body, "application/json")
+        elif path == "/healthz":
+            self._reply(200, b"ok", "text/plain")
+        else:
+            self._reply(404, b"not found", "text/plain")
+
+    def log_message(self, format, *args):
+        logger.debug("status server: " + format, *args)
+
+
+def start(queue_metrics: bool = False) -> None:
+    """Start the status server once per process (later calls are no-ops)."""
+    global _server, _queue_metrics
+    with _server_lock:
+        _queue_metrics = _queue_metrics or queue_metrics
+        if _server is not None or not METRICS_PORT:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), StatusHandler)
+        except OSError as exc:
+            logger.warning("Status server not started on port %s: %s", METRICS_PORT, exc)
+            _server = False
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="status-server", daemon=True).start()
+        logger.info("Serving /metrics and /ready on port %s", METRICS_PORT)
@@ -0,0 +1,240 @@
+"""
+Table-aware extraction for the payment and violation sections of a form.
+
+Those sections are often ruled tables. Flattened into text they lose
+their structure, and the LLM spends tokens and time putting the cells back
+together, not always correctly. With ``TABLE_EXTRACTION`` on, pages whose
+text mentions a payment or a violation, and that draw enough lines to hold
+a ruled table (counted by the PDF probe from the raw content stream, see
+``count_segments``), are searched with pdfplumber's table finder, and
+recognised tables are mapped straight to fields:
+
+- key/value tables ("Amount Paid | $250.00") and column tables with one
+  data row ("Amount | Transaction ID | Status") give ``payment_amount``,
+  ``transaction_id`` and ``payment_status``;
+- tables with a violation or offence column (or label) give
+  ``previous_violations``: one "cell - cell" entry per row, "None" when
+  the table has no rows.
+
+A page with a mapped table is re-read by pdfplumber without the table
+region, so the prompt shrinks; cells that mapped to no field are kept as
+"Label: value" lines. When the text itself came from pdfplumber, its open
+document is reused rather than parsed again. The fields travel in the
+extraction report and fill the LLM record (see
+``pipeline.extract_records``). Needs the optional pdfplumber package;
+without it pages are left as they are.
+"""
+import importlib.util
+import logging
+import os
+import re
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import PyPDF2
+
+import cancellation
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TABLE_EXTRACTION = os.getenv("TABLE_EXTRACTION", "true").lower() not in ("0", "false", "no")
+
+# Only pages mentioning one of these are searched for tables.
+_CANDIDATE_RE = re.compile(
+    r"\b(payments?|amount|fees?|transaction|receipt|violations?|offen[cs]es?|disciplinary)\b",
+    re.I,
+)
+_VIOLATION_RE = re.compile(
+    r"\b(violations?|offen[cs]es?|infractions?|disciplinary|convictions?)\b", re.I
+)
+# First match wins: "Transaction Amount" is an amount.
+_LABEL_FIELDS = [
+    ("payment_amount", re.compile(r"\b(amount|fee|total)\b", re.I)),
+    ("transaction_id", re.compile(r"\b(transaction|reference|receipt|confirmation)\b", re.I)),
+    ("payment_status", re.compile(r"\bstatus\b", re.I)),
+]
+# Column headings besides the field labels themselves.
+_HEADING_RE = re.compile(
+    r"^(date|description|details?|outcome|result|type|method|notes?|penalty|action|"
+    r"remarks?|no\.?|#)$",
+    re.I,
+)
+_NONE_RE = re.compile(r"^(none|nil|n/?a|-+|no (violations?|offen[cs]es?|record)\b.*)$", re.I)
+_SPACE_RE = re.compile(r"\s+")
+# Path operators in a content stream: "re" draws a rectangle (4 edges), "l"
+# one line segment. Two rows by two columns take at least six segments.
+_PATH_OP_RE = re.compile(rb"(?<![^\s\d.])(re|l)(?=\s)")
+MIN_TABLE_SEGMENTS = 6
+
+
+def available() -> bool:
+    return importlib.util.find_spec("pdfplumber") is not None
+
+
+def is_candidate(text: str) -> bool:
+    """Whether a page's text mentions a payment or a violation."""
+    return bool(_CANDIDATE_RE.search(text))
+
+
+def count_segments(page) -> int:
+    """Line segments a PyPDF2 page draws, from its raw content stream.
+
+    Far cheaper than pdfplumber's layout analysis of the page.
+    """
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+    return sum(4 if op == b"re" else 1 for op in _PATH_OP_RE.findall(data))
+
+
+def ruled_pages(pdf_file: BinaryIO, indexes: List[int]) -> List[int]:
+    """The pages among ``indexes`` that draw enough lines for a ruled table."""
+    pdf_file.seek(0)
+    reader = PyPDF2.PdfReader(pdf_file)
+    return [
+        index
+        for index in indexes
+        if index < len(reader.pages) and count_segments(reader.pages[index]) >= MIN_TABLE_SEGMENTS
+    ]
+
+
+def _clean(rows: List[List[Optional[str]]]) -> List[List[str]]:
+    cleaned = [[_SPACE_RE.sub(" ", cell or "").strip() for cell in row] for row in rows]
+    return [row for row in cleaned if any(row)]
+
+
+def _label_field(label: str) -> Optional[str]:
+    if _VIOLATION_RE.search(label):
+        return "previous_violations"
+    for field, pattern in _LABEL_FIELDS:
+        if pattern.search(label):
+            return field
+    return None
+
+
+def _violations(rows: List[List[str]]) -> str:
+    entries = [" - ".join(cell for cell in row if cell) for row in rows]
+    entries = [entry for entry in entries if entry and not _NONE_RE.match(entry)]
+    return "; ".join(entries) or "None"
+
+
+def _is_header(row: List[str]) -> bool:
+    """True when every cell is a column heading rather than a value."""
+    return all(cell and (_label_field(cell) or _HEADING_RE.match(cell)) for cell in row)
+
+
+def map_table(rows: List[List[Optional[str]]]) -> Tuple[Dict[str, str], List[str]]:
+    """Fields read from one table, and its other cells as "Label: value" lines.
+
+    Returns no fields for tables that do not look like a payment or
+    violation section; such tables stay in the page text.
+    """
+    rows = _clean(rows)
+    if not rows:
+        return {}, []
+    header, data = rows[0], rows[1:]
+    if all(len(row) == 2 for row in rows) and not _is_header(header):
+        # Label cell, value cell.
+        pairs = [(label.rstrip(":"), value) for label, value in rows]
+    elif not _is_header(header):
+        return {}, []
+    elif any(_VIOLATION_RE.search(cell) for cell in header):
+        return {"previous_violations": _violations(data)}, []
+    elif len(data) == 1:
+        # Column headers over a single data row.
+        pairs = list(zip(header, data[0]))
+    else:
+        return {}, []
+
+    fields: Dict[str, str] = {}
+    leftover: List[str] = []
+    for label, value in pairs:
+        field = _label_field(label)
+        if field and value and field not in fields:
+            fields[field] = _violations([[value]]) if field == "previous_violations" else value
+        elif value:
+            leftover.append(f"{label}: {value}" if label else value)
+    return fields, leftover if fields else []
+
+
+def empty_report() -> Dict:
+    return {"fields": {}, "pages": [], "tables": 0, "chars_removed": 0, "seconds": 0.0}
+
+
+def extract(
+    pdf_file: BinaryIO, pages: List[str], ruled: Optional[List[int]] = None, pdf=None
+) -> Tuple[List[str], Dict]:
+    """Map tables on candidate pages to fields and drop them from the text.
+
+    ``ruled`` lists the pages that draw enough lines for a table (as the
+    probe found them; counted here when not given), and ``pdf`` is an open
+    pdfplumber document of ``pdf_file`` to reuse. Returns the new page
+    texts and a report with the ``fields`` found, the ``pages`` that
+    changed, the number of ``tables`` mapped, the ``chars_removed`` from
+    the prompt text and the ``seconds`` taken. Stops at the current deadline.
+    """
+    started = time.perf_counter()
+    pages, report = _extract(pdf_file, pages, ruled, pdf)
+    report["seconds"] = round(time.perf_counter() - started, 4)
+    return pages, report
+
+
+def _extract(pdf_file: BinaryIO, pages: List[str], ruled, pdf) -> Tuple[List[str], Dict]:
+    report = empty_report()
+    candidates = [index for index, text in enumerate(pages) if is_candidate(text)]
+    if not TABLE_EXTRACTION or not candidates or not available():
+        return pages, report
+    if ruled is None:
+        candidates = ruled_pages(pdf_file, candidates)
+    else:
+        candidates = [index for index in candidates if index in ruled]
+    if not candidates:
+        return pages, report
+    pages = list(pages)
+    if pdf is not None:
+        _read_tables(pdf, candidates, pages, report)
+    else:
+        import pdfplumber
+
+        pdf_file.seek(0)
+        with pdfplumber.open(pdf_file) as pdf:
+            _read_tables(pdf, candidates, pages, report)
+    if report["tables"]:
+        metrics.inc("docproc_tables_mapped_total", report["tables"])
+        for field in report["fields"]:
+            metrics.inc("docproc_table_fields_total", field=field)
+        logger.info(
+            "Read %s from %s table(s); %s characters fewer in the prompt",
+            ", ".join(report["fields"]),
+            report["tables"],
+            report["chars_removed"],
+        )
+    return pages, report
+
+
+def _read_tables(pdf, candidates: List[int], pages: List[str], report: Dict) -> None:
+    for index in candidates:
+        if index >= len(pdf.pages) or cancellation.expired():
+            break
+        cancellation.check("extraction")
+        page = pdf.pages[index]
+        handled = []
+        leftover: List[str] = []
+        for table in page.find_tables():
+            fields, rest = map_table(table.extract())
+            if not fields:
+                continue
+            handled.append(table.bbox)
+            leftover.extend(rest)
+            for field, value in fields.items():
+                report["fields"].setdefault(field, value)
+        if handled:
+            remaining = page
+            for bbox in handled:
+                remaining = remaining.outside_bbox(bbox)
+            text = "\n".join(part for part in [remaining.extract_text() or ""] + leftover if part)
+            report["chars_removed"] += max(len(pages[index]) - len(text), 0)
+            report["tables"] += len(handled)
+            report["pages"].append(index)
+            pages[index] = text
+        page.flush_cache()
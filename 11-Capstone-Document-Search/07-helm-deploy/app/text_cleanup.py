@@ -0,0 +1,171 @@
+"""
+Prompt-shrinking clean-up of extracted page text.
+
+Multi-page forms repeat the agency header, footer, page numbers and legal
+boilerplate on every page. Before the text goes to the LLM this stage:
+
+- collapses runs of whitespace and shortens blank fill lines (``_____``),
+- drops page-number lines ("Page 2 of 5", "- 3 -") and lines that repeat
+  near the top or bottom of most pages, keeping the first occurrence,
+- drops lines matching known boilerplate patterns (the defaults below plus
+  one regular expression per line from ``BOILERPLATE_FILE``).
+
+Lines inside the page body are only removed by the boilerplate patterns, so
+field labels that legitimately repeat ("Date:") survive. "Label: value"
+lines are never taken for a repeated header ("License Number: X" at the top
+of every page carries a field), and pages of no more than
+2 x ``HEADER_FOOTER_LINES`` lines have no edges: every line would be one.
+"""
+import logging
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import metrics
+from llm import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+TEXT_CLEANUP = os.getenv("TEXT_CLEANUP", "true").lower() not in ("0", "false", "no")
+BOILERPLATE_FILE = os.getenv("BOILERPLATE_FILE", "")
+# Lines at each end of a page checked for repeated headers and footers.
+HEADER_FOOTER_LINES = int(os.getenv("HEADER_FOOTER_LINES", "3"))
+# Share of pages a header/footer line must appear on to be removed.
+REPEAT_MIN_SHARE = float(os.getenv("REPEAT_MIN_SHARE", "0.5"))
+# Shorter repeated lines ("Yes", "___") are more likely values than headers.
+REPEAT_MIN_CHARS = 6
+
+DEFAULT_BOILERPLATE = [
+    r"^for official use only\.?$",
+    r"^(office|agency) use only\.?$",
+    r"^do not write (in|below) this (area|line|space)\.?$",
+    r"^this form (is|may be) (reproduced|photocopied)\b.*$",
+    r"^privacy act (statement|notice)\b.*$",
+    r"^(rev(ised)?\.?|form)\s*[a-z0-9-]*\s*\(?\d{1,2}/\d{2,4}\)?$",
+]
+
+_WHITESPACE_RE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+_FILL_RE = re.compile(r"([_.])\1{3,}")
+# "Page 2", "Page 2 of 5", "2 of 5", "- 2 -"; a bare number could be a
+# field value, so it only goes when it repeats like a header or footer.
+_PAGE_NUMBER_RE = re.compile(
+    r"^(page\s*\d{1,4}(\s*(of|/)\s*\d{1,4})?|\d{1,4}\s+of\s+\d{1,4}|[-–]\s*\d{1,4}\s*[-–])$",
+    re.I,
+)
+_DIGITS_RE = re.compile(r"\d+")
+# "License Number: DL-2024-88812": a field, even when it repeats.
+_LABEL_VALUE_RE = re.compile(r"^[^:]{2,40}:\s*\S")
+
+_patterns = None
+
+
+def boilerplate_patterns() -> List[re.Pattern]:
+    """Compiled default and ``BOILERPLATE_FILE`` patterns (loaded once)."""
+    global _patterns
+    if _patterns is None:
+        sources = list(DEFAULT_BOILERPLATE)
+        if BOILERPLATE_FILE:
+            try:
+                with open(BOILERPLATE_FILE, encoding="utf-8") as handle:
+                    sources.extend(
+                        line.strip()
+                        for line in handle
+                        if line.strip() and not line.startswith("#")
+                    )
+            except OSError as exc:
+                logger.warning("Could not read BOILERPLATE_FILE: %s", exc)
+        compiled = []
+        for source in sources:
+            try:
+                compiled.append(re.compile(source, re.I))
+            except re.error as exc:
+                logger.warning("Skipping invalid boilerplate pattern %r: %s", source, exc)
+        _patterns = compiled
+    return _patterns
+
+
+def _normalise_line(line: str) -> str:
+    line = _WHITESPACE_RE.sub(" ", line).strip()
+    return _FILL_RE.sub(r"\1\1\1", line)
+
+
+def _signature(line: str) -> str:
+    """Line with digits masked, so "Page 1" and "Page 2" repeat."""
+    return _DIGITS_RE.sub("#", line.lower())
+
+
+def _has_edges(lines: List[str]) -> bool:
+    return len(lines) > 2 * HEADER_FOOTER_LINES
+
+
+def _repeated_edge_lines(pages: List[List[str]]) -> set:
+    if len(pages) < 2:
+        return set()
+    counts: Counter = Counter()
+    for lines in pages:
+        if not _has_edges(lines):
+            continue
+        edges = lines[:HEADER_FOOTER_LINES] + lines[-HEADER_FOOTER_LINES:]
+        counts.update({_signature(line) for line in edges if not _LABEL_VALUE_RE.match(line)})
+    threshold = max(2, REPEAT_MIN_SHARE * len(pages))
+    return {
+        signature
+        for signature, count in counts.items()
+        if count >= threshold and len(signature) >= REPEAT_MIN_CHARS
+    }
+
+
+def clean_pages(pages: List[str]) -> Tuple[List[str], Dict]:
+    """Strip repeated headers/footers and boilerplate from page texts.
+
+    Returns the cleaned pages and a report with token estimates before and
+    after, the number of lines removed, and a sample of what was removed.
+    """
+    before = estimate_tokens("".join(page + "\n" for page in pages if page))
+    if not TEXT_CLEANUP:
+        return pages, {"tokens_before": before, "tokens_after": before, "removed_lines": 0}
+
+    split = [
+        [line for line in (_normalise_line(raw) for raw in page.splitlines()) if line]
+        for page in pages
+    ]
+    repeated = _repeated_edge_lines(split)
+    patterns = boilerplate_patterns()
+    removed: Counter = Counter()
+    seen = set()
+    cleaned = []
+    for lines in split:
+        kept = []
+        for position, line in enumerate(lines):
+            at_edge = _has_edges(lines) and (
+                position < HEADER_FOOTER_LINES or position >= len(lines) - HEADER_FOOTER_LINES
+            )
+            signature = _signature(line)
+            # The first copy of a repeated line stays, in case it matters.
+            repeat = signature in repeated and signature in seen
+            seen.add(signature)
+            if (
+                (at_edge and (_PAGE_NUMBER_RE.match(line) or repeat))
+                or any(pattern.search(line) for pattern in patterns)
+            ):
+                removed[line] += 1
+                continue
+            kept.append(line)
+        cleaned.append("\n".join(kept))
+
+    after = estimate_tokens("".join(page + "\n" for page in cleaned if page))
+    metrics.inc("docproc_cleanup_tokens_saved_total", max(before - after, 0))
+    report = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "removed_lines": sum(removed.values()),
+        "removed_sample": [line for line, _ in removed.most_common(5)],
+    }
+    logger.info(
+        "Text clean-up: %s -> %s tokens, %s lines removed",
+        before,
+        after,
+        report["removed_lines"],
+    )
+    return cleaned, report
@@ -0,0 +1,99 @@
+"""
+Memory-bounded handling of uploaded PDFs.
+
+Uploads are copied to a spool directory in small chunks and handed to the
+extractors as read-only memory maps, so the parsers page the file in from
+disk instead of keeping yet another full copy on the Python heap.
+
+An admission controller caps the total upload bytes being processed at
+once on this replica. Uploads that would go over the cap wait for room and
+are rejected after ``UPLOAD_ADMISSION_TIMEOUT`` seconds; a single upload
+larger than the cap is still admitted, but only when nothing else is in
+flight. The wait also ends with ``cancellation.Cancelled`` when the work is
+cancelled, or ``DeadlineExceeded`` when the active deadline passes first.
+"""
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+import cancellation
+import memprofile
+
+logger = logging.getLogger(__name__)
+
+MAX_INFLIGHT_UPLOAD_BYTES = int(os.getenv("MAX_INFLIGHT_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_ADMISSION_TIMEOUT = float(os.getenv("UPLOAD_ADMISSION_TIMEOUT", "30"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# How often a waiting upload checks for cancellation and its deadline.
+ADMISSION_POLL_SECONDS = 0.25
+
+_inflight_bytes = 0
+_waiting = 0
+_admission = threading.Condition()
+
+
+class UploadRejected(RuntimeError):
+    """The replica is already processing as many upload bytes as allowed."""
+
+
+def inflight_upload_bytes() -> int:
+    """Upload bytes currently admitted on this replica."""
+    return _inflight_bytes
+
+
+def waiting_uploads() -> int:
+    """Uploads queued for admission because the byte cap is reached."""
+    return _waiting
+
+
+@contextmanager
+def admit_upload(size: int) -> Iterator[None]:
+    """Hold ``size`` bytes of the replica's upload budget for the block."""
+    global _inflight_bytes, _waiting
+    deadline = time.monotonic() + UPLOAD_ADMISSION_TIMEOUT
+    with _admission:
+        _waiting += 1
+        try:
+            while _inflight_bytes and _inflight_bytes + size > MAX_INFLIGHT_UPLOAD_BYTES:
+                cancellation.check("admission")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UploadRejected(
+                        "The server is busy processing other large uploads; "
+                        "please try again shortly."
+                    )
+                _admission.wait(cancellation.timeout(min(remaining, ADMISSION_POLL_SECONDS)))
+        finally:
+            _waiting -= 1
+        _inflight_bytes += size
+    logger.info(
+        "Admitted upload of %s bytes (%s in flight)", size, _inflight_bytes
+    )
+    try:
+        yield
+    finally:
+        with _admission:
+            _inflight_bytes -= size
+            _admission.notify_all()
+
+
+@contextmanager
+def spooled_pdf(upload: BinaryIO) -> Iterator[mmap.mmap]:
+    """Copy an upload to a spool file and yield it as a read-only memory map."""
+    with tempfile.TemporaryFile(dir=UPLOAD_SPOOL_DIR, suffix=".pdf") as spool:
+        with memprofile.stage("upload"):
+            upload.seek(0)
+            shutil.copyfileobj(upload, spool, SPOOL_CHUNK_BYTES)
+            spool.flush()
+            if spool.tell() == 0:
+                raise ValueError("Uploaded file is empty")
+            mapped = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        with mapped:
+            yield mapped
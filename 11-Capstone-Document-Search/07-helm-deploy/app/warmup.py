@@ -0,0 +1,129 @@
+"""
+Connection pre-warming for the LLM endpoint.
+
+Without it the first document after a Pod starts pays for the DNS lookup,
+the TCP connect and the TLS handshake to ``LLM_API_ENDPOINT``, and so does
+the next one once an idle connection has been dropped. ``start()`` runs a
+background thread that:
+
+- resolves the endpoint's host name,
+- opens ``LLM_WARM_CONNECTIONS`` keep-alive connections in the shared
+  ``cancellation.http_session()`` pool, by sending that many lightweight
+  ``GET <endpoint>/<LLM_WARMUP_PATH>`` requests at once (``models`` is
+  free on OpenAI-compatible APIs; any reply keeps the connection), and
+- repeats the requests every ``LLM_KEEPALIVE_SECONDS`` while no LLM call
+  is in flight, so the provider does not close the idle connections.
+
+LLM calls then reuse the open connections instead of setting up their
+own. With the HTTP/2 client (``http2_client``) the same requests open its
+multiplexed connections. ``LLM_WARM_CONNECTIONS=0`` turns all of this off.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import cancellation
+import http2_client
+import metrics
+from llm import chat_completions_url
+
+logger = logging.getLogger(__name__)
+
+LLM_WARM_CONNECTIONS = int(os.getenv("LLM_WARM_CONNECTIONS", "2"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+LLM_WARMUP_PATH = os.getenv("LLM_WARMUP_PATH", "models")
+WARMUP_TIMEOUT_SECONDS = 10
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def warmup_url() -> Optional[str]:
+    """URL of the lightweight request, next to the chat completions URL."""
+    endpoint = chat_completions_url(os.getenv("LLM_API_ENDPOINT"))
+    if not endpoint:
+        return None
+    base = endpoint[: -len("/chat/completions")]
+    return f"{base}/{LLM_WARMUP_PATH.lstrip('/')}" if LLM_WARMUP_PATH else endpoint
+
+
+def _ping(url: str) -> bool:
+    try:
+        headers = {"Authorization": f"Bearer {os.getenv('LLM_API_KEY')}"}
+        if http2_client.enabled():
+            response = http2_client.request(
+                "GET", url, headers=headers, timeout=WARMUP_TIMEOUT_SECONDS
+            )
+        else:
+            response = cancellation.http_session().get(
+                url, headers=headers, timeout=WARMUP_TIMEOUT_SECONDS
+            )
+        # Reading the body hands the connection back to the pool.
+        response.content
+        return True
+    except requests.RequestException as exc:
+        logger.debug("Warm-up request failed: %s", exc)
+        return False
+
+
+def warm(connections: int = LLM_WARM_CONNECTIONS) -> Dict:
+    """Resolve the endpoint and open ``connections`` pooled connections.
+
+    Returns the DNS and connect times in seconds and the number of
+    connections that answered.
+    """
+    url = warmup_url()
+    if not url or connections <= 0:
+        return {"dns_seconds": 0.0, "connect_seconds": 0.0, "connections": 0}
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    started = time.perf_counter()
+    try:
+        socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except OSError as exc:
+        logger.warning("Could not resolve LLM endpoint %s: %s", parts.hostname, exc)
+    dns = time.perf_counter() - started
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="docproc-warmup") as pool:
+        answered = sum(pool.map(_ping, [url] * connections))
+    connect = time.perf_counter() - started
+    metrics.set_gauge("docproc_llm_warm_connections", answered)
+    return {
+        "dns_seconds": round(dns, 3),
+        "connect_seconds": round(connect, 3),
+        "connections": answered,
+    }
+
+
+def _keep_warm() -> None:
+    report = warm()
+    logger.info(
+        "Warmed %s of %s LLM connections (DNS %.3fs, connect %.3fs)",
+        report["connections"],
+        LLM_WARM_CONNECTIONS,
+        report["dns_seconds"],
+        report["connect_seconds"],
+    )
+    while LLM_KEEPALIVE_SECONDS > 0:
+        time.sleep(LLM_KEEPALIVE_SECONDS)
+        # Real calls keep their connections alive; only idle ones need it.
+        if metrics.gauge_value("docproc_llm_inflight_calls") == 0:
+            warm()
+            metrics.inc("docproc_llm_keepalive_pings_total")
+
+
+def start() -> None:
+    """Start warming the LLM connections in the background (once per process)."""
+    global _started
+    with _started_lock:
+        if _started or LLM_WARM_CONNECTIONS <= 0 or not warmup_url():
+            return
+        _started = True
+    threading.Thread(target=_keep_warm, name="docproc-warmup", daemon=True).start()
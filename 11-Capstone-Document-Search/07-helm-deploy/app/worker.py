@@ -0,0 +1,168 @@
+"""
+Queue worker for the License Renewal Document Processor.
+
+Runs the extraction pipeline outside the Streamlit server, so the UI and the
+processing tier scale independently:
+
+    python app/worker.py
+
+Each of the ``WORKER_CONCURRENCY`` threads claims a job, then grabs up to
+``WORKER_BATCH_SIZE - 1`` more that are already waiting so short documents
+can still be packed into one LLM request; jobs asking for different field
+schemas are processed as separate batches. A batch is aborted (including
+its in-flight LLM request) once every job in it has been cancelled. While
+a batch runs its job leases are renewed, so only jobs of a worker that
+died are put back on the queue (see ``jobqueue``).
+"""
+import io
+import logging
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+# Before the imports below: they read their settings from the environment.
+load_dotenv()
+
+import cancellation  # noqa: E402
+import jobqueue  # noqa: E402
+import schemas  # noqa: E402
+import status_server  # noqa: E402
+import warmup  # noqa: E402
+from pipeline import process_documents  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler()],
+)
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "4"))
+WORKER_CANCEL_POLL_SECONDS = float(os.getenv("WORKER_CANCEL_POLL_SECONDS", "2"))
+
+_stopping = threading.Event()
+
+
+def claim_batch():
+    """Block briefly for one job, then take whatever else is already queued."""
+    first = jobqueue.claim_job(timeout=5)
+    if first is None:
+        return []
+    batch = [first]
+    while len(batch) < WORKER_BATCH_SIZE:
+        job = jobqueue.claim_job(timeout=0)
+        if job is None:
+            break
+        batch.append(job)
+    return batch
+
+
+def run_batch(batch):
+    documents = []
+    jobs = []
+    for job in batch:
+        payload = jobqueue.job_payload(job["id"])
+        if payload is None:
+            jobqueue.fail_job(job, "Uploaded file expired before processing.")
+            continue
+        documents.append((job["filename"], io.BytesIO(payload), len(payload)))
+        jobs.append(job)
+    if not documents:
+        return
+    token = cancellation.CancelToken()
+    finished = threading.Event()
+    threading.Thread(
+        target=watch_cancellation, args=(jobs, token, finished), daemon=True
+    ).start()
+    try:
+        with cancellation.use(token), schemas.use(jobs[0].get("schema")):
+            results = process_documents(documents)
+    except cancellation.Cancelled as exc:
+        logger.info("Batch of %s jobs cancelled: %s", len(jobs), exc)
+        for job in jobs:
+            jobqueue.fail_job(job, str(exc))
+        return
+    except Exception as exc:
+        logger.error("Batch of %s jobs failed: %s", len(jobs), exc, exc_info=True)
+        for job in jobs:
+            jobqueue.fail_job(job, f"Processing failed: {exc}")
+        return
+    finally:
+        finished.set()
+    for job, result in zip(jobs, results):
+        jobqueue.complete_job(job, result)
+        logger.info("Job %s finished: %s", job["id"], job["status"])
+
+
+def watch_cancellation(jobs, token, finished):
+    """Renew the batch's job leases, and cancel the batch once every job in
+    it has been cancelled by its user."""
+    while not finished.wait(WORKER_CANCEL_POLL_SECONDS):
+        try:
+            for job in jobs:
+                jobqueue.renew_lease(job["id"])
+        except Exception as exc:
+            logger.warning("Could not renew job leases: %s", exc)
+        try:
+            if all(jobqueue.cancel_requested(job["id"]) for job in jobs):
+                token.cancel("all jobs in the batch were cancelled")
+        except Exception as exc:
+            logger.warning("Could not check job cancellation: %s", exc)
+
+
+def stop():
+    """Let the worker threads finish their current batch and exit."""
+    _stopping.set()
+
+
+def worker_loop(name):
+    logger.info("Worker thread %s started", name)
+    while not _stopping.is_set():
+        try:
+            batch = claim_batch()
+        except Exception as exc:
+            logger.error("Could not claim jobs: %s", exc, exc_info=True)
+            _stopping.wait(5)
+            continue
+        by_schema = {}
+        for job in batch:
+            by_schema.setdefault(job.get("schema"), []).append(job)
+        for jobs in by_schema.values():
+            run_batch(jobs)
+
+
+def main():
+    signal.signal(signal.SIGTERM, lambda *_: stop())
+    status_server.start(queue_metrics=True)
+    warmup.start()
+    try:
+        requeued = jobqueue.requeue_stale()
+        if requeued:
+            logger.info("Put %s jobs of stopped workers back on the queue", len(requeued))
+    except Exception as exc:
+        logger.warning("Could not requeue stale jobs: %s", exc)
+    logger.info(
+        "Starting %s worker threads on the %s queue",
+        WORKER_CONCURRENCY,
+        jobqueue.QUEUE_BACKEND,
+    )
+    threads = [
+        threading.Thread(target=worker_loop, args=(f"w{index}",), daemon=True)
+        for index in range(WORKER_CONCURRENCY)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop()
+    logger.info("Worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Load test for the headless API (app/api.py).
+
+Each of ``--clients`` threads submits sample PDFs to ``POST /jobs``, polls
+``GET /jobs/{id}`` until the job finishes and fetches its JSON result,
+until ``--jobs`` documents have gone through. The report shows throughput,
+submit and end-to-end latency percentiles, final job statuses and how
+often the API pushed back with 429.
+
+Against the local LLM stand-in, with caching off so every job calls it:
+
+    python benchmarks/mock_llm_server.py --port 8000 &
+    LLM_API_ENDPOINT=http://127.0.0.1:8000/v1 LLM_API_KEY=x LLM_MODEL=mock \\
+        CACHE_L1_ENTRIES=0 REVISION_TRACKING=false python app/api.py &
+    python benchmarks/api_load_test.py --clients 8 --jobs 80
+"""
+import argparse
+import itertools
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+HERE = Path(__file__).resolve().parent
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else 0.0
+
+
+def run_client(args, pdfs, counter, lock, stats):
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    while True:
+        with lock:
+            number = next(counter)
+        if number >= args.jobs:
+            return
+        name, payload = pdfs[number % len(pdfs)]
+        started = time.perf_counter()
+        while True:
+            response = session.post(
+                f"{args.url}/jobs",
+                params={"filename": name},
+                data=payload,
+                headers={**headers, "Content-Type": "application/pdf"},
+                timeout=30,
+            )
+            if response.status_code != 429:
+                break
+            with lock:
+                stats["throttled"] += 1
+            time.sleep(min(float(response.headers.get("Retry-After", "1")), 2.0))
+        submitted = time.perf_counter()
+        if response.status_code != 202:
+            with lock:
+                stats["statuses"][f"http {response.status_code}"] += 1
+            continue
+        job = response.json()["jobs"][0]
+        while job["status"] not in ("done", "failed", "cancelled"):
+            time.sleep(args.poll)
+            job = session.get(f"{args.url}{job['links']['self']}", headers=headers, timeout=30).json()
+        result = session.get(f"{args.url}{job['links']['result']}", headers=headers, timeout=30)
+        finished = time.perf_counter()
+        with lock:
+            stats["submit"].append(submitted - started)
+            stats["total"].append(finished - started)
+            stats["statuses"][job["status"]] += 1
+            if result.ok and result.json().get("partial"):
+                stats["statuses"]["partial"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless API load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=80)
+    parser.add_argument("--poll", type=float, default=0.25, help="status poll interval (s)")
+    parser.add_argument("--token", default="", help="API_TOKEN, if the API requires one")
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    args = parser.parse_args()
+
+    pdfs = [(path.name, path.read_bytes()) for path in sorted(Path(args.pdf_dir).glob("*.pdf"))]
+    if not pdfs:
+        sys.exit(f"No PDFs in {args.pdf_dir}")
+    try:
+        requests.get(f"{args.url}/jobs/{'0' * 32}", timeout=5)
+    except requests.RequestException as exc:
+        sys.exit(f"API not reachable at {args.url}: {exc}")
+
+    stats = {"submit": [], "total": [], "statuses": Counter(), "throttled": 0}
+    counter = itertools.count()
+    lock = threading.Lock()
+    print(f"{args.jobs} jobs from {len(pdfs)} sample PDFs, {args.clients} clients\n")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for future in [
+            pool.submit(run_client, args, pdfs, counter, lock, stats)
+            for _ in range(args.clients)
+        ]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    completed = len(stats["total"])
+    print(f"wall time        {elapsed:8.2f} s")
+    print(f"throughput       {completed / elapsed:8.2f} jobs/s")
+    print(
+        f"submit latency   p50 {percentile(stats['submit'], 0.5) * 1000:7.1f} ms"
+        f"   p95 {percentile(stats['submit'], 0.95) * 1000:7.1f} ms"
+    )
+    print(
+        f"end-to-end       p50 {percentile(stats['total'], 0.5):7.2f} s "
+        f"   p95 {percentile(stats['total'], 0.95):7.2f} s"
+        f"   mean {statistics.mean(stats['total']) if completed else 0:6.2f} s"
+    )
+    print(f"429 responses    {stats['throttled']:8d}")
+    print("job statuses     " + ", ".join(f"{k}={v}" for k, v in sorted(stats["statuses"].items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the registered PDF extractors on a corpus of PDFs.
+
+For every PDF the script times each available extractor (best of
+``--repeat`` runs), scores its output with the same quality check the app
+uses, and shows which engine the automatic selection settles on.
+
+The automatic path and the path forced to pdfplumber are timed the same
+way, best of ``--repeat`` runs without the text cache, per stage: the
+probe, the extractor(s) tried, and the table pass. The script exits with
+status 1 when the automatic path is slower in total than the pdfplumber
+one by more than ``--max-slowdown`` (a margin for timing noise: on forms
+that are one ruled page the two paths parse the same page with pdfplumber).
+
+    python benchmarks/extractor_benchmark.py --pdf-dir sample-documents
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+import pdf_text  # noqa: E402
+
+STAGES = ("probe", "extract", "tables")
+
+
+def time_extractor(name, handle, repeat):
+    best = None
+    pages = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = pdf_text.EXTRACTORS[name]["func"](handle)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, pages
+
+
+def time_paths(engines, handle, repeat):
+    """Best time of each stage of ``pdf_text`` extraction per engine ("auto" or forced).
+
+    The engines take turns within each repeat, so a slow spell of the
+    machine does not land on one of them only. The text cache is bypassed.
+    """
+    saved = pdf_text.PDF_EXTRACTOR
+    best = {engine: dict.fromkeys(STAGES) for engine in engines}
+    reports = {}
+    try:
+        for _ in range(repeat):
+            for engine in engines:
+                pdf_text.PDF_EXTRACTOR = engine
+                _, report = pdf_text._extract_pages(handle)
+                reports[engine] = report
+                stages = {
+                    "probe": report["probe_seconds"],
+                    "extract": sum(attempt.get("seconds", 0.0) for attempt in report["attempts"]),
+                    "tables": report["tables"]["seconds"],
+                }
+                for stage, seconds in stages.items():
+                    if best[engine][stage] is None or seconds < best[engine][stage]:
+                        best[engine][stage] = seconds
+    finally:
+        pdf_text.PDF_EXTRACTOR = saved
+    return best, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extractor benchmark")
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=0.1,
+        help="share by which auto may be slower than pdfplumber, for timing noise",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    engines = pdf_text.available_extractors()
+    totals = {name: 0.0 for name in engines}
+    paths = ["auto"] + (["pdfplumber"] if "pdfplumber" in engines else [])
+    path_totals = {path: dict.fromkeys(STAGES, 0.0) for path in paths}
+    print(
+        f"{'document':<40} {'engine':<16} {'ms':>8} {'chars':>6} {'quality':>7} "
+        f"{'probe':>7} {'extract':>7} {'tables':>7}"
+    )
+    for path in sorted(Path(args.pdf_dir).glob("*.pdf")):
+        with open(path, "rb") as handle:
+            for name in engines:
+                seconds, pages = time_extractor(name, handle, args.repeat)
+                quality = pdf_text.text_quality(pages, pdf_text.probe_pdf(handle))
+                totals[name] += seconds
+                print(
+                    f"{path.name[:40]:<40} {name:<16} {seconds * 1000:>8.1f} "
+                    f"{sum(len(page) for page in pages):>6} {quality:>7.2f}"
+                )
+            best, reports = time_paths(paths, handle, args.repeat)
+            for engine in paths:
+                stages, report = best[engine], reports[engine]
+                for stage, seconds in stages.items():
+                    path_totals[engine][stage] += seconds
+                label = f"auto→{report['engine']}" if engine == "auto" else f"{engine} only"
+                print(
+                    f"{path.name[:40]:<40} {label:<16} {sum(stages.values()) * 1000:>8.1f} "
+                    f"{'':>6} {report['quality']:>7.2f} "
+                    + " ".join(f"{stages[stage] * 1000:>7.1f}" for stage in STAGES)
+                )
+
+    print()
+    for name, seconds in totals.items():
+        print(f"total {name:<16} {seconds * 1000:>8.1f} ms")
+    for engine, stages in path_totals.items():
+        print(
+            f"total {engine + ' path':<16} {sum(stages.values()) * 1000:>8.1f} ms ("
+            + ", ".join(f"{stage} {stages[stage] * 1000:.1f}" for stage in STAGES)
+            + ")"
+        )
+    if "pdfplumber" in path_totals:
+        auto = sum(path_totals["auto"].values())
+        fixed = sum(path_totals["pdfplumber"].values())
+        if auto > fixed * (1 + args.max_slowdown):
+            print(f"\nFAIL: the auto path ({auto * 1000:.1f} ms) is slower than pdfplumber's "
+                  f"({fixed * 1000:.1f} ms)")
+            sys.exit(1)
+        print(f"\nauto path {auto * 1000:.1f} ms vs pdfplumber path {fixed * 1000:.1f} ms: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+"""
+Golden-set accuracy and latency suite for the whole pipeline.
+
+Runs ``pipeline.process_documents`` (text extraction, cleanup, page
+selection, LLM extraction, re-query) over a golden set and scores every
+field against known values, next to latency and throughput, so a
+performance change can be accepted or rejected on both:
+
+- the PDFs in ``sample-documents`` with the values in
+  ``golden/expected.json``, and
+- synthetic variants generated from the records in the same file, one PDF
+  per record and layout: ``renewal`` and ``government`` (the two sample
+  layouts), ``inline`` ("Label: value" lines), ``long`` (the form buried
+  in a ten-page filing) and ``noisy`` (split over pages with repeated
+  headers, footers and page numbers), ``tables`` (payment details and
+  violation history in ruled tables) and ``headers`` (the license number
+  only in a "License Number: X" header repeated on every page).
+
+Where the replies come from (``--llm``):
+
+- ``mock``   the stand-in from ``mock_llm_server.py``, started in-process.
+- ``env``    whatever ``LLM_API_ENDPOINT`` points at.
+- ``replay`` replies recorded earlier with ``--record``, looked up by
+  request body and served after the recorded latency (``--replay-latency
+  none`` serves them at once). A request that was never recorded, e.g.
+  because a change altered the prompt, fails and counts as a replay miss.
+
+Caches are off unless set in the environment, so every document is a cold
+run. ``--save`` writes the summary as JSON; ``--compare`` prints the change
+against such a file and exits with status 1 when accuracy dropped by more
+than ``--max-accuracy-drop`` percentage points.
+
+    python benchmarks/golden_suite.py
+    python benchmarks/golden_suite.py --llm env --record golden-replies.jsonl
+    python benchmarks/golden_suite.py --llm replay --recording golden-replies.jsonl
+    python benchmarks/golden_suite.py --save baseline.json
+    python benchmarks/golden_suite.py --compare baseline.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+# Cold runs unless asked otherwise; read when the app modules are imported.
+os.environ.setdefault("CACHE_BACKEND", "none")
+os.environ.setdefault("CACHE_L1_ENTRIES", "0")
+os.environ.setdefault("LEDGER_PATH", "")
+
+import requests  # noqa: E402
+
+import mock_llm_server  # noqa: E402
+import pipeline  # noqa: E402
+import schemas  # noqa: E402
+from llm import chat_completions_url  # noqa: E402
+
+GOLDEN_FILE = HERE / "golden" / "expected.json"
+
+# Label, as printed on the form, per field and layout.
+LABELS = {
+    "renewal": {
+        "applicant_name": "Full Name",
+        "license_number": "License Number",
+        "license_type": "License Type",
+        "expiry_date": "Current Expiry Date",
+        "renewal_date": "Renewal Date",
+        "address": "Address",
+        "contact_number": "Contact Number",
+        "email": "Email Address",
+        "payment_status": "Payment Status",
+        "payment_amount": "Amount Paid",
+        "transaction_id": "Transaction ID",
+        "date_of_birth": "Date of Birth",
+        "previous_violations": "Previous Violations",
+    },
+    "government": {
+        "applicant_name": "Applicant Name",
+        "license_number": "License Number",
+        "license_type": "Type of License",
+        "expiry_date": "Expiration Date",
+        "renewal_date": "Date of Renewal Application",
+        "address": "Residential Address",
+        "contact_number": "Phone Number",
+        "email": "Email",
+        "payment_status": "Payment Status",
+        "payment_amount": "Amount Paid",
+        "transaction_id": "Transaction ID",
+        "date_of_birth": "Date of Birth",
+        "previous_violations": "Previous Violations",
+    },
+}
+FILLER = [
+    "The holder shall keep this licence available for inspection at all times",
+    "and shall notify the issuing office of any change of address within thirty",
+    "days. Renewal applications received after the expiry date may incur a late",
+    "fee and a lapse in the authority to practise until the renewal is granted.",
+    "Information supplied on this form is processed under the applicable records",
+    "retention schedule and may be shared with other licensing authorities.",
+]
+
+
+# --- golden set -------------------------------------------------------------
+
+
+def write_pdf(path, pages):
+    """Write ``pages`` as a plain Helvetica PDF.
+
+    Each page is a list of text lines and tables; a table is a dict
+    ``{"table": rows}`` drawn as a ruled grid.
+    """
+
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    def text(x, y, line):
+        return f"BT /F1 11 Tf {x} {y} Td ({escape(line)}) Tj ET\n"
+
+    # 1: catalog, 2: page tree (filled in last), 3: font, then content/page pairs.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for items in pages:
+        y, stream = 790, ""
+        for item in items:
+            if isinstance(item, str):
+                stream += text(56, y, item)
+                y -= 14
+                continue
+            rows = item["table"]
+            width = 500 / len(rows[0])
+            top = y + 10
+            for row in rows:
+                for column, cell in enumerate(row):
+                    stream += text(60 + column * width, top - 13, cell)
+                top -= 18
+            bottom = top
+            top = y + 10
+            for line in range(len(rows) + 1):
+                stream += f"56 {top - line * 18} m 556 {top - line * 18} l S\n"
+            for column in range(len(rows[0]) + 1):
+                stream += f"{56 + column * width:.1f} {top} m {56 + column * width:.1f} {bottom} l S\n"
+            y = bottom - 14
+        content = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    Path(path).write_bytes(bytes(data))
+
+
+def form_lines(record, labels, inline=False):
+    lines = []
+    for field, label in labels.items():
+        if field not in record:
+            continue
+        if inline:
+            lines.append(f"{label}: {record[field]}")
+        else:
+            lines.extend([f"{label}:", record[field]])
+    return lines
+
+
+def render(record, layout):
+    """Page lists for ``record`` in ``layout``."""
+    if layout in ("renewal", "government"):
+        title = "LICENSE RENEWAL APPLICATION FORM" if layout == "renewal" else (
+            "GOVERNMENT LICENSE RENEWAL FORM"
+        )
+        return [[title, ""] + form_lines(record, LABELS[layout])]
+    if layout == "inline":
+        return [["LICENSE RENEWAL APPLICATION", ""] + form_lines(record, LABELS["renewal"], True)]
+    if layout == "long":
+        filler = [f"Section {number}. General conditions" for number in range(1, 10)]
+        pages = [[heading, ""] + FILLER * 6 for heading in filler]
+        pages.insert(6, ["LICENSE RENEWAL APPLICATION FORM", ""] + form_lines(
+            record, LABELS["renewal"]
+        ))
+        return pages
+    if layout == "tables":
+        identity = {
+            field: value
+            for field, value in record.items()
+            if field not in ("payment_status", "payment_amount", "transaction_id")
+            and field != "previous_violations"
+        }
+        return [
+            ["LICENSE RENEWAL APPLICATION FORM", ""]
+            + form_lines(identity, LABELS["renewal"])
+            + [
+                "",
+                "PAYMENT INFORMATION",
+                {
+                    "table": [
+                        ["Payment Status", record["payment_status"]],
+                        ["Amount Paid", record["payment_amount"]],
+                        ["Transaction ID", record["transaction_id"]],
+                        ["Payment Method", "Credit Card"],
+                    ]
+                },
+                "VIOLATION HISTORY",
+                {"table": [["Previous Violations"], [record["previous_violations"]]]},
+            ]
+        ]
+    if layout == "noisy":
+        lines = form_lines(record, LABELS["government"])
+        # Three pages, never splitting a label from its value.
+        size = 2 * -(-len(lines) // 6)
+        chunks = [lines[start:start + size] for start in range(0, len(lines), size)]
+        return [
+            ["STATE LICENSING BOARD - FORM LR-7 (rev. 2024)", "CONFIDENTIAL WHEN COMPLETED"]
+            + chunk
+            + ["", f"Page {number} of {len(chunks)}", "Form LR-7 - do not write below this line"]
+            for number, chunk in enumerate(chunks, start=1)
+        ]
+    if layout == "headers":
+        body = {field: value for field, value in record.items() if field != "license_number"}
+        lines = form_lines(body, LABELS["renewal"])
+        size = 2 * -(-len(lines) // 6)
+        chunks = [lines[start:start + size] for start in range(0, len(lines), size)]
+        return [
+            ["STATE LICENSING BOARD - RENEWAL", f"License Number: {record['license_number']}", ""]
+            + chunk
+            + ["", f"Page {number} of {len(chunks)}"]
+            for number, chunk in enumerate(chunks, start=1)
+        ]
+    raise ValueError(f"Unknown layout {layout!r}")
+
+
+def build_golden_set(pdf_dir, out_dir, layouts=None):
+    """[(group, path, expected)] for the sample PDFs and synthetic variants."""
+    golden = json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))
+    cases = []
+    for name, expected in golden["documents"].items():
+        path = Path(pdf_dir) / name
+        if path.exists():
+            cases.append(("sample", path, expected))
+    synthetic = golden["synthetic"]
+    for layout in layouts or synthetic["layouts"]:
+        for number, record in enumerate(synthetic["records"], start=1):
+            path = Path(out_dir) / f"synthetic-{layout}-{number}.pdf"
+            write_pdf(path, render(record, layout))
+            cases.append((layout, path, record))
+    return cases
+
+
+# --- scoring ----------------------------------------------------------------
+
+
+def _squash(value):
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+
+def _date(value):
+    for layout in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%B %d, %Y", "%d %B %Y"):
+        try:
+            return datetime.strptime(str(value).strip(), layout).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _amount(value):
+    try:
+        return float(re.sub(r"[^0-9.]", "", str(value)))
+    except ValueError:
+        return None
+
+
+def matches(field, expected, actual):
+    """True when ``actual`` is an acceptable answer for ``expected``."""
+    if isinstance(expected, list):
+        return any(matches(field, option, actual) for option in expected)
+    if _squash(expected) in ("", "na"):
+        return _squash(actual) in ("", "na")
+    if _squash(expected) == _squash(actual):
+        return True
+    if field.endswith("_date") or field == "date_of_birth":
+        return _date(expected) is not None and _date(expected) == _date(actual)
+    if field == "payment_amount":
+        return _amount(expected) is not None and _amount(expected) == _amount(actual)
+    return False
+
+
+# --- record / replay --------------------------------------------------------
+
+
+def request_key(body):
+    """Replay key: the request body minus the model name."""
+    body = {key: value for key, value in body.items() if key != "model"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ReplyProxy:
+    """Local endpoint that records upstream replies or replays them."""
+
+    def __init__(self, upstream=None, recording=None, replay=False, replay_latency=True):
+        self.upstream = upstream
+        self.replies = {}
+        self.misses = 0
+        self.replay = replay
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._out = None
+        if replay:
+            with open(recording, encoding="utf-8") as handle:
+                for line in handle:
+                    entry = json.loads(line)
+                    self.replies[entry["key"]] = entry
+        elif recording:
+            self._out = open(recording, "a", encoding="utf-8")
+
+    def handle(self, method, path, headers, raw_body):
+        if method == "GET":
+            return 200, mock_llm_server.MODELS, 0.0
+        body = json.loads(raw_body or b"{}")
+        key = request_key(body)
+        if self.replay:
+            entry = self.replies.get(key)
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                return 404, {"error": {"message": "No recorded reply for this request"}}, 0.0
+            return entry["status"], entry["reply"], entry["seconds"] if self.replay_latency else 0.0
+        started = time.perf_counter()
+        response = requests.post(
+            self.upstream,
+            headers={"Authorization": headers.get("Authorization", "")},
+            json=body,
+            timeout=300,
+        )
+        seconds = round(time.perf_counter() - started, 3)
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = {"error": {"message": response.text[:500]}}
+        entry = {"key": key, "status": response.status_code, "reply": reply, "seconds": seconds}
+        with self._lock:
+            self._out.write(json.dumps(entry) + "\n")
+            self._out.flush()
+        # The caller already waited for the upstream reply.
+        return entry["status"], entry["reply"], 0.0
+
+
+def serve(route):
+    """Start a local OpenAI-compatible endpoint; returns its base URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            status, payload, delay = route(
+                self.command, self.path, self.headers, self.rfile.read(length)
+            )
+            time.sleep(delay)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    server = mock_llm_server.Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# --- running ----------------------------------------------------------------
+
+
+def run_case(case):
+    group, path, expected = case
+    with open(path, "rb") as handle:
+        result = pipeline.process_documents([(path.name, handle, path.stat().st_size)])[0]
+    fields = schemas.field_names()
+    record = result["record"] or {}
+    scored = {
+        field: matches(field, value, record.get(field, schemas.MISSING))
+        for field, value in expected.items()
+        if field in fields
+    }
+    usage = result["usage"] or {}
+    return {
+        "group": group,
+        "document": path.name,
+        "seconds": result["seconds"],
+        "error": result["error"],
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "scored": scored,
+        "expected": {field: expected[field] for field in scored},
+        "actual": {field: record.get(field, schemas.MISSING) for field in scored},
+    }
+
+
+def summarise(rows, elapsed):
+    def block(selected):
+        scored = [ok for row in selected for ok in row["scored"].values()]
+        seconds = sorted(row["seconds"] for row in selected)
+        return {
+            "documents": len(selected),
+            "fields": len(scored),
+            "accuracy": 100.0 * sum(scored) / len(scored) if scored else 0.0,
+            "p50_seconds": statistics.median(seconds) if seconds else 0.0,
+            "p95_seconds": seconds[int(0.95 * (len(seconds) - 1))] if seconds else 0.0,
+            "prompt_tokens": statistics.mean(row["prompt_tokens"] for row in selected)
+            if selected
+            else 0.0,
+            "errors": sum(1 for row in selected if row["error"]),
+        }
+
+    groups = defaultdict(list)
+    by_field = defaultdict(list)
+    for row in rows:
+        groups[row["group"]].append(row)
+        for field, ok in row["scored"].items():
+            by_field[field].append(ok)
+    total = block(rows)
+    total["wall_seconds"] = elapsed
+    total["documents_per_second"] = len(rows) / elapsed if elapsed else 0.0
+    return {
+        "total": total,
+        "groups": {group: block(selected) for group, selected in groups.items()},
+        "fields": {
+            field: 100.0 * sum(results) / len(results) for field, results in sorted(by_field.items())
+        },
+    }
+
+
+def print_report(summary, rows, show_misses):
+    header = (
+        f"{'group':<11} {'docs':>4} {'fields':>6} {'acc %':>6} {'p50 s':>7} "
+        f"{'p95 s':>7} {'prompt':>7} {'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for group, row in list(summary["groups"].items()) + [("total", summary["total"])]:
+        print(
+            f"{group:<11} {row['documents']:>4} {row['fields']:>6} {row['accuracy']:>6.1f} "
+            f"{row['p50_seconds']:>7.3f} {row['p95_seconds']:>7.3f} "
+            f"{row['prompt_tokens']:>7.0f} {row['errors']:>6}"
+        )
+    total = summary["total"]
+    print(
+        f"\n{total['documents']} documents in {total['wall_seconds']:.2f}s "
+        f"({total['documents_per_second']:.2f} documents/s)\n"
+    )
+    print("field accuracy:")
+    for field, accuracy in summary["fields"].items():
+        print(f"  {field:<20} {accuracy:>6.1f}%")
+
+    misses = [
+        (row["document"], field, row["expected"][field], row["actual"][field])
+        for row in rows
+        for field, ok in row["scored"].items()
+        if not ok
+    ]
+    if misses and show_misses:
+        print(f"\nfirst {min(len(misses), show_misses)} of {len(misses)} wrong fields:")
+        for document, field, expected, actual in misses[:show_misses]:
+            print(f"  {document:<38} {field:<20} expected {expected!r}, got {actual!r}")
+
+
+def compare(summary, baseline, max_drop):
+    """Print the change against ``baseline``; False when accuracy regressed."""
+    old, new = baseline["total"], summary["total"]
+    print("\nagainst baseline:")
+    print(f"  accuracy     {old['accuracy']:6.1f}% -> {new['accuracy']:6.1f}%")
+    for key, label in (
+        ("p50_seconds", "p50 s"),
+        ("p95_seconds", "p95 s"),
+        ("documents_per_second", "docs/s"),
+        ("prompt_tokens", "prompt tok"),
+    ):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"  {label:<12} {old[key]:7.3f} -> {new[key]:7.3f} ({change:+.1f}%)")
+    worse = [
+        (field, baseline["fields"][field], accuracy)
+        for field, accuracy in summary["fields"].items()
+        if field in baseline["fields"] and accuracy < baseline["fields"][field]
+    ]
+    for field, before, after in worse:
+        print(f"  {field:<20} {before:6.1f}% -> {after:6.1f}%")
+    regressed = old["accuracy"] - new["accuracy"] > max_drop
+    print("  REJECT: accuracy dropped" if regressed else "  accuracy held")
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-set accuracy and latency suite")
+    parser.add_argument("--llm", choices=["mock", "env", "replay"], default="mock")
+    parser.add_argument("--record", help="append the replies received to this JSONL file")
+    parser.add_argument("--recording", help="JSONL file of replies for --llm replay")
+    parser.add_argument("--replay-latency", choices=["recorded", "none"], default="recorded")
+    parser.add_argument("--layouts", help="comma-separated synthetic layouts (default: all)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    parser.add_argument("--keep-pdfs", help="write the synthetic PDFs here and keep them")
+    parser.add_argument("--show-misses", type=int, default=10)
+    parser.add_argument("--save", help="write the summary to this JSON file")
+    parser.add_argument("--compare", help="compare with a summary saved by --save")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.0)
+    args = parser.parse_args()
+
+    load_dotenv()
+    os.environ.setdefault("LLM_API_KEY", "mock")
+    os.environ.setdefault("LLM_MODEL", "mock")
+    proxy = None
+    if args.llm == "replay":
+        if not args.recording:
+            sys.exit("--llm replay needs --recording FILE")
+        proxy = ReplyProxy(
+            recording=args.recording, replay=True, replay_latency=args.replay_latency == "recorded"
+        )
+        endpoint = serve(proxy.handle)
+    else:
+        if args.llm == "mock":
+            upstream = serve(lambda method, path, headers, body: mock_llm_server.route(
+                method, path, body
+            ))
+        else:
+            upstream = os.getenv("LLM_API_ENDPOINT")
+            if not upstream:
+                sys.exit("Set LLM_API_ENDPOINT (and LLM_API_KEY / LLM_MODEL) first.")
+        endpoint = upstream
+        if args.record:
+            proxy = ReplyProxy(upstream=chat_completions_url(upstream), recording=args.record)
+            endpoint = serve(proxy.handle)
+    os.environ["LLM_API_ENDPOINT"] = endpoint
+
+    layouts = [name.strip() for name in args.layouts.split(",")] if args.layouts else None
+    if args.keep_pdfs:
+        os.makedirs(args.keep_pdfs, exist_ok=True)
+    with tempfile.TemporaryDirectory() as scratch:
+        cases = build_golden_set(args.pdf_dir, args.keep_pdfs or scratch, layouts)
+        print(f"{len(cases)} documents, schema {schemas.current()['id']}, replies from {args.llm}\n")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            rows = list(pool.map(run_case, cases))
+        elapsed = time.perf_counter() - started
+
+    summary = summarise(rows, elapsed)
+    print_report(summary, rows, args.show_misses)
+    if proxy is not None and proxy.replay:
+        print(f"\nreplay misses: {proxy.misses} (re-record after prompt changes)")
+    if args.save:
+        Path(args.save).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if not compare(summary, baseline, args.max_accuracy_drop):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
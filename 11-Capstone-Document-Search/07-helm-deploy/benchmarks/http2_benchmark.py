@@ -0,0 +1,161 @@
+"""
+Compare the HTTP/1.1 and HTTP/2 LLM clients under high concurrency.
+
+``--concurrency`` threads send ``--requests`` chat completions calls
+through ``llm.call_llm``, once per transport, each in a fresh process so
+connection pools and descriptor counts start from zero. While the calls
+run, the process's open file descriptors (and the sockets among them) are
+sampled. The report shows throughput, p50/p95 latency, peak sockets, peak
+descriptors and errors per transport.
+
+Start the local stand-in once per protocol (``--http2`` needs the h2
+package, the HTTP/2 client needs httpx[http2]). ``--connect-latency``
+stands in for the TCP and TLS set-up of a remote endpoint:
+
+    python benchmarks/mock_llm_server.py --port 8000 --connect-latency 0.3 &
+    python benchmarks/mock_llm_server.py --port 8001 --connect-latency 0.3 --http2 &
+    python benchmarks/http2_benchmark.py --http1-url http://127.0.0.1:8000/v1 \\
+        --http2-url http://127.0.0.1:8001/v1 --concurrency 200 --requests 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+
+def open_descriptors():
+    """(descriptors, sockets) currently open in this process."""
+    sockets = 0
+    names = os.listdir("/proc/self/fd")
+    for name in names:
+        try:
+            if os.readlink(f"/proc/self/fd/{name}").startswith("socket:"):
+                sockets += 1
+        except OSError:
+            pass
+    return len(names), sockets
+
+
+def run_transport(args):
+    """Child process: run the calls and print one JSON result line."""
+    import llm
+    from prompt_cache_benchmark import load_texts
+
+    texts = [text for _, text in load_texts(args.pdf_dir)]
+    peaks = {"descriptors": 0, "sockets": 0}
+    failures = Counter()
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            descriptors, sockets = open_descriptors()
+            peaks["descriptors"] = max(peaks["descriptors"], descriptors)
+            peaks["sockets"] = max(peaks["sockets"], sockets)
+
+    def call(number):
+        started = time.perf_counter()
+        try:
+            llm.call_llm(llm.build_extraction_messages(texts[number % len(texts)]))
+        except Exception as exc:
+            failures[f"{type(exc).__name__}: {exc}"[:120]] += 1
+            return None
+        return time.perf_counter() - started
+
+    baseline, _ = open_descriptors()
+    threading.Thread(target=sample, daemon=True).start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    ok = sorted(latency for latency in latencies if latency is not None)
+    print(
+        json.dumps(
+            {
+                "throughput": len(ok) / elapsed,
+                "p50": statistics.median(ok) if ok else 0.0,
+                "p95": ok[int(0.95 * (len(ok) - 1))] if ok else 0.0,
+                "peak_sockets": peaks["sockets"],
+                "peak_descriptors": peaks["descriptors"] - baseline,
+                "errors": len(latencies) - len(ok),
+                "failures": dict(failures.most_common(3)),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/1.1 vs HTTP/2 LLM client benchmark")
+    parser.add_argument("--http1-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--http2-url", default="http://127.0.0.1:8001/v1")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    parser.add_argument("--transport", choices=["1.1", "2"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.transport:
+        run_transport(args)
+        return
+
+    print(f"{args.requests} calls, {args.concurrency} in flight\n")
+    header = (
+        f"{'transport':<9} {'calls/s':>8} {'p50 s':>7} {'p95 s':>7} "
+        f"{'sockets':>8} {'fds':>6} {'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for transport, url in (("1.1", args.http1_url), ("2", args.http2_url)):
+        env = {
+            **os.environ,
+            "LLM_API_ENDPOINT": url,
+            "LLM_API_KEY": os.getenv("LLM_API_KEY", "mock"),
+            "LLM_MODEL": os.getenv("LLM_MODEL", "mock"),
+            "LLM_HTTP_VERSION": transport,
+            "LLM_MAX_RETRIES": "0",
+            # The ledger's per-thread SQLite handles would swamp the count.
+            "LEDGER_PATH": "",
+        }
+        child = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--transport",
+                transport,
+                "--concurrency",
+                str(args.concurrency),
+                "--requests",
+                str(args.requests),
+                "--pdf-dir",
+                args.pdf_dir,
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        lines = child.stdout.strip().splitlines()
+        if child.returncode or not lines:
+            print(f"HTTP/{transport}: failed\n{child.stderr[-2000:]}")
+            continue
+        row = json.loads(lines[-1])
+        print(
+            f"{'HTTP/' + transport:<9} {row['throughput']:>8.1f} {row['p50']:>7.3f} "
+            f"{row['p95']:>7.3f} {row['peak_sockets']:>8} {row['peak_descriptors']:>6} "
+            f"{row['errors']:>6}"
+        )
+        for failure, count in row["failures"].items():
+            print(f"  {count} x {failure}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Good enough to exercise the app and the benchmarks without spending provider
+quota:
+
+- Replies with a JSON record built from "Label: value" lines in the document
+  (or a JSON array when the request packs several documents), with the
+  fields listed in the prompt's field schema.
+- Reports a ``usage`` block, including ``prompt_tokens_details.cached_tokens``
+  computed like a provider-side prefix cache: the longest prefix shared with
+  an earlier request, rounded down to whole cache blocks.
+- Sleeps in proportion to uncached prompt tokens and completion tokens, so
+  latency differences between prompt layouts are visible.
+- Keeps connections alive (HTTP/1.1) and answers ``GET /v1/models``, like
+  a provider, so connection reuse and warm-up can be measured.
+  ``--connect-latency`` delays every new connection, standing in for the
+  DNS, TCP and TLS set-up of a remote endpoint.
+- With ``--http2``, serves the same endpoint over cleartext HTTP/2 instead
+  (needs the ``h2`` package), for the HTTP/2 client mode.
+
+Run it and point the app at it:
+
+    python benchmarks/mock_llm_server.py --port 8000
+    LLM_API_ENDPOINT=http://localhost:8000/v1 LLM_API_KEY=mock LLM_MODEL=mock ...
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIELDS = [
+    "applicant_name",
+    "license_number",
+    "license_type",
+    "expiry_date",
+    "renewal_date",
+    "address",
+    "contact_number",
+    "email",
+    "payment_status",
+    "payment_amount",
+    "transaction_id",
+    "date_of_birth",
+    "previous_violations",
+    "additional_notes",
+]
+
+CACHE_BLOCK_TOKENS = 128
+BASE_LATENCY = 0.15
+CONNECT_LATENCY = 0.0
+SECONDS_PER_PROMPT_TOKEN = 0.0002
+SECONDS_PER_COMPLETION_TOKEN = 0.004
+HTTP2_WINDOW = 2**24
+
+_history = []
+_history_lock = threading.Lock()
+_DOCUMENT_RE = re.compile(
+    r"=== DOCUMENT (\d+) START ===\n(.*?)\n=== DOCUMENT \1 END ===", re.S
+)
+_SCHEMA_RE = re.compile(r"^(\{\n.*?\n\})$", re.S | re.M)
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+def cached_prefix_tokens(prompt):
+    """Tokens of ``prompt`` covered by the longest previously seen prefix."""
+    best = 0
+    with _history_lock:
+        for earlier in _history:
+            best = max(best, len(os.path.commonprefix([earlier, prompt])))
+        _history.append(prompt)
+        del _history[:-64]
+    return (count_tokens(prompt[:best]) // CACHE_BLOCK_TOKENS) * CACHE_BLOCK_TOKENS
+
+
+# Labels used by the sample forms that do not match a field name.
+ALIASES = {
+    "full_name": "applicant_name",
+    "type_of_license": "license_type",
+    "expiration_date": "expiry_date",
+    "current_expiry_date": "expiry_date",
+    "date_of_renewal_application": "renewal_date",
+    "residential_address": "address",
+    "phone_number": "contact_number",
+    "email_address": "email",
+    "amount_paid": "payment_amount",
+}
+
+
+def requested_fields(system):
+    """Field names of the JSON schema block in the instructions."""
+    match = _SCHEMA_RE.search(system)
+    try:
+        return list(json.loads(match.group(1)))
+    except (AttributeError, ValueError):
+        return FIELDS
+
+
+def record_from_text(text, fields=FIELDS):
+    """Pick "Label: value" lines (or a label line followed by its value)."""
+    record = {field: "N/A" for field in fields}
+    lines = text.splitlines()
+    for position, line in enumerate(lines):
+        label, sep, value = line.partition(":")
+        if not sep:
+            continue
+        if not value.strip() and position + 1 < len(lines) and ":" not in lines[position + 1]:
+            value = lines[position + 1]
+        if not value.strip():
+            continue
+        key = re.sub(r"[^a-z0-9]+", "_", label.strip().lower()).strip("_")
+        key = ALIASES.get(key, key)
+        if key in record and record[key] == "N/A":
+            record[key] = value.strip()
+    return record
+
+
+def build_reply(messages):
+    system = " ".join(m["content"] for m in messages if m.get("role") == "system")
+    user = "\n".join(m["content"] for m in messages if m.get("role") != "system")
+    fields = requested_fields(system)
+    if "document_index" in system or "document_index" in user:
+        records = []
+        for number, text in _DOCUMENT_RE.findall(user):
+            record = record_from_text(text, fields)
+            record["document_index"] = int(number)
+            records.append(record)
+        return json.dumps(records)
+    return json.dumps(record_from_text(user, fields))
+
+
+MODELS = {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+
+def complete(body):
+    """Chat completions reply for a request body, and how long to wait first."""
+    messages = body.get("messages") or []
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    prompt_tokens = count_tokens(prompt)
+    cached_tokens = cached_prefix_tokens(prompt)
+    content = build_reply(messages)
+    completion_tokens = count_tokens(content)
+    delay = (
+        BASE_LATENCY
+        + (prompt_tokens - cached_tokens) * SECONDS_PER_PROMPT_TOKEN
+        + completion_tokens * SECONDS_PER_COMPLETION_TOKEN
+    )
+    payload = {
+        "id": f"mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+    return payload, delay
+
+
+def route(method, path, raw_body):
+    """(status, payload, delay) for one request, whatever the transport."""
+    path = path.split("?", 1)[0].rstrip("/")
+    if method == "GET" and path.endswith("/models"):
+        return 200, MODELS, 0.0
+    if method == "POST" and path.endswith("/chat/completions"):
+        payload, delay = complete(json.loads(raw_body or b"{}"))
+        return 200, payload, delay
+    return 404, {"error": {"message": "Not found"}}, 0.0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        if CONNECT_LATENCY:
+            time.sleep(CONNECT_LATENCY)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        status, payload, delay = route(self.command, self.path, self.rfile.read(length))
+        time.sleep(delay)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    # Many clients connect at once in the concurrency benchmarks.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+async def serve_http2(host, port):
+    """The same endpoint over cleartext HTTP/2 (prior knowledge), via ``h2``."""
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+
+    async def respond(conn, writer, window_open, stream_id, request):
+        headers = request["headers"]
+        # Off the event loop, so one slow reply does not hold up the others.
+        status, payload, delay = await asyncio.get_running_loop().run_in_executor(
+            None, route, headers.get(":method"), headers.get(":path", ""), request["body"]
+        )
+        await asyncio.sleep(delay)
+        data = json.dumps(payload).encode()
+        try:
+            conn.send_headers(
+                stream_id,
+                [
+                    (":status", str(status)),
+                    ("content-type", "application/json"),
+                    ("content-length", str(len(data))),
+                ],
+            )
+            while data:
+                window = min(
+                    conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size
+                )
+                if window <= 0:
+                    writer.write(conn.data_to_send())
+                    window_open.clear()
+                    await window_open.wait()
+                    continue
+                conn.send_data(stream_id, data[:window])
+                data = data[window:]
+            conn.end_stream(stream_id)
+            writer.write(conn.data_to_send())
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError):
+            pass
+
+    async def handle(reader, writer):
+        if CONNECT_LATENCY:
+            await asyncio.sleep(CONNECT_LATENCY)
+        config = h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        conn = h2.connection.H2Connection(config=config)
+        # Large receive windows, like provider front ends advertise: with the
+        # 64 KiB default, concurrent request bodies queue up behind
+        # WINDOW_UPDATE frames.
+        conn.local_settings = h2.settings.Settings(
+            client=False,
+            initial_values={
+                h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 256,
+                h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: HTTP2_WINDOW,
+            },
+        )
+        conn.initiate_connection()
+        conn.increment_flow_control_window(HTTP2_WINDOW)
+        writer.write(conn.data_to_send())
+        window_open = asyncio.Event()
+        requests = {}
+        tasks = set()
+        try:
+            while True:
+                data = await reader.read(65535)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = {"headers": dict(event.headers), "body": b""}
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id]["body"] += event.data
+                        conn.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id
+                        )
+                    elif isinstance(event, h2.events.StreamEnded):
+                        request = requests.pop(event.stream_id)
+                        task = asyncio.create_task(
+                            respond(conn, writer, window_open, event.stream_id, request)
+                        )
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        window_open.set()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                writer.write(conn.data_to_send())
+        except (ConnectionError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, backlog=1024)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--connect-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--http2", action="store_true", help="serve cleartext HTTP/2 (needs the h2 package)"
+    )
+    args = parser.parse_args()
+    global CONNECT_LATENCY
+    CONNECT_LATENCY = args.connect_latency
+    if args.http2:
+        print(f"Mock LLM (HTTP/2) listening on http://{args.host}:{args.port}/v1")
+        asyncio.run(serve_http2(args.host, args.port))
+        return
+    server = Server((args.host, args.port), Handler)
+    print(f"Mock LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Local stand-in for a Redis server (in-memory, single process).
+
+Speaks enough of the Redis protocol (RESP) for the app's shared cache and
+job queue: PING, GET, SET (with EX/PX), APPEND, DEL, EXISTS, EXPIRE, TTL,
+FLUSHALL, LPUSH, RPUSH, RPOP, BRPOP, BLMOVE, LMOVE, LLEN, LINDEX, LRANGE,
+LREM, LPOS, ZADD (with NX/XX), ZREM, ZSCORE, ZRANGEBYSCORE, and
+transactions (WATCH, UNWATCH, MULTI, EXEC, DISCARD).
+
+    python benchmarks/mock_redis_server.py --port 6379
+    CACHE_BACKEND=redis CACHE_URL=redis://localhost:6379/0 ...
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+_data = {}
+_expires = {}
+_versions = {}  # key -> write count, for WATCH
+_lock = threading.RLock()
+
+# Commands that change a key, and which of their arguments are keys.
+WRITES = {
+    b"SET": slice(1, 2),
+    b"APPEND": slice(1, 2),
+    b"DEL": slice(1, None),
+    b"EXPIRE": slice(1, 2),
+    b"LPUSH": slice(1, 2),
+    b"RPUSH": slice(1, 2),
+    b"RPOP": slice(1, 2),
+    b"LMOVE": slice(1, 3),
+    b"LREM": slice(1, 2),
+    b"ZADD": slice(1, 2),
+    b"ZREM": slice(1, 2),
+}
+
+
+def _alive(key):
+    expires = _expires.get(key)
+    if expires is not None and expires <= time.time():
+        _data.pop(key, None)
+        _expires.pop(key, None)
+    return key in _data
+
+
+NIL_ARRAY = object()
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if value is NIL_ARRAY:
+        return b"*-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Exception):
+        return b"-ERR " + str(value).encode() + b"\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+def _touch(keys):
+    for key in keys:
+        _versions[key] = _versions.get(key, 0) + 1
+
+
+def execute(args):
+    command = args[0].upper()
+    if command == b"BRPOP":
+        return blocking_pop(args[1:-1], float(args[-1]))
+    if command == b"BLMOVE":
+        return blocking_move(args[1], args[2], args[3], args[4], float(args[5]))
+    with _lock:
+        _touch(args[WRITES[command]] if command in WRITES else [])
+        if command == b"PING":
+            return "PONG"
+        if command in (b"HELLO", b"CLIENT", b"SELECT"):
+            return "OK"
+        if command == b"GET":
+            return _data[args[1]] if _alive(args[1]) else None
+        if command == b"SET":
+            key, value = args[1], args[2]
+            _data[key] = value
+            _expires.pop(key, None)
+            options = [arg.upper() for arg in args[3:]]
+            for position, option in enumerate(options):
+                if option in (b"EX", b"PX"):
+                    amount = float(args[3 + position + 1])
+                    _expires[key] = time.time() + (amount if option == b"EX" else amount / 1000)
+            return "OK"
+        if command == b"APPEND":
+            value = (_data[args[1]] if _alive(args[1]) else b"") + args[2]
+            _data[args[1]] = value
+            return len(value)
+        if command == b"DEL":
+            removed = sum(1 for key in args[1:] if _alive(key))
+            for key in args[1:]:
+                _data.pop(key, None)
+                _expires.pop(key, None)
+            return removed
+        if command == b"EXISTS":
+            return sum(1 for key in args[1:] if _alive(key))
+        if command == b"EXPIRE":
+            if not _alive(args[1]):
+                return 0
+            _expires[args[1]] = time.time() + float(args[2])
+            return 1
+        if command == b"TTL":
+            if not _alive(args[1]):
+                return -2
+            expires = _expires.get(args[1])
+            return -1 if expires is None else int(expires - time.time())
+        if command == b"LPUSH":
+            items = _data.setdefault(args[1], [])
+            for value in args[2:]:
+                items.insert(0, value)
+            return len(items)
+        if command == b"RPUSH":
+            items = _data.setdefault(args[1], [])
+            items.extend(args[2:])
+            return len(items)
+        if command == b"RPOP":
+            items = _data.get(args[1])
+            return items.pop() if items else None
+        if command == b"LMOVE":
+            return _move(args[1], args[2], args[3], args[4])
+        if command == b"LRANGE":
+            items = _data.get(args[1]) or []
+            start, stop = int(args[2]), int(args[3])
+            return items[start:len(items) + stop + 1 if stop < 0 else stop + 1]
+        if command == b"LREM":
+            items = _data.get(args[1]) or []
+            count, removed = int(args[2]), 0
+            # Positive counts remove from the head, negative from the tail.
+            order = range(len(items)) if count >= 0 else range(len(items) - 1, -1, -1)
+            for index in [index for index in order if items[index] == args[3]]:
+                if count and removed == abs(count):
+                    break
+                removed += 1
+                items[index] = None
+            items[:] = [item for item in items if item is not None]
+            return removed
+        if command == b"LPOS":
+            items = _data.get(args[1]) or []
+            return items.index(args[2]) if args[2] in items else None
+        if command == b"LINDEX":
+            items = _data.get(args[1]) or []
+            index = int(args[2])
+            return items[index] if -len(items) <= index < len(items) else None
+        if command == b"LLEN":
+            return len(_data.get(args[1]) or [])
+        if command == b"ZADD":
+            scores = _data.setdefault(args[1], {})
+            flags = args[2].upper() if args[2].upper() in (b"NX", b"XX") else None
+            pairs = args[3:] if flags else args[2:]
+            added = 0
+            for score, member in zip(pairs[::2], pairs[1::2]):
+                if (flags == b"XX" and member not in scores) or (flags == b"NX" and member in scores):
+                    continue
+                added += member not in scores
+                scores[member] = float(score)
+            return added
+        if command == b"ZREM":
+            scores = _data.get(args[1]) or {}
+            return sum(1 for member in args[2:] if scores.pop(member, None) is not None)
+        if command == b"ZSCORE":
+            score = (_data.get(args[1]) or {}).get(args[2])
+            return None if score is None else repr(score).encode()
+        if command == b"ZRANGEBYSCORE":
+            scores = _data.get(args[1]) or {}
+            low, high = float(args[2]), float(args[3])
+            return [
+                member
+                for member, score in sorted(scores.items(), key=lambda item: item[1])
+                if low <= score <= high
+            ]
+        if command == b"FLUSHALL":
+            _touch(list(_data))
+            _data.clear()
+            _expires.clear()
+            return "OK"
+    return ValueError(f"unknown command '{command.decode()}'")
+
+
+def _move(source, destination, where_from, where_to):
+    items = _data.get(source)
+    if not items:
+        return None
+    item = items.pop(0 if where_from.upper() == b"LEFT" else -1)
+    target = _data.setdefault(destination, [])
+    target.insert(0 if where_to.upper() == b"LEFT" else len(target), item)
+    return item
+
+
+def blocking_pop(keys, timeout):
+    """BRPOP: poll the lists (without holding the lock) until ``timeout``."""
+    deadline = time.time() + (timeout or float("inf"))
+    while True:
+        with _lock:
+            for key in keys:
+                items = _data.get(key)
+                if items:
+                    _touch([key])
+                    return [key, items.pop()]
+        if time.time() >= deadline:
+            return None
+        time.sleep(0.05)
+
+
+def blocking_move(source, destination, where_from, where_to, timeout):
+    """BLMOVE: like ``blocking_pop``, moving the item onto ``destination``."""
+    deadline = time.time() + (timeout or float("inf"))
+    while True:
+        with _lock:
+            if _data.get(source):
+                _touch([source, destination])
+                return _move(source, destination, where_from, where_to)
+        if time.time() >= deadline:
+            return None
+        time.sleep(0.05)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def transaction(self, args):
+        """MULTI/EXEC state of this connection; None for other commands."""
+        command = args[0].upper()
+        if command == b"WATCH":
+            with _lock:
+                self.watched.update({key: _versions.get(key, 0) for key in args[1:]})
+            return "OK"
+        if command in (b"UNWATCH", b"DISCARD"):
+            self.watched, self.queued = {}, None
+            return "OK"
+        if command == b"MULTI":
+            self.queued = []
+            return "OK"
+        if command == b"EXEC":
+            if self.queued is None:
+                return ValueError("EXEC without MULTI")
+            queued, watched = self.queued, self.watched
+            self.watched, self.queued = {}, None
+            with _lock:
+                if any(_versions.get(key, 0) != seen for key, seen in watched.items()):
+                    return NIL_ARRAY  # a watched key changed: nothing runs
+                return [execute(queued_args) for queued_args in queued]
+        if self.queued is not None:
+            self.queued.append(args)
+            return "QUEUED"
+        return None
+
+    def handle(self):
+        self.watched, self.queued = {}, None
+        while True:
+            args = self.read_command()
+            if not args:
+                return
+            reply = self.transaction(args)
+            self.wfile.write(encode(execute(args) if reply is None else reply))
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    with Server((args.host, args.port), Handler) as server:
+        print(f"Mock Redis listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compare the old and new extraction prompt layouts.
+
+- legacy: one user message with the document in the middle of the
+  instructions (what the app used to send).
+- cached: static instructions in the system message, document last.
+
+Every sample document is sent ``--runs`` times per layout against whatever
+``LLM_API_ENDPOINT`` points at (a real provider, or the local stand-in in
+``mock_llm_server.py``). The report shows mean latency, prompt / cached /
+completion tokens and the estimated cost from the ``LLM_PRICE_*`` settings.
+
+    python benchmarks/prompt_cache_benchmark.py --runs 3
+"""
+import argparse
+import os
+import statistics
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+import llm  # noqa: E402
+import schemas  # noqa: E402
+
+
+def load_texts(pdf_dir):
+    import pdfplumber
+
+    texts = []
+    for path in sorted(Path(pdf_dir).glob("*.pdf")):
+        with pdfplumber.open(path) as pdf:
+            text = "\n".join(page.extract_text() or "" for page in pdf.pages)
+        if text.strip():
+            texts.append((path.name, text))
+    return texts
+
+
+def legacy_messages(text_content):
+    intro, rest = schemas.system_prompt().split("\n\n", 1)
+    return [
+        {
+            "role": "user",
+            "content": f"{intro}\n\nThe document content is:\n\n{text_content}\n\n{rest}",
+        }
+    ]
+
+
+def run_layout(name, build_messages, texts, runs):
+    latencies, totals = [], {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    cost = 0.0
+    for _ in range(runs):
+        for _, text in texts:
+            _, usage = llm.call_llm(build_messages(text))
+            latencies.append(usage["latency_seconds"])
+            for key in totals:
+                totals[key] += usage[key]
+            cost += usage["estimated_cost"]
+    calls = len(latencies)
+    return {
+        "layout": name,
+        "calls": calls,
+        "mean_latency_s": statistics.mean(latencies),
+        "p95_latency_s": sorted(latencies)[int(0.95 * (calls - 1))],
+        "prompt_tokens": totals["prompt_tokens"],
+        "cached_tokens": totals["cached_tokens"],
+        "cache_hit_pct": 100 * totals["cached_tokens"] / max(totals["prompt_tokens"], 1),
+        "completion_tokens": totals["completion_tokens"],
+        "estimated_cost": cost,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt layout benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("LLM_API_ENDPOINT"):
+        sys.exit("Set LLM_API_ENDPOINT (and LLM_API_KEY / LLM_MODEL) first.")
+
+    texts = load_texts(args.pdf_dir)
+    print(f"{len(texts)} documents x {args.runs} runs per layout\n")
+    rows = [
+        run_layout("legacy", legacy_messages, texts, args.runs),
+        run_layout("cached", llm.build_extraction_messages, texts, args.runs),
+    ]
+
+    header = (
+        f"{'layout':<8} {'calls':>5} {'mean s':>7} {'p95 s':>7} {'prompt':>8} "
+        f"{'cached':>8} {'hit %':>6} {'compl':>7} {'cost $':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['layout']:<8} {row['calls']:>5} {row['mean_latency_s']:>7.3f} "
+            f"{row['p95_latency_s']:>7.3f} {row['prompt_tokens']:>8} "
+            f"{row['cached_tokens']:>8} {row['cache_hit_pct']:>6.1f} "
+            f"{row['completion_tokens']:>7} {row['estimated_cost']:>9.5f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
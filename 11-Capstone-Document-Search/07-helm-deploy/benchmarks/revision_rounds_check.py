@@ -0,0 +1,114 @@
+"""
+Check that page-selection retry rounds are not taken for form revisions.
+
+A long upload whose required fields are missing from the first round is
+retried with more pages of the same document. The retry must not be
+matched against the first round's text as "a revision of a previously
+processed form" (which would send only the diff and could not find the
+missing field), and only the final record must be remembered. A real
+revision of the same form, submitted afterwards, must still be found.
+
+Runs the pipeline in-process against the mock LLM, with the in-process
+cache on and a small ``PAGE_TOKEN_BUDGET`` so the first round leaves out
+the page with the applicant name. Exits with status 1 on a failure.
+
+    python benchmarks/revision_rounds_check.py
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+# Read when the app modules are imported.
+os.environ["CACHE_BACKEND"] = "none"
+os.environ["CACHE_L1_ENTRIES"] = "256"
+os.environ["REVISION_TRACKING"] = "true"
+os.environ["PAGE_TOKEN_BUDGET"] = "100"
+os.environ["FIELD_REQUERY"] = "false"
+os.environ["TABLE_EXTRACTION"] = "false"
+
+import cache  # noqa: E402
+import golden_suite  # noqa: E402
+import mock_llm_server  # noqa: E402
+import pipeline  # noqa: E402
+import revisions  # noqa: E402
+
+NOTES = [
+    "Schedule A. Notes on completing this form.",
+    "Write clearly in block capitals using black ink.",
+    "Attach any supporting documents to the back of the form.",
+    "Incomplete forms are returned to the sender without processing.",
+]
+
+
+def render(record):
+    """Five pages: the form without the applicant name, notes, then the declaration."""
+    body = {field: value for field, value in record.items() if field != "applicant_name"}
+    pages = [["LICENSE RENEWAL APPLICATION FORM", ""] + golden_suite.form_lines(
+        body, golden_suite.LABELS["renewal"]
+    )]
+    pages += [NOTES for _ in range(3)]
+    pages.append(["DECLARATION", "Full Name:", record["applicant_name"], "Signed in person."])
+    return pages
+
+
+def run(path):
+    with open(path, "rb") as handle:
+        return pipeline.process_documents([(path.name, handle, path.stat().st_size)])[0]
+
+
+def main():
+    os.environ.setdefault("LLM_API_KEY", "mock")
+    os.environ.setdefault("LLM_MODEL", "mock")
+    os.environ["LLM_API_ENDPOINT"] = golden_suite.serve(
+        lambda method, path, headers, body: mock_llm_server.route(method, path, body)
+    )
+    golden = json.loads(golden_suite.GOLDEN_FILE.read_text(encoding="utf-8"))
+    record = dict(golden["synthetic"]["records"][0])
+    revised = {**record, "contact_number": "+1-503-555-0000"}
+    failures = []
+    with tempfile.TemporaryDirectory() as scratch:
+        first_path = Path(scratch) / "first.pdf"
+        golden_suite.write_pdf(first_path, render(record))
+        first = run(first_path)
+        rounds = first["pages"]["rounds"] if first.get("pages") else 0
+        print(f"first upload: {rounds} rounds, revision: {first.get('revision')}")
+        if rounds < 2:
+            failures.append("the first upload needed no retry round, so nothing was checked")
+        if "revision" in first:
+            failures.append("a retry round was taken for a revision of the first round")
+        for field in ("applicant_name", "license_number"):
+            if not golden_suite.matches(field, record[field], (first["record"] or {}).get(field)):
+                failures.append(f"first upload: wrong {field}")
+
+        stored = cache.get_json(revisions.identity_keys(record=record)[0]) or {}
+        if record["applicant_name"] not in stored.get("text", ""):
+            failures.append("the first upload was not remembered with its final round's text")
+
+        second_path = Path(scratch) / "revised.pdf"
+        golden_suite.write_pdf(second_path, render(revised))
+        second = run(second_path)
+        revision = second.get("revision") or {}
+        changed = [change["field"] for change in revision.get("changes", [])]
+        print(f"revised upload: {second['pages']['rounds']} rounds, changed fields: {changed}")
+        if not revision:
+            failures.append("the revised upload was not matched with the first one")
+        elif changed != ["contact_number"]:
+            failures.append(f"revised upload: expected only contact_number to change, got {changed}")
+        for field in ("applicant_name", "contact_number"):
+            if not golden_suite.matches(field, revised[field], (second["record"] or {}).get(field)):
+                failures.append(f"revised upload: wrong {field}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare reply size and latency across field schemas.
+
+Every sample document is extracted ``--runs`` times with each schema in
+``--schemas`` against whatever ``LLM_API_ENDPOINT`` points at (a real
+provider, or the local stand-in in ``mock_llm_server.py``). Caches are
+bypassed, so every run is a real LLM call. The report shows mean and p95
+latency, prompt and completion tokens, and the estimated cost from the
+``LLM_PRICE_*`` settings.
+
+    python benchmarks/schema_benchmark.py --runs 3
+    python benchmarks/schema_benchmark.py --schemas renewal-full,renewal-minimal
+"""
+import argparse
+import os
+import statistics
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "app"))
+
+import llm  # noqa: E402
+import schemas  # noqa: E402
+from prompt_cache_benchmark import load_texts  # noqa: E402
+
+
+def run_schema(name, texts, runs):
+    latencies = []
+    totals = {"prompt_tokens": 0, "completion_tokens": 0}
+    cost = 0.0
+    fields = 0
+    with schemas.use(name):
+        for _ in range(runs):
+            for _, text in texts:
+                record, usage = llm.extract_fields(text)
+                latencies.append(usage["latency_seconds"])
+                for key in totals:
+                    totals[key] += usage[key]
+                cost += usage["estimated_cost"]
+                fields += len(record)
+    calls = len(latencies)
+    return {
+        "schema": name,
+        "calls": calls,
+        "fields": fields / calls,
+        "mean_latency_s": statistics.mean(latencies),
+        "p95_latency_s": sorted(latencies)[int(0.95 * (calls - 1))],
+        "prompt_tokens": totals["prompt_tokens"] / calls,
+        "completion_tokens": totals["completion_tokens"] / calls,
+        "estimated_cost": cost,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Field schema benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--schemas", default=",".join(schemas.names()))
+    parser.add_argument("--pdf-dir", default=str(HERE.parent / "sample-documents"))
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("LLM_API_ENDPOINT"):
+        sys.exit("Set LLM_API_ENDPOINT (and LLM_API_KEY / LLM_MODEL) first.")
+
+    texts = load_texts(args.pdf_dir)
+    names = [name.strip() for name in args.schemas.split(",") if name.strip()]
+    print(f"{len(texts)} documents x {args.runs} runs per schema\n")
+    rows = [run_schema(name, texts, args.runs) for name in names]
+
+    header = (
+        f"{'schema':<18} {'calls':>5} {'fields':>6} {'mean s':>7} {'p95 s':>7} "
+        f"{'prompt':>7} {'compl':>6} {'cost $':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['schema']:<18} {row['calls']:>5} {row['fields']:>6.1f} "
+            f"{row['mean_latency_s']:>7.3f} {row['p95_latency_s']:>7.3f} "
+            f"{row['prompt_tokens']:>7.0f} {row['completion_tokens']:>6.0f} "
+            f"{row['estimated_cost']:>9.5f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
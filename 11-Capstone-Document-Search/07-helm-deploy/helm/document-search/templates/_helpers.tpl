@@ -28,3 +28,19 @@ Common labels
 app.kubernetes.io/name: {{ include "document-search.name" . }}
 app.kubernetes.io/instance: {{ .Release.Name }}
 {{- end }}
+
+{{/*
+Worker labels (a separate name so the Service never routes to workers)
+*/}}
+{{- define "document-search.workerLabels" -}}
+app.kubernetes.io/name: {{ include "document-search.name" . }}-worker
+app.kubernetes.io/instance: {{ .Release.Name }}
+{{- end }}
+
+{{/*
+API labels (its own Service; the UI Service never routes to it)
+*/}}
+{{- define "document-search.apiLabels" -}}
+app.kubernetes.io/name: {{ include "document-search.name" . }}-api
+app.kubernetes.io/instance: {{ .Release.Name }}
+{{- end }}